@@ -4,3 +4,18 @@
 
 def test_import_carbonplan_styles():
     pass
+
+
+# The prefect flows run in this image, and need shapely 2 and geopandas 1.0 APIs
+def test_flow_dependencies():
+    import geopandas
+    import prefect
+    import shapely
+
+    assert int(shapely.__version__.split('.')[0]) >= 2
+    assert int(geopandas.__version__.split('.')[0]) >= 1
+    assert int(prefect.__version__.split('.')[0]) < 2
+
+
+def test_import_package():
+    import carbonplan_forest_offsets_fires.prefect.workflows.download_nifc_perimeters  # noqa
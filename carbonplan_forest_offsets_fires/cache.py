@@ -0,0 +1,149 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+import fsspec
+import geopandas
+
+CACHE_DIR = os.environ.get(
+    'FOREST_OFFSETS_FIRES_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'carbonplan-forest-offsets-fires'),
+)
+CACHE_MAX_BYTES = int(os.environ.get('FOREST_OFFSETS_FIRES_CACHE_MAX_BYTES', 1024**3))
+OFFLINE = os.environ.get('FOREST_OFFSETS_FIRES_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
+
+def _sha256(s: str) -> str:
+    return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+
+def cached_copy(path: str, kind: str, cache_dir: str = CACHE_DIR) -> str:
+    """Download a remote file into the local cache (keyed by ETag) and return its path
+
+    Local paths are returned as is. Raises FileNotFoundError if `path` doesn't exist.
+    """
+    fs, _, (rpath,) = fsspec.get_fs_token_paths(path)
+    if 'file' in fs.protocol:
+        if not os.path.exists(rpath):
+            raise FileNotFoundError(rpath)
+        return rpath
+    etag = fs.info(rpath).get('ETag', '')
+    local = Path(cache_dir) / kind / f'{_sha256(f"{rpath}:{etag}")}{Path(rpath).suffix}'
+    if not local.exists():
+        local.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=local.parent, suffix='.tmp')
+        os.close(fd)
+        fs.get(rpath, tmp)
+        os.replace(tmp, local)
+    return str(local)
+
+
+class GeometryCache:
+    """Cache interface for cleaned, reprojected project geometries
+
+    The base class caches nothing; subclass it, override `get` and `put` and set
+    `enabled` to plug in another storage backend.
+    """
+
+    # whether `get` can ever hit; if not, callers skip looking up ETags
+    enabled = False
+    offline = False
+
+    def __init__(self):
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, path: str, etag: str = None):
+        """Return the cached GeoDataFrame for `path` at `etag`, or None"""
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, path: str, etag: str, gdf: geopandas.GeoDataFrame):
+        pass
+
+
+class LocalGeometryCache(GeometryCache):
+    """Content-addressed on-disk cache of project geometries
+
+    Entries are keyed by s3 path plus ETag and stored as GeoParquet, so a geometry is
+    only re-downloaded when the object on s3 changes. The cache is bounded to `max_bytes`
+    by evicting least recently used entries. In `offline` mode, ETags aren't checked and
+    the most recently used entry for a path is returned.
+
+    Arguments:
+        cache_dir {str} -- root cache directory
+        max_bytes {int} -- maximum total size of cached geometries
+        offline {bool} -- never touch s3, only serve what's already cached
+    """
+
+    enabled = True
+
+    def __init__(
+        self, cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES, offline: bool = OFFLINE
+    ):
+        super().__init__()
+        self.root = Path(cache_dir) / 'geometries'
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.offline = offline
+
+    def _entry(self, path: str, etag: str) -> Path:
+        return self.root / f'{_sha256(path)}-{_sha256(etag)}.parquet'
+
+    def _find(self, path: str, etag: str = None):
+        if etag is not None and not self.offline:
+            entry = self._entry(path, etag)
+            return entry if entry.exists() else None
+        entries = sorted(self.root.glob(f'{_sha256(path)}-*.parquet'), key=os.path.getmtime)
+        return entries[-1] if entries else None
+
+    def get(self, path: str, etag: str = None):
+        entry = self._find(path, etag)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        try:
+            gdf = geopandas.read_parquet(entry)
+        except FileNotFoundError:  # evicted by another process
+            self.stats['misses'] += 1
+            return None
+        os.utime(entry)  # mark as recently used
+        self.stats['hits'] += 1
+        return gdf
+
+    def put(self, path: str, etag: str, gdf: geopandas.GeoDataFrame):
+        entry = self._entry(path, etag)
+        # write then rename, so concurrent readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        os.close(fd)
+        gdf.to_parquet(tmp)
+        os.replace(tmp, entry)
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in `max_bytes`"""
+        entries = [(p.stat().st_mtime, p.stat().st_size, p) for p in self.root.glob('*.parquet')]
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+            self.stats['evictions'] += 1
+
+
+_geometry_cache = None
+
+
+def get_geometry_cache() -> GeometryCache:
+    """Return the process-wide geometry cache, creating a `LocalGeometryCache` on first use"""
+    global _geometry_cache
+    if _geometry_cache is None:
+        _geometry_cache = LocalGeometryCache()
+    return _geometry_cache
+
+
+def set_geometry_cache(cache: GeometryCache):
+    """Replace the process-wide geometry cache, e.g. with `GeometryCache()` to disable caching"""
+    global _geometry_cache
+    _geometry_cache = cache
@@ -0,0 +1,227 @@
+import datetime
+import json
+import os
+import tempfile
+
+import fsspec
+import geopandas
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import shapely
+
+from carbonplan_forest_offsets_fires import utils
+from carbonplan_forest_offsets_fires.cache import cached_copy
+from carbonplan_forest_offsets_fires.simplify import (
+    DEFAULT_PERCENTAGE,
+    PERCENTAGE_OVERRIDES,
+    simplify_geometries,
+)
+
+FORMAT_VERSION = 1
+GEOM_PATH = 's3://carbonplan-forest-offsets/carb-geometries'
+PROJECTS_PATH = f'{GEOM_PATH}/projects.v{FORMAT_VERSION}.parquet'
+CRS = 'epsg:5070'
+# geometry column -> percentage of removable vertices kept, see `simplify.simplify_percentage`
+LEVELS = {'geometry': 100, 'simplified': DEFAULT_PERCENTAGE, 'overview': 10}
+ROW_GROUP_SIZE = 64
+METADATA_KEY = b'carbonplan_forest_offsets_fires'
+
+
+def _repair(geoms: geopandas.GeoSeries) -> geopandas.GeoSeries:
+    """Clean up geometries exactly like `utils.load_project_geometry` always has"""
+    return geoms.buffer(0)
+
+
+def prepare_project_geometries(
+    raw: geopandas.GeoDataFrame, overrides: dict = None
+) -> geopandas.GeoDataFrame:
+    """Validate, reproject, simplify and spatially sort raw project geometries
+
+    Every level in `LEVELS` is simplified from the raw geometries, reprojected to
+    epsg:5070 and repaired. Project overrides are capped at each level's percentage, so
+    ACR361 stays at 5% in `overview` too. Rows are ordered along a Hilbert curve through
+    project bounding boxes, keeping each project's features together and in their
+    original order.
+
+    Arguments:
+        raw {geopandas.GeoDataFrame} -- one row per feature, with an `opr_id` column, in
+            epsg:4326, as returned by `utils.load_raw_geometries`
+        overrides {dict} -- opr_id -> percentage, replacing `simplify.PERCENTAGE_OVERRIDES`
+
+    Returns:
+        geopandas.GeoDataFrame -- `opr_id`, `part`, `area`, `repaired` and one geometry
+            column per level, in epsg:5070
+    """
+    overrides = PERCENTAGE_OVERRIDES if overrides is None else overrides
+    raw = raw[raw.geometry.notna() & ~raw.geometry.is_empty].reset_index(drop=True)
+
+    full = raw.geometry.to_crs(CRS)
+    gdf = geopandas.GeoDataFrame(
+        {
+            'opr_id': raw['opr_id'].astype(str),
+            'part': raw.groupby('opr_id').cumcount().astype(np.int16),
+            'repaired': ~full.is_valid.to_numpy(),
+        },
+        geometry=_repair(full),
+        crs=CRS,
+    )
+    for level, percentage in LEVELS.items():
+        if level == 'geometry':
+            continue
+        simplified = simplify_geometries(
+            raw,
+            overrides={k: min(v, percentage) for k, v in overrides.items()},
+            default=percentage,
+        )
+        gdf[level] = _repair(simplified.geometry)
+
+    dropped = gdf.geometry.is_empty.to_numpy()
+    print(
+        f'Prepared {len(gdf)} features of {gdf["opr_id"].nunique()} projects, '
+        f'{gdf["repaired"].sum()} repaired, {dropped.sum()} empty after repair dropped'
+    )
+    gdf = gdf[~dropped]
+    for level in LEVELS:
+        invalid = ~gdf[level].is_valid
+        if invalid.any():
+            raise ValueError(f'{invalid.sum()} invalid {level} geometries after repair')
+    gdf['area'] = gdf.area
+
+    project_bounds = gdf.geometry.bounds.groupby(gdf['opr_id']).agg(
+        {'minx': 'min', 'miny': 'min', 'maxx': 'max', 'maxy': 'max'}
+    )
+    boxes = geopandas.GeoSeries(shapely.box(*project_bounds.to_numpy().T), crs=CRS)
+    distance = pd.Series(boxes.hilbert_distance().to_numpy(), index=project_bounds.index)
+    order = np.lexsort(
+        (gdf['part'], gdf['opr_id'].to_numpy(dtype=str), distance[gdf['opr_id']].to_numpy())
+    )
+    columns = ['opr_id', 'part', 'area', 'repaired', *LEVELS]
+    return gdf.iloc[order][columns].reset_index(drop=True)
+
+
+def write_project_geometries(gdf: geopandas.GeoDataFrame, path: str):
+    """Write prepared project geometries as GeoParquet, with a bbox covering column
+
+    Row groups are small, so that readers filtering on `opr_id` or on the bbox columns
+    skip most of the file.
+    """
+    metadata = {
+        'format_version': FORMAT_VERSION,
+        'levels': LEVELS,
+        'built_at': datetime.datetime.utcnow().isoformat(),
+        'projects': int(gdf['opr_id'].nunique()),
+    }
+    fs, _, (rpath,) = fsspec.get_fs_token_paths(path)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmp = os.path.join(tmpdir, 'projects.parquet')
+        gdf.to_parquet(tmp, write_covering_bbox=True, row_group_size=ROW_GROUP_SIZE)
+        table = pq.read_table(tmp)
+        table = table.replace_schema_metadata(
+            {**table.schema.metadata, METADATA_KEY: json.dumps(metadata)}
+        )
+        local = os.path.join(tmpdir, os.path.basename(rpath))
+        pq.write_table(table, local, row_group_size=ROW_GROUP_SIZE)
+        fs.put(local, rpath)
+
+
+def build_project_geometries(opr_ids: list = None, dst: str = PROJECTS_PATH) -> str:
+    """Build the canonical project geometry artifact from the raw CARB geometries
+
+    Returns:
+        str -- path of the written artifact
+    """
+    opr_ids = utils.list_all_opr_ids() if opr_ids is None else opr_ids
+    write_project_geometries(prepare_project_geometries(utils.load_raw_geometries(opr_ids)), dst)
+    return dst
+
+
+def _read_metadata(local: str, path: str) -> dict:
+    metadata = json.loads(pq.read_schema(local).metadata[METADATA_KEY])
+    if metadata['format_version'] != FORMAT_VERSION:
+        raise ValueError(
+            f'{path} has format version {metadata["format_version"]}, expected {FORMAT_VERSION}'
+        )
+    return metadata
+
+
+def artifact_identity(path: str = PROJECTS_PATH) -> dict:
+    """Which build of the canonical artifact project geometries are read from
+
+    Results derived from project geometries, like the project-stats state, key on this so
+    that they're recomputed when the artifact is rebuilt.
+
+    Returns:
+        dict -- `path`, `format_version`, `levels` and `built_at` of the artifact, or
+            `{'path': None}` if it hasn't been published and `load_project_geometries`
+            falls back to the per-project simplified files
+    """
+    try:
+        local = cached_copy(path, 'projects')
+    except FileNotFoundError:
+        return {'path': None}
+    metadata = _read_metadata(local, path)
+    return {'path': path, **{k: metadata[k] for k in ('format_version', 'levels', 'built_at')}}
+
+
+def read_project_geometries(
+    opr_ids: list = None,
+    level: str = 'simplified',
+    bbox: tuple = None,
+    columns: tuple = ('opr_id',),
+    path: str = PROJECTS_PATH,
+) -> geopandas.GeoDataFrame:
+    """Read only the projects, columns and simplification level needed
+
+    The artifact is downloaded once per version into the local cache; `opr_ids` and
+    `bbox` filters are then pushed down to parquet row groups.
+
+    Arguments:
+        opr_ids {list} -- projects to read, all if None
+        level {str} -- geometry column to read, one of `LEVELS`
+        bbox {tuple} -- (xmin, ymin, xmax, ymax) in epsg:5070; only read intersecting rows
+        columns {tuple} -- attribute columns to read alongside the geometry
+        path {str} -- artifact location
+
+    Returns:
+        geopandas.GeoDataFrame -- one row per feature, grouped by project in `opr_ids`
+            order (Hilbert order if reading all), with the level as `geometry`
+    """
+    if level not in LEVELS:
+        raise ValueError(f'Unknown level {level!r}, expected one of {list(LEVELS)}')
+    if opr_ids is not None and len(opr_ids) == 0:
+        return geopandas.GeoDataFrame({column: [] for column in columns}, geometry=[], crs=CRS)
+
+    local = cached_copy(path, 'projects')
+    _read_metadata(local, path)
+
+    opr_ids = None if opr_ids is None else list(dict.fromkeys(opr_ids))
+    gdf = geopandas.read_parquet(
+        local,
+        columns=list(dict.fromkeys(['opr_id', *columns, level])),
+        bbox=bbox,
+        filters=None if opr_ids is None else [('opr_id', 'in', opr_ids)],
+    )
+    gdf = gdf.set_geometry(level).rename_geometry('geometry') if level != 'geometry' else gdf
+    if opr_ids is not None:
+        position = pd.Series(range(len(opr_ids)), index=opr_ids)
+        gdf = gdf.iloc[np.argsort(position[gdf['opr_id']].to_numpy(), kind='stable')]
+    return gdf[[*columns, 'geometry']].reset_index(drop=True)
+
+
+def load_project_geometries(opr_ids: list, level: str = 'simplified') -> geopandas.GeoDataFrame:
+    """Cleaned project geometries from the canonical artifact
+
+    Falls back to `utils.load_project_geometries`, which cleans up the per-project
+    simplified files, if the artifact hasn't been published yet.
+
+    Returns:
+        geopandas.GeoDataFrame -- one row per feature, with an `opr_id` column, in epsg:5070
+    """
+    try:
+        return read_project_geometries(opr_ids, level=level)
+    except FileNotFoundError:
+        if level != 'simplified':
+            raise
+        print(f'{PROJECTS_PATH} not found, loading simplified geometries per project')
+        return utils.load_project_geometries(list(opr_ids))
@@ -0,0 +1,246 @@
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+
+import fsspec
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from prefect.utilities.logging import get_logger
+
+from carbonplan_forest_offsets_fires.cache import cached_copy
+
+logger = get_logger('nifc')
+
+# outside of the snapshot prefix, so globbing snapshots never picks it up
+CATALOG_PATH = 's3://carbonplan-forest-offsets/fires/nifc-catalog/snapshots.v1.parquet'
+CATALOG_SCHEMA = pa.schema(
+    [
+        ('timestamp', pa.timestamp('us')),
+        ('path', pa.string()),
+        ('record_count', pa.int64()),
+        ('xmin', pa.float64()),
+        ('ymin', pa.float64()),
+        ('xmax', pa.float64()),
+        ('ymax', pa.float64()),
+        ('schema_version', pa.string()),
+        ('content_hash', pa.string()),
+    ]
+)
+
+
+def snapshot_timestamp(path: str) -> datetime.datetime:
+    """Parse the upload time out of a `{isoformat}_raw_nifc_perimeters.parquet` name"""
+    return datetime.datetime.fromisoformat(os.path.basename(path).split('_', 1)[0])
+
+
+def schema_version(schema: pa.Schema) -> str:
+    """Short fingerprint of the column names and types of a snapshot"""
+    fields = [(field.name, str(field.type)) for field in schema]
+    return hashlib.sha256(json.dumps(fields).encode()).hexdigest()[:12]
+
+
+def describe_snapshot(local_path: str, path: str, timestamp: datetime.datetime = None) -> dict:
+    """Catalog entry of a snapshot, computed from a local copy of the file
+
+    Arguments:
+        local_path {str} -- local copy of the snapshot
+        path {str} -- where the snapshot is (or will be) stored, e.g. `s3://...`
+        timestamp {datetime.datetime} -- upload time, parsed from `path` by default
+
+    Returns:
+        dict -- one catalog row
+    """
+    sha256 = hashlib.sha256()
+    with open(local_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(block)
+    table = pq.read_table(local_path, columns=['geometry'])
+    xmin, ymin, xmax, ymax = shapely.total_bounds(
+        shapely.from_wkb(table['geometry'].to_numpy(zero_copy_only=False))
+    )
+    return {
+        'timestamp': timestamp or snapshot_timestamp(path),
+        'path': path,
+        'record_count': table.num_rows,
+        'xmin': xmin,
+        'ymin': ymin,
+        'xmax': xmax,
+        'ymax': ymax,
+        'schema_version': schema_version(pq.read_schema(local_path)),
+        'content_hash': sha256.hexdigest(),
+    }
+
+
+class SnapshotCatalog:
+    """Time-sorted catalog of NIFC perimeter snapshots
+
+    Lookups binary search the sorted timestamps, so they don't depend on how many
+    snapshots have accumulated.
+    """
+
+    def __init__(self, entries: pd.DataFrame):
+        self.entries = entries.sort_values('timestamp', kind='stable', ignore_index=True)
+        self._timestamps = self.entries['timestamp'].to_numpy(dtype='datetime64[us]')
+
+    @classmethod
+    def empty(cls) -> 'SnapshotCatalog':
+        return cls(CATALOG_SCHEMA.empty_table().to_pandas())
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _index(self, when, side: str) -> int:
+        return int(np.searchsorted(self._timestamps, np.datetime64(when, 'us'), side=side))
+
+    def latest(self, before: datetime.datetime = None):
+        """Most recent snapshot, or the most recent one at or before `before`; or None"""
+        i = len(self) if before is None else self._index(before, 'right')
+        return self.entries.iloc[i - 1].to_dict() if i > 0 else None
+
+    def on_date(self, date: datetime.date):
+        """Latest snapshot taken on `date` (UTC), or None"""
+        day = datetime.datetime(date.year, date.month, date.day)
+        entry = self.latest(before=day + datetime.timedelta(days=1) - datetime.timedelta.resolution)
+        return entry if entry is not None and entry['timestamp'] >= day else None
+
+    def between(self, start: datetime.datetime, end: datetime.datetime) -> pd.DataFrame:
+        """All snapshots taken from `start` to `end`, inclusive"""
+        return self.entries.iloc[self._index(start, 'left') : self._index(end, 'right')]
+
+    def daily(self, start: datetime.date, end: datetime.date) -> list:
+        """Latest snapshot of each day from `start` to `end`, inclusive
+
+        Returns:
+            list -- (date, path) tuples in date order, skipping days without a snapshot
+        """
+        start = datetime.datetime(start.year, start.month, start.day)
+        end = datetime.datetime(end.year, end.month, end.day) + datetime.timedelta(days=1)
+        entries = self.between(start, end - datetime.timedelta.resolution)
+        days = entries['timestamp'].dt.normalize()
+        last = entries.groupby(days)['path'].last()
+        return [(day.to_pydatetime(), path) for day, path in last.items()]
+
+    def append(self, entry: dict) -> 'SnapshotCatalog':
+        if entry['path'] in set(self.entries['path']):
+            return self
+        return SnapshotCatalog(pd.concat([self.entries, pd.DataFrame([entry])], ignore_index=True))
+
+    def save(self, path: str = CATALOG_PATH):
+        """Replace the catalog at `path` with this one, in a single write
+
+        S3 PUTs are atomic, so readers see either the old or the new catalog. Concurrent
+        writers aren't coordinated; the last one wins, so only `save_nifc_perimeters`
+        (one run at a time) should write.
+        """
+        table = pa.Table.from_pandas(self.entries, schema=CATALOG_SCHEMA, preserve_index=False)
+        fs, _, (rpath,) = fsspec.get_fs_token_paths(path)
+        local = 'file' in fs.protocol
+        tmpdir = os.path.dirname(rpath) if local else None
+        if local:
+            os.makedirs(tmpdir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=tmpdir, suffix='.parquet')
+        os.close(fd)
+        try:
+            pq.write_table(table, tmp)
+            if local:
+                os.replace(tmp, rpath)
+            else:
+                fs.put(tmp, rpath)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+def load_catalog(path: str = CATALOG_PATH) -> SnapshotCatalog:
+    """Read the snapshot catalog, downloading it only when it changed
+
+    Raises FileNotFoundError if no catalog has been written yet.
+    """
+    return SnapshotCatalog(pq.read_table(cached_copy(path, 'nifc-catalog')).to_pandas())
+
+
+def append_snapshot(entry: dict, path: str = CATALOG_PATH) -> SnapshotCatalog:
+    """Add a snapshot to the catalog at `path`, creating it if needed"""
+    fs, _, (rpath,) = fsspec.get_fs_token_paths(path)
+    if fs.exists(rpath):
+        with fs.open(rpath) as f:
+            catalog = SnapshotCatalog(pq.read_table(f).to_pandas())
+    else:
+        catalog = SnapshotCatalog.empty()
+    catalog = catalog.append(entry)
+    catalog.save(path)
+    return catalog
+
+
+def uncatalogued_snapshots(
+    catalog: SnapshotCatalog, bucket: str, until: datetime.date = None, fs=None
+) -> list:
+    """Snapshots under `bucket` newer than the latest one in `catalog`
+
+    A snapshot that was uploaded but never catalogued (e.g. `append_snapshot` failed) is
+    invisible to catalog lookups, so `latest()` would go stale. Only keys starting with
+    the dates from the latest catalogued snapshot through `until` are listed, which is
+    one or two small listings while the catalog is current.
+
+    Arguments:
+        catalog {SnapshotCatalog} -- catalog of `bucket`, with at least one snapshot
+        bucket {str} -- where snapshots are uploaded
+        until {datetime.date} -- last date to look for snapshots on, today (UTC) by default
+        fs {fsspec.AbstractFileSystem} -- S3 filesystem, supporting `find(..., prefix=)`
+
+    Returns:
+        list -- s3 paths of the uncatalogued snapshots, oldest first
+    """
+    fs = fs or fsspec.filesystem('s3', anon=False)
+    latest = catalog.latest()
+    until = until or datetime.datetime.utcnow().date()
+    known = set(catalog.entries['path'])
+    bucket = bucket.removeprefix('s3://')
+    day = latest['timestamp'].date()
+    fns = []
+    while day <= until:
+        fns += fs.find(bucket, prefix=f'{day:%Y-%m-%d}')
+        day += datetime.timedelta(days=1)
+
+    newer = []
+    for fn in sorted(fns):
+        try:
+            timestamp = snapshot_timestamp(fn)
+        except ValueError:
+            continue
+        path = f's3://{fn}'
+        if timestamp > latest['timestamp'] and path not in known:
+            newer.append(path)
+    if newer:
+        logger.warning(
+            f'{len(newer)} snapshots are missing from the catalog, the newest is {newer[-1]}; '
+            'run scripts/rebuild_nifc_catalog.py to catalog them'
+        )
+    return newer
+
+
+def rebuild_catalog(bucket: str, path: str = CATALOG_PATH) -> SnapshotCatalog:
+    """Catalog every snapshot under `bucket` from scratch, e.g. to bootstrap the catalog
+
+    This lists the bucket and downloads every snapshot once, which is what the catalog
+    saves all other readers from doing.
+    """
+    fs = fsspec.filesystem('s3', anon=False)
+    entries = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for fn in sorted(fs.glob(f'{bucket.removeprefix("s3://")}/*')):
+            try:
+                timestamp = snapshot_timestamp(fn)
+            except ValueError:
+                continue
+            local = os.path.join(tmpdir, 'snapshot.parquet')
+            fs.get(fn, local)
+            entries.append(describe_snapshot(local, f's3://{fn}', timestamp))
+    catalog = SnapshotCatalog(pd.DataFrame(entries, columns=CATALOG_SCHEMA.names))
+    catalog.save(path)
+    return catalog
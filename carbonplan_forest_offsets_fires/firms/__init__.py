@@ -1,8 +1,18 @@
-from .io import read_firms_nrt, read_viirs_historical, filter_df, mask_df, upload_tiles  # noqa
+from .io import (  # noqa
+    read_firms_nrt,
+    read_firms_nrt_sources,
+    normalize_confidence,
+    read_viirs_historical,
+    filter_df,
+    load_us_mask,
+    mask_df,
+    upload_tiles,
+)
 from .vectorize import (  # noqa
     get_firms_json,
     write_firms_json,
+    write_firms_tiles,
     make_tile_tempdir,
-    build_pbf_cmd,
     build_tippecanoe_cmd,
 )
+from .dedup import dedup_detections  # noqa
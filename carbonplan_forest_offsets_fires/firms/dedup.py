@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+from carbonplan_forest_offsets_fires.firms.io import CONFIDENCE_CATEGORIES
+
+CELL_SIZE = 0.00375  # degrees, roughly one 375m VIIRS pixel
+TIME_WINDOW = pd.Timedelta('30min')
+
+
+def get_acquired_at(df: pd.DataFrame) -> np.ndarray:
+    """Combine `acq_date` and HHMM `acq_time` into datetime64[s]"""
+    acq_time = df['acq_time'].to_numpy().astype(np.int64)
+    seconds = (acq_time // 100) * 3600 + (acq_time % 100) * 60
+    return df['acq_date'].to_numpy().astype('datetime64[s]') + seconds.astype('timedelta64[s]')
+
+
+def dedup_detections(
+    df: pd.DataFrame,
+    cell_size: float = CELL_SIZE,
+    time_window: pd.Timedelta = TIME_WINDOW,
+    sensor_column: str = 'source',
+) -> pd.DataFrame:
+    """Merge co-located detections of the same fire reported by several sensors
+
+    Detections are grouped by a hash of their grid cell (`cell_size` degrees) and their
+    acquisition time window, and each group is reduced with NumPy group-by operations,
+    so there are no pairwise distance checks. Detections that straddle a cell or window
+    boundary are not merged; that's the price of staying fully vectorized. Without any
+    detections, the result is empty but has the same columns.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        FIRMS detections, e.g. from `read_firms_nrt_sources`
+
+    cell_size: float
+        Grid cell size in degrees
+
+    time_window: pd.Timedelta
+        Length of the acquisition time windows
+
+    sensor_column: str
+        Column identifying the sensor that reported each detection
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per group, with mean `latitude`/`longitude`, max `frp`, summed `frp_sum`,
+        the highest `confidence`, the earliest `acquired_at`, the number of merged
+        detections and a comma separated list of contributing `sensors`
+    """
+    lat = df['latitude'].to_numpy(np.float64)
+    lon = df['longitude'].to_numpy(np.float64)
+    frp = df['frp'].to_numpy(np.float64)
+    acquired_at = get_acquired_at(df)
+
+    keys = np.stack(
+        [
+            np.floor(lat / cell_size).astype(np.int64),
+            np.floor(lon / cell_size).astype(np.int64),
+            acquired_at.astype(np.int64) // int(time_window.total_seconds()),
+        ],
+        axis=1,
+    )
+    _, group = np.unique(keys, axis=0, return_inverse=True)
+    group = group.ravel()
+    n_groups = group.max() + 1 if len(group) else 0
+
+    count = np.bincount(group, minlength=n_groups)
+    frp_max = np.full(n_groups, -np.inf)
+    np.maximum.at(frp_max, group, frp)
+    first_acquired = np.full(n_groups, np.iinfo(np.int64).max)
+    np.minimum.at(first_acquired, group, acquired_at.astype(np.int64))
+
+    sensors = pd.Categorical(df[sensor_column])
+    sensor_bits = np.zeros(n_groups, dtype=np.int64)
+    np.bitwise_or.at(sensor_bits, group, np.left_shift(1, sensors.codes.astype(np.int64)))
+    sensor_names = {
+        bits: ','.join(c for i, c in enumerate(sensors.categories) if bits & (1 << i))
+        for bits in np.unique(sensor_bits)
+    }
+
+    result = pd.DataFrame(
+        {
+            'latitude': (np.bincount(group, weights=lat) / count).astype(np.float32),
+            'longitude': (np.bincount(group, weights=lon) / count).astype(np.float32),
+            'frp': frp_max.astype(np.float32),
+            'frp_sum': np.bincount(group, weights=frp).astype(np.float32),
+            'acquired_at': first_acquired.astype('datetime64[s]'),
+            'count': count,
+            'sensors': pd.Categorical([sensor_names[bits] for bits in sensor_bits]),
+        }
+    )
+    if 'confidence' in df:
+        confidence = pd.Categorical(df['confidence'], categories=CONFIDENCE_CATEGORIES)
+        best = np.full(n_groups, -1)
+        np.maximum.at(best, group, confidence.codes)
+        result['confidence'] = pd.Categorical.from_codes(best, categories=CONFIDENCE_CATEGORIES)
+    return result
@@ -1,12 +1,37 @@
+import functools
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import fsspec
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import shapely
+
+from carbonplan_forest_offsets_fires.cache import CACHE_DIR
+from carbonplan_forest_offsets_fires.tiles import publish_mbtiles
 
 key = os.environ["FIRMS_MAP_KEY"]
 url = "https://naturalearth.s3.amazonaws.com/110m_cultural/ne_110m_admin_0_countries.zip"
 
+SOURCES = ["VIIRS_NOAA20_NRT", "MODIS_NRT", "VIIRS_SNPP_NRT"]
+CONFIDENCE_CATEGORIES = ['l', 'n', 'h']
+FIRMS_COLUMN_TYPES = {
+    'latitude': pa.float32(),
+    'longitude': pa.float32(),
+    'frp': pa.float32(),
+    'confidence': pa.string(),  # int for MODIS, letters for VIIRS; see normalize_confidence
+    'acq_date': pa.timestamp('s'),
+    'acq_time': pa.int16(),
+    'satellite': pa.string(),
+    'instrument': pa.string(),
+    'daynight': pa.string(),
+}
+
 
 def read_viirs_historical() -> pd.DataFrame:
     return pd.read_parquet(
@@ -14,6 +39,38 @@ def read_viirs_historical() -> pd.DataFrame:
     )
 
 
+def _firms_nrt_url(
+    *,
+    min_lat: float,
+    max_lat: float,
+    min_lon: float,
+    max_lon: float,
+    day_range: int,
+    source: str,
+) -> str:
+    if source not in SOURCES:
+        raise ValueError(f"Invalid souce {source}; must be one of {SOURCES}")
+    base = "https://firms2.modaps.eosdis.nasa.gov/usfs/api/area/csv/"
+    subset_str = f"{min_lon},{min_lat},{max_lon},{max_lat}"
+    return f"{base}{key}/{source}/{subset_str}/{day_range}/"
+
+
+def parse_firms_csv(data: bytes) -> pd.DataFrame:
+    """Parse a FIRMS csv with a fixed schema and compact dtypes
+
+    Coordinates and `frp` are read as float32 and `confidence` is normalized to a
+    categorical (see `normalize_confidence`), whichever sensor the csv came from.
+    """
+    table = pa_csv.read_csv(
+        pa.BufferReader(data),
+        convert_options=pa_csv.ConvertOptions(column_types=FIRMS_COLUMN_TYPES),
+    )
+    df = table.to_pandas()
+    if 'confidence' in df:
+        df['confidence'] = normalize_confidence(df['confidence'])
+    return df
+
+
 def read_firms_nrt(
     *,
     min_lat: float,
@@ -41,37 +98,148 @@ def read_firms_nrt(
 
     Returns
     -------
+    pd.DataFrame
+        Parsed with `parse_firms_csv`
+    """
+    url = _firms_nrt_url(
+        min_lat=min_lat,
+        max_lat=max_lat,
+        min_lon=min_lon,
+        max_lon=max_lon,
+        day_range=day_range,
+        source=source,
+    )
+    with fsspec.open(url) as f:
+        return parse_firms_csv(f.read())
 
+
+def read_firms_nrt_sources(*, sources: list = SOURCES, **params) -> pd.DataFrame:
     """
-    sources = ["VIIRS_NOAA20_NRT", "MODIS_NRT", "VIIRS_SNPP_NRT"]
-    if source not in sources:
-        raise ValueError(f"Invalid souce {source}; must be one of {sources}")
-    base = "https://firms2.modaps.eosdis.nasa.gov/usfs/api/area/csv/"
-    subset_str = f"{min_lon},{min_lat},{max_lon},{max_lat}"
-    return pd.read_csv(f"{base}{key}/{source}/{subset_str}/{day_range}/")
+    Read NRT fire data for several sources concurrently
+
+    Parameters
+    ----------
+
+    sources: list
+        Data sources to query, defaults to all of `SOURCES`
+
+    **params
+        Bounding box and `day_range`, as in `read_firms_nrt`
+
+    Returns
+    -------
+    pd.DataFrame
+        All detections, with a categorical `source` column
+    """
+    with ThreadPoolExecutor(max_workers=len(sources)) as pool:
+        dfs = list(pool.map(lambda source: read_firms_nrt(**params, source=source), sources))
+    for df, source in zip(dfs, sources):
+        df['source'] = pd.Categorical([source] * len(df), categories=SOURCES)
+    return pd.concat(dfs, ignore_index=True)
+
+
+def normalize_confidence(confidence: pd.Series) -> pd.Series:
+    """Normalize confidence to a categorical of low/nominal/high (`l`, `n`, `h`)
+
+    VIIRS reports letters; MODIS reports a 0-100 percentage, which is binned so that
+    values of 35 and below are low, matching the cutoff `filter_df` has always used.
+    Missing confidences stay missing, rather than being read as a letter.
+    """
+    if isinstance(confidence.dtype, pd.CategoricalDtype) and list(
+        confidence.cat.categories
+    ) == list(CONFIDENCE_CATEGORIES):
+        return confidence
+    numeric = pd.to_numeric(confidence, errors='coerce').to_numpy()
+    letters = confidence.astype(str).str.lower().str[:1].to_numpy()
+    binned = np.select([numeric <= 35, numeric < 80], ['l', 'n'], 'h')
+    codes = np.where(np.isnan(numeric), letters, binned)
+    # astype(str) spells missing values 'nan' or 'None', whose first letter is `n`
+    codes = np.where(confidence.isna().to_numpy(), None, codes)
+    return pd.Series(
+        pd.Categorical(codes, categories=CONFIDENCE_CATEGORIES),
+        index=confidence.index,
+        name=confidence.name,
+    )
 
 
 def filter_df(df: pd.DataFrame) -> pd.DataFrame:
     """Filter DataFrame based on confidence"""
-    if df.dtypes['confidence'] == 'int64':
-        df = df[df['confidence'] > 35]
+    confidence = normalize_confidence(df['confidence'])
+    return df[confidence != 'l']
+
+
+@functools.lru_cache
+def load_us_mask() -> shapely.Geometry:
+    """Load the United States polygons used to mask FIRMS data
+
+    The polygons are extracted from Natural Earth on first use and cached on disk as WKB,
+    so later calls (and later runs on the same machine) skip the download.
+
+    Returns
+    -------
+    shapely.Geometry
+        Prepared (multi)polygon in EPSG:4326
+    """
+    path = Path(CACHE_DIR) / 'us-mask.wkb'
+    if path.exists():
+        mask = shapely.from_wkb(path.read_bytes())
     else:
-        df = df[df['confidence'] != 'l']
-    return df
+        world = gpd.read_file(url)
+        us = world[world.SOVEREIGNT == "United States of America"]
+        mask = shapely.union_all(us.geometry.values)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(shapely.to_wkb(mask))
+        os.replace(tmp, path)
+    shapely.prepare(mask)
+    return mask
 
 
-def mask_df(df: pd.DataFrame) -> gpd.GeoDataFrame:
-    """Filter to only include points in the United States"""
-    gdf = gpd.GeoDataFrame(
-        df, geometry=gpd.points_from_xy(df.longitude, df.latitude), crs="EPSG:4326"
-    )
-    world = gpd.read_file(url)
-    us = world[world.SOVEREIGNT == "United States of America"]
+def mask_df(
+    df: pd.DataFrame, mask: shapely.Geometry = None, columns: tuple = ('frp',)
+) -> gpd.GeoDataFrame:
+    """Filter to only include points in the United States
+
+    Points are first tested against the bounding boxes of each part of the mask using the
+    raw coordinate arrays, and only the survivors are tested for containment, so no
+    geometries are built for points that are obviously outside.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        FIRMS data with `latitude`, `longitude` and `frp` columns
+
+    mask: shapely.Geometry, optional
+        Polygons in EPSG:4326 to mask with; defaults to `load_us_mask()`
 
-    masked_points = gdf.sjoin(us, how='inner')
-    masked_points = masked_points[['frp', 'geometry']]
+    columns: tuple, optional
+        Columns to keep alongside the point geometry
 
-    return masked_points
+    Returns
+    -------
+    gpd.GeoDataFrame
+    """
+    if mask is None:
+        mask = load_us_mask()
+    lon = df['longitude'].to_numpy()
+    lat = df['latitude'].to_numpy()
+
+    # the US spans the antimeridian, so one bbox for the whole mask would prune very little
+    candidates = np.zeros(len(df), dtype=bool)
+    for xmin, ymin, xmax, ymax in shapely.bounds(shapely.get_parts(mask)):
+        candidates |= (lon >= xmin) & (lon <= xmax) & (lat >= ymin) & (lat <= ymax)
+
+    inside = np.zeros(len(df), dtype=bool)
+    inside[candidates] = shapely.intersects_xy(mask, lon[candidates], lat[candidates])
+
+    masked = df[inside]
+    return gpd.GeoDataFrame(
+        masked[list(columns)],
+        geometry=gpd.points_from_xy(masked.longitude, masked.latitude),
+        crs="EPSG:4326",
+    )
 
 
 def upload_tiles(
@@ -80,12 +248,10 @@ def upload_tiles(
     stem: str = "current-firms-pixels",
     dst_bucket: str = "carbonplan-scratch/web/tiles",
 ):
-    """Upload pdf tiles to s3"""
-    fs = fsspec.filesystem('s3', anon=False)
-    lpath = f'{tempdir}/processed/{stem}/'
-    rpath = f'{dst_bucket}/{stem}/'
-    if rpath == 'carbonplan-forest-offsets/web/tiles/current-firms-pixels/':
-        fs.rm(rpath, recursive=True)
-        fs.put(lpath, rpath, recursive=True)
+    """Publish pbf tiles from the mbtiles to s3, uploading only tiles that changed"""
+    mbtiles_path = f'{tempdir}/tmp/{stem}.mbtiles'
+    rpath = f'{dst_bucket}/{stem}'
+    if rpath == 'carbonplan-forest-offsets/web/tiles/current-firms-pixels':
+        publish_mbtiles(mbtiles_path, rpath)
     else:
         raise ValueError(f"Unexpected target path {rpath}")
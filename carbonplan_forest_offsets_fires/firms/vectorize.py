@@ -4,6 +4,8 @@ from pathlib import Path
 
 import geopandas as gpd
 
+from carbonplan_forest_offsets_fires.geojson import pipe_to_tippecanoe, write_geojson
+
 
 def get_firms_json(firms_data: gpd.GeoDataFrame) -> str:
     """Create json that we pass to tippecanoe for tiling"""
@@ -11,12 +13,22 @@ def get_firms_json(firms_data: gpd.GeoDataFrame) -> str:
 
 
 def write_firms_json(*, data: gpd.GeoDataFrame, tempdir: str) -> str:
-    """Write firms data as a GeoJson in a tempdir"""
-    data = get_firms_json(data)
-    out_fn = Path(tempdir) / 'firms.json'
-    with open(out_fn, 'w') as f:
-        f.write(data)
-    return out_fn
+    """Write firms data as newline-delimited GeoJson in a tempdir"""
+    return write_geojson(data, Path(tempdir) / 'firms.json', ['frp'])
+
+
+def write_firms_tiles(
+    *,
+    data: gpd.GeoDataFrame,
+    tempdir: str,
+    stem: str = "current-firms-pixels",
+    max_zoom_level: int = 9,
+):
+    """Stream firms data straight into tippecanoe, without an intermediate json file"""
+    cmd = build_tippecanoe_cmd(
+        input_fn=None, tempdir=tempdir, stem=stem, max_zoom_level=max_zoom_level
+    )
+    pipe_to_tippecanoe(data, cmd, ['frp'])
 
 
 def make_tile_tempdir() -> str:
@@ -34,8 +46,11 @@ def build_tippecanoe_cmd(
     stem: str = "current-firms-pixels",
     max_zoom_level: int = 9,
 ) -> str:
-    """Create tippecanoe command for generating vector tiles"""
-    return [
+    """Create tippecanoe command for generating vector tiles
+
+    If `input_fn` is None, tippecanoe reads features from stdin.
+    """
+    cmd = [
         "tippecanoe",
         f"-z{max_zoom_level}",
         "-r1",
@@ -45,15 +60,7 @@ def build_tippecanoe_cmd(
         "--no-tile-size-limit",
         "--extend-zooms-if-still-dropping",
         "--no-tile-compression",
-        "" f"{input_fn}",
-    ]
-
-
-def build_pbf_cmd(tempdir: str, stem: str = "current-firms-pixels") -> str:
-    """Create mb-util command for generating pbf files from vector tiles"""
-    return [
-        "mb-util",
-        "--image_format=pbf",
-        f"{tempdir}/tmp/{stem}.mbtiles",
-        f"{tempdir}/processed/{stem}",
     ]
+    if input_fn is not None:
+        cmd.append(f"{input_fn}")
+    return cmd
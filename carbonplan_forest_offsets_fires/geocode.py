@@ -0,0 +1,181 @@
+import json
+import os
+import tempfile
+import time
+
+import geopandas
+import numpy as np
+import shapely
+
+from carbonplan_forest_offsets_fires.cache import CACHE_DIR, OFFLINE
+
+COUNTY_BOUNDARY_URL = 'https://www2.census.gov/geo/tiger/GENZ2022/shp/cb_2022_us_county_500k.zip'
+COORDINATE_PRECISION = 4  # decimal degrees, roughly 10 m
+
+us_state_abbrev = {
+    'Alabama': 'AL',
+    'Alaska': 'AK',
+    'American Samoa': 'AS',
+    'Arizona': 'AZ',
+    'Arkansas': 'AR',
+    'California': 'CA',
+    'Colorado': 'CO',
+    'Connecticut': 'CT',
+    'Delaware': 'DE',
+    'District of Columbia': 'DC',
+    'Florida': 'FL',
+    'Georgia': 'GA',
+    'Guam': 'GU',
+    'Hawaii': 'HI',
+    'Idaho': 'ID',
+    'Illinois': 'IL',
+    'Indiana': 'IN',
+    'Iowa': 'IA',
+    'Kansas': 'KS',
+    'Kentucky': 'KY',
+    'Louisiana': 'LA',
+    'Maine': 'ME',
+    'Maryland': 'MD',
+    'Massachusetts': 'MA',
+    'Michigan': 'MI',
+    'Minnesota': 'MN',
+    'Mississippi': 'MS',
+    'Missouri': 'MO',
+    'Montana': 'MT',
+    'Nebraska': 'NE',
+    'Nevada': 'NV',
+    'New Hampshire': 'NH',
+    'New Jersey': 'NJ',
+    'New Mexico': 'NM',
+    'New York': 'NY',
+    'North Carolina': 'NC',
+    'North Dakota': 'ND',
+    'Northern Mariana Islands': 'MP',
+    'Ohio': 'OH',
+    'Oklahoma': 'OK',
+    'Oregon': 'OR',
+    'Pennsylvania': 'PA',
+    'Puerto Rico': 'PR',
+    'Rhode Island': 'RI',
+    'South Carolina': 'SC',
+    'South Dakota': 'SD',
+    'Tennessee': 'TN',
+    'Texas': 'TX',
+    'Utah': 'UT',
+    'Vermont': 'VT',
+    'Virgin Islands': 'VI',
+    'Virginia': 'VA',
+    'Washington': 'WA',
+    'West Virginia': 'WV',
+    'Wisconsin': 'WI',
+    'Wyoming': 'WY',
+}
+
+
+def _coordinate_key(lon: float, lat: float) -> str:
+    return f'{lon:.{COORDINATE_PRECISION}f},{lat:.{COORDINATE_PRECISION}f}'
+
+
+def load_counties(url: str = COUNTY_BOUNDARY_URL, cache_dir: str = CACHE_DIR):
+    """Load Census county boundaries, downloading them at most once
+
+    Returns:
+        geopandas.GeoDataFrame -- one row per county in epsg:4326, with a `location`
+            column formatted like "Siskiyou County, CA"
+    """
+    path = os.path.join(cache_dir, 'counties.parquet')
+    if os.path.exists(path):
+        return geopandas.read_parquet(path)
+
+    counties = geopandas.read_file(url, columns=['NAMELSAD', 'STATE_NAME']).to_crs('epsg:4326')
+    counties = counties[counties['STATE_NAME'].isin(us_state_abbrev.keys())]
+    counties = geopandas.GeoDataFrame(
+        {'location': counties['NAMELSAD'] + ', ' + counties['STATE_NAME'].map(us_state_abbrev)},
+        geometry=counties.geometry.values,
+        crs=counties.crs,
+    ).reset_index(drop=True)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    os.close(fd)
+    counties.to_parquet(tmp)
+    os.replace(tmp, path)
+    return counties
+
+
+def census_location_name(lon: float, lat: float, max_retries: int = 3) -> str:
+    """Look up "County, ST" with the Census geocoder API"""
+    import censusgeocode as cg
+
+    for attempt in range(max_retries + 1):
+        try:
+            results = cg.coordinates(x=lon, y=lat)
+            return (
+                results['Counties'][0]['NAME']
+                + ', '
+                + us_state_abbrev[results['States'][0]['NAME']]  # noqa
+            )
+        except Exception:
+            if attempt == max_retries:
+                raise
+            time.sleep(5)
+
+
+class CountyGeocoder:
+    """Offline reverse geocoder from lon/lat to "County, ST"
+
+    Points are resolved in one vectorized point-in-polygon query against county
+    boundaries. Results are persisted to a json cache keyed by rounded coordinates, and
+    points outside every county (e.g. just offshore) optionally fall back to the Census
+    geocoder API.
+
+    Arguments:
+        counties {geopandas.GeoDataFrame} -- county boundaries, as from `load_counties`
+        cache_path {str} -- json file caching resolved locations
+        census_fallback {bool} -- query the Census API for points no county contains
+    """
+
+    def __init__(
+        self,
+        counties: geopandas.GeoDataFrame = None,
+        cache_path: str = os.path.join(CACHE_DIR, 'locations.json'),
+        census_fallback: bool = not OFFLINE,
+    ):
+        self.counties = load_counties() if counties is None else counties
+        self.tree = shapely.STRtree(self.counties.geometry.values)
+        self.cache_path = cache_path
+        self.census_fallback = census_fallback
+        try:
+            with open(cache_path) as f:
+                self.cache = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.cache = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.cache_path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.cache, f)
+        os.replace(tmp, self.cache_path)
+
+    def reverse(self, coords: list) -> list:
+        """Resolve `[lon, lat]` pairs to "County, ST" (or None if unresolved)"""
+        keys = [_coordinate_key(lon, lat) for lon, lat in coords]
+        missing = sorted({key for key in keys if key not in self.cache})
+        if missing:
+            lonlat = np.array([key.split(',') for key in missing], dtype=np.float64)
+            points = shapely.points(lonlat)
+            point_idx, county_idx = self.tree.query(points, predicate='intersects')
+            # a point on a shared border gets the first matching county in `counties`
+            order = np.lexsort((county_idx, point_idx))
+            point_idx, county_idx = point_idx[order], county_idx[order]
+            first = np.unique(point_idx, return_index=True)[1]
+            locations = self.counties['location'].to_numpy()
+            resolved = dict(zip(point_idx[first], locations[county_idx[first]]))
+            for i, key in enumerate(missing):
+                location = resolved.get(i)
+                if location is None and self.census_fallback:
+                    location = census_location_name(*lonlat[i])
+                if location is not None:
+                    self.cache[key] = location
+            self.save()
+        return [self.cache.get(key) for key in keys]
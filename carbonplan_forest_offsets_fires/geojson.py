@@ -0,0 +1,104 @@
+import contextlib
+import json
+import subprocess
+from pathlib import Path
+from typing import Union
+
+import geopandas
+import pandas as pd
+import shapely
+
+CHUNK_SIZE = 10_000
+
+
+def iter_geojson_features(
+    gdf: geopandas.GeoDataFrame,
+    properties: list,
+    crs: str = 'EPSG:4326',
+    chunk_size: int = CHUNK_SIZE,
+):
+    """Yield newline-delimited GeoJSON features, one chunk of rows at a time
+
+    Only `chunk_size` rows are reprojected and serialized at once, so memory use doesn't
+    grow with the number of features.
+
+    Arguments:
+        gdf {geopandas.GeoDataFrame} -- features to export
+        properties {list} -- columns to include as feature properties
+        crs {str} -- crs to write coordinates in
+        chunk_size {int} -- rows per chunk
+
+    Yields:
+        str -- one chunk of features, one feature per line
+    """
+    for start in range(0, len(gdf), chunk_size):
+        chunk = gdf.iloc[start : start + chunk_size].to_crs(crs)
+        geoms = shapely.to_geojson(chunk.geometry.values)
+        props = chunk[properties].astype(object)
+        records = props.where(pd.notna(props), None).to_dict(orient='records')
+        yield ''.join(
+            f'{{"type": "Feature", "properties": {json.dumps(record)}, '
+            f'"geometry": {"null" if geom is None else geom}}}\n'
+            for record, geom in zip(records, geoms)
+        )
+
+
+def write_geojson_seq(gdf: geopandas.GeoDataFrame, fp, properties: list, **kwargs) -> int:
+    """Write newline-delimited GeoJSON features to an open text file
+
+    Returns:
+        int -- number of features written
+    """
+    for chunk in iter_geojson_features(gdf, properties, **kwargs):
+        fp.write(chunk)
+    return len(gdf)
+
+
+def write_geojson(gdf: geopandas.GeoDataFrame, out_fn: str, properties: list, **kwargs) -> Path:
+    """Write newline-delimited GeoJSON features to `out_fn`"""
+    out_fn = Path(out_fn)
+    with open(out_fn, 'w') as f:
+        write_geojson_seq(gdf, f, properties, **kwargs)
+    return out_fn
+
+
+def _tippecanoe_output(cmd: list) -> Union[None, str]:
+    """The mbtiles path a tippecanoe command writes to, if it names one"""
+    for flag, value in zip(cmd, [*cmd[1:], None]):
+        if flag in ('-o', '--output'):
+            return value
+        if flag.startswith('--output='):
+            return flag.split('=', 1)[1]
+    return None
+
+
+def pipe_to_tippecanoe(gdf: geopandas.GeoDataFrame, cmd: list, properties: list, **kwargs):
+    """Stream features straight into tippecanoe's stdin
+
+    Tiling starts while features are still being serialized and no intermediate file is
+    written. `cmd` must not name an input file, so that tippecanoe reads from stdin. If
+    tippecanoe fails, or features can't be serialized, the partly written mbtiles is removed
+    and the error raised.
+    """
+    output = _tippecanoe_output(cmd)
+    try:
+        with subprocess.Popen(cmd, stdin=subprocess.PIPE, text=True) as proc:
+            try:
+                write_geojson_seq(gdf, proc.stdin, properties, **kwargs)
+                proc.stdin.close()
+            except BrokenPipeError:
+                # tippecanoe exited early, its exit status says why
+                with contextlib.suppress(BrokenPipeError):
+                    proc.stdin.close()
+            except BaseException:
+                # a truncated stream would otherwise still be tiled
+                proc.kill()
+                with contextlib.suppress(BrokenPipeError):
+                    proc.stdin.close()
+                raise
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+    except BaseException:
+        if output is not None:
+            Path(output).unlink(missing_ok=True)
+        raise
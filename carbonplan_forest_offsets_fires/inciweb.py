@@ -0,0 +1,116 @@
+import datetime
+import json
+import os
+import tempfile
+from collections import defaultdict
+
+from thefuzz import process
+from thefuzz.utils import full_process
+
+from carbonplan_forest_offsets_fires import utils
+from carbonplan_forest_offsets_fires.cache import CACHE_DIR, OFFLINE
+
+INCIWEB_URL = 'https://inciweb.nwcg.gov'
+INCIWEB_TTL = datetime.timedelta(
+    seconds=int(os.environ.get('FOREST_OFFSETS_FIRES_INCIWEB_TTL', 6 * 3600))
+)
+SCORE_CUTOFF = 90
+# words that say nothing about which incident a name refers to
+STOPWORDS = frozenset({'fire', 'fires', 'complex', 'wildfire', 'incident'})
+MIN_BLOCKED_LENGTH = 4
+
+
+def normalize_name(name: str) -> str:
+    """Normalize a fire name the way thefuzz does, minus stopwords and numbers"""
+    return ' '.join(
+        token
+        for token in full_process(name).split()
+        if token not in STOPWORDS and not token.isdigit()
+    )
+
+
+def _trigrams(name: str) -> set:
+    padded = f' {name} '
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class InciWebIndex:
+    """Fuzzy lookup of InciWeb incidents by fire name
+
+    Matches are those of scoring a name against every incident with
+    `thefuzz.process.extractOne(..., score_cutoff=90)`, but only incidents sharing a
+    character trigram with the normalized name (or whose normalized name is too short to
+    block on) are scored. A score of 90 leaves room for a couple of edits at most, which
+    can't wipe out every shared trigram of names at least `MIN_BLOCKED_LENGTH` long.
+
+    Arguments:
+        uris {dict} -- incident name -> inciweb uri, as from `utils.get_inciweb_uris`
+    """
+
+    def __init__(self, uris: dict):
+        self.uris = uris
+        self.names = list(uris)
+        self._blocks = defaultdict(set)
+        self._unblocked = set()
+        for i, name in enumerate(self.names):
+            normalized = normalize_name(name)
+            if len(normalized) < MIN_BLOCKED_LENGTH:
+                self._unblocked.add(i)
+                continue
+            for key in _trigrams(normalized):
+                self._blocks[key].add(i)
+
+    def __len__(self):
+        return len(self.names)
+
+    def candidates(self, name: str) -> list:
+        """Incident names worth scoring against `name`, in index order"""
+        normalized = normalize_name(name)
+        if len(normalized) < MIN_BLOCKED_LENGTH:
+            return self.names
+        matched = set(self._unblocked)
+        for key in _trigrams(normalized):
+            matched |= self._blocks.get(key, set())
+        # keep index order so ties resolve like a full scan
+        return [self.names[i] for i in sorted(matched)]
+
+    def match(self, name: str, score_cutoff: int = SCORE_CUTOFF):
+        """Return the full inciweb url of the best matching incident, or None"""
+        if not isinstance(name, str) or not name:
+            return None
+        match = process.extractOne(name, self.candidates(name), score_cutoff=score_cutoff)
+        if match is None:
+            return None
+        return INCIWEB_URL + self.uris[match[0]]
+
+
+def _read_cached_uris(path: str, ttl: datetime.timedelta):
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    fetched_at = datetime.datetime.fromisoformat(cached['fetched_at'])
+    if not OFFLINE and datetime.datetime.utcnow() - fetched_at > ttl:
+        return None
+    return cached['uris']
+
+
+def load_inciweb_index(
+    ttl: datetime.timedelta = INCIWEB_TTL, cache_dir: str = CACHE_DIR
+) -> InciWebIndex:
+    """Build the InciWeb index, fetching the incident list at most once per `ttl`
+
+    The parsed incident list is cached in `cache_dir`, so runs within `ttl` of each other
+    (and every task within a run) share a single fetch of the InciWeb page.
+    """
+    path = os.path.join(cache_dir, 'inciweb.json')
+    uris = _read_cached_uris(path, ttl)
+    if uris is None:
+        uris = utils.get_inciweb_uris()
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'fetched_at': datetime.datetime.utcnow().isoformat(), 'uris': uris}, f)
+        os.replace(tmp, path)
+    return InciWebIndex(uris)
@@ -1,11 +1,12 @@
-import json
-import subprocess
+import os
 
-import fsspec
 import geopandas
 import prefect
 
-from carbonplan_forest_offsets_fires.utils import list_all_ea_opr_ids, list_all_opr_ids
+from carbonplan_forest_offsets_fires import canonical, reference, sindex
+from carbonplan_forest_offsets_fires.cache import CACHE_DIR
+from carbonplan_forest_offsets_fires.simplify import simplify_geometries
+from carbonplan_forest_offsets_fires.utils import list_all_opr_ids, load_raw_geometries
 
 GEOM_PATH = 's3://carbonplan-forest-offsets/carb-geometries'
 
@@ -14,47 +15,47 @@ GEOM_PATH = 's3://carbonplan-forest-offsets/carb-geometries'
 def get_all_opr_ids():
     """Wrap util in prefect task for use in flow"""
     opr_ids = list_all_opr_ids()
-    ea_opr_ids = list_all_ea_opr_ids()
+    ea_opr_ids = reference.ea_opr_ids()
     return [opr_id for opr_id in opr_ids if opr_id not in ea_opr_ids]
 
 
+@prefect.task
+def simplify_project_geometries(opr_ids: list, overrides: dict = None) -> geopandas.GeoDataFrame:
+    """Simplified geometries of all `opr_ids` in one batch
+
+    Read from the canonical artifact, unless `overrides` asks for other simplification
+    percentages than it was built with (see `simplify.simplify_geometries`).
+    """
+    if overrides is None:
+        return canonical.load_project_geometries(opr_ids)
+    return simplify_geometries(load_raw_geometries(opr_ids), overrides=overrides)
+
+
 @prefect.task
 def load_simplified_geometry(opr_id: str) -> geopandas.GeoDataFrame:
-    """ "Pass raw geometry through mapshaper"""
-    fn = GEOM_PATH + f'/raw/{opr_id}.json'
-    with fsspec.open(fn) as f:
-        d = json.load(f)
-
-    # mapshaper uses `-` to denote stdin/stdout, so read from - and write to -
-    # ACR361 shapefile is so broken we have to really goose the simplification
-    if opr_id in ['ACR361']:
-        result = subprocess.run(
-            'mapshaper -i - -simplify 5% -o -',
-            text=True,
-            capture_output=True,
-            shell=True,
-            input=json.dumps(d),
-        )
-    else:
-        result = subprocess.run(
-            'mapshaper -i - -simplify 80% -o -',
-            text=True,
-            capture_output=True,
-            shell=True,
-            input=json.dumps(d),
-        )
-    gdf = geopandas.GeoDataFrame.from_features(json.loads(result.stdout))
-    gdf = gdf.set_crs('epsg:4326')
-    gdf = gdf.to_crs('epsg:5070')
+    """Simplified geometry of a single project, see `simplify_project_geometries`"""
+    return simplify_project_geometries.run([opr_id])
+
+
+def _buffer(gdf: geopandas.GeoDataFrame, buffer_by: int, by=None) -> geopandas.GeoDataFrame:
+    # explode/dissolve requires valid geometries, canonical ones already are
+    invalid = ~gdf.is_valid
+    if invalid.any():
+        gdf.loc[invalid, gdf.geometry.name] = gdf[invalid].buffer(0)
+    gdf = gdf.explode(index_parts=True).dissolve(by=by)
+    gdf.geometry = gdf.simplify(50).buffer(buffer_by).buffer(-1 * buffer_by)
     return gdf
 
 
 @prefect.task
 def buffer_geometry(gdf: geopandas.GeoDataFrame, buffer_by: int):
-    gdf.geometry = gdf.buffer(0)  # explode/dissolve requires valid geometries
-    gdf = gdf.explode(index_parts=True).dissolve()
-    gdf.geometry = gdf.simplify(50).buffer(buffer_by).buffer(-1 * buffer_by)
-    return gdf
+    return _buffer(gdf, buffer_by)
+
+
+@prefect.task
+def buffer_geometries(gdf: geopandas.GeoDataFrame, buffer_by: int) -> geopandas.GeoDataFrame:
+    """Batch `buffer_geometry`: one dissolved, smoothed row per `opr_id`"""
+    return _buffer(gdf.copy(), buffer_by, by='opr_id').reset_index()
 
 
 @prefect.task
@@ -81,10 +82,41 @@ def get_project_convex_hulls(
 def load_all_project_geometries() -> geopandas.GeoDataFrame:
     """Load all CARB project geometries
 
+    Full resolution geometries are read from the canonical artifact, falling back to
+    reprojecting `all_carb_geoms.parquet` if it hasn't been published yet.
+
     Returns:
         geopandas.GeoDataFrame -- gepdataframe with all projects in epsg:5070
     """
+    try:
+        return canonical.read_project_geometries(level='geometry')
+    except FileNotFoundError:
+        pass
     fname = GEOM_PATH + '/all_carb_geoms.parquet'
     gdf = geopandas.read_parquet(fname)
     gdf = gdf.to_crs('epsg:5070')
     return gdf.reset_index()
+
+
+@prefect.task
+def load_project_index() -> sindex.ProjectIndex:
+    """Memory map the prebuilt spatial index of all CARB project geometries
+
+    The index is published by the `build-project-geometries` flow. Until that has run,
+    every call logs a warning and rebuilds the index from `load_all_project_geometries`
+    into the local cache.
+    """
+    try:
+        return sindex.load_project_index()
+    except FileNotFoundError:
+        prefect.context.get('logger').warning(
+            f'{sindex.INDEX_PATH} not found, building project index locally; '
+            'run the build-project-geometries flow to publish it'
+        )
+        local = os.path.join(CACHE_DIR, 'sindex', os.path.basename(sindex.INDEX_PATH))
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        # write then rename, so processes still mapping an older copy are unaffected
+        tmp = f'{local}.{os.getpid()}.tmp'
+        sindex.write_project_index(load_all_project_geometries.run(), tmp)
+        os.replace(tmp, local)
+        return sindex.ProjectIndex(local)
@@ -1,3 +1,4 @@
+import json
 import os
 import tempfile
 from datetime import datetime
@@ -6,11 +7,72 @@ from pathlib import Path
 import fsspec
 import geopandas
 import prefect
+import pyarrow.parquet as pq
+import pyproj
+from prefect.utilities.logging import get_logger
+
+from carbonplan_forest_offsets_fires import catalog
+from carbonplan_forest_offsets_fires.geojson import write_geojson
+from carbonplan_forest_offsets_fires.tiles import publish_mbtiles
+
+logger = get_logger('nifc')
 
 NIFC_BUCKET = 'carbonplan-forest-offsets/fires/nifc-data'
+# snapshot column -> name used downstream
+RENAMES = {'attr_FireDiscoveryDateTime': 'start_date', 'poly_IncidentName': 'name'}
+
+
+class LoaderProfile:
+    """The snapshot columns a flow needs, and how to store them in memory
+
+    Arguments:
+        columns {list} -- attribute columns to read alongside the geometry, all if None
+        categorical {list} -- string columns to store as categoricals, when that's smaller
+    """
+
+    def __init__(self, columns: list = None, categorical: list = ()):
+        self.columns = columns
+        self.categorical = list(categorical)
+
+
+# `attr_FireDiscoveryDateTime` is already stored as 8 byte epoch milliseconds, and is
+# written as-is to project summaries and fire fingerprints, so it's never recast
+PROFILES = {
+    'full': LoaderProfile(),
+    'stats': LoaderProfile(
+        ['poly_IRWINID', 'poly_IncidentName', 'attr_FireDiscoveryDateTime'],
+        categorical=['poly_IncidentName'],
+    ),
+    'tiles': LoaderProfile(['poly_IRWINID']),
+}
+
+
+def _load_catalog(bucket: str):
+    """The snapshot catalog, if `bucket` is the one it tracks and it's been written"""
+    if bucket != NIFC_BUCKET:
+        return None
+    try:
+        return catalog.load_catalog()
+    except FileNotFoundError:
+        return None
 
 
 def get_nifc_filename(bucket: str, as_of: datetime = None) -> str:
+    """Path of the latest NIFC snapshot, or of the latest one taken on `as_of`'s date
+
+    Looked up in the snapshot catalog, only listing the bucket if there's no catalog
+    or it has no snapshot for that date. The latest snapshot is checked against the
+    keys uploaded since the newest catalogued one, so a snapshot that missed the catalog
+    is still found (see `catalog.uncatalogued_snapshots`).
+    """
+    snapshots = _load_catalog(bucket)
+    if snapshots is not None:
+        entry = snapshots.on_date(as_of) if as_of else snapshots.latest()
+        if entry is not None and as_of:
+            return entry['path']
+        if entry is not None:
+            newer = catalog.uncatalogued_snapshots(snapshots, bucket)
+            return newer[-1] if newer else entry['path']
     try:
         fs = fsspec.filesystem('s3', anon=False)
         if as_of:
@@ -26,19 +88,118 @@ def get_nifc_filename(bucket: str, as_of: datetime = None) -> str:
         raise IndexError(err_msg) from err
 
 
-def load_nifc_data(nifc_filename: str) -> geopandas.GeoDataFrame:
+def resolve_nifc_snapshots(bucket: str, start: datetime, end: datetime) -> list:
+    """Find the latest NIFC snapshot of each day between `start` and `end`, inclusive
+
+    This is `get_nifc_filename` for a whole date range, read from the snapshot catalog
+    or, without one, from a single listing.
+
+    Returns:
+        list -- (date, s3 path) tuples in date order, skipping days without a snapshot
+    """
+    snapshots = _load_catalog(bucket)
+    if snapshots is not None:
+        return snapshots.daily(start.date(), end.date())
+    fs = fsspec.filesystem('s3', anon=False)
+    latest = {}
+    for fn in sorted(fs.glob(f'{bucket}/*')):
+        try:
+            date = datetime.strptime(os.path.basename(fn)[:10], '%Y-%m-%d')
+        except ValueError:
+            continue
+        if start.date() <= date.date() <= end.date():
+            latest[date] = ''.join(['s3://', fn])
+    return sorted(latest.items())
+
+
+def _memory_mb(df) -> float:
+    """In-memory size of the attribute columns"""
+    return df.drop(columns=df.geometry.name).memory_usage(deep=True).sum() / 1e6
+
+
+def _compact(df, columns: list):
+    """Store `columns` as categoricals where that takes less memory, in place"""
+    for column in columns:
+        if column in df and df[column].nunique() < len(df) / 2:
+            df[column] = df[column].astype('category')
+
+
+def load_nifc_data(
+    nifc_filename: str, profile: str = 'full', bbox: tuple = None
+) -> geopandas.GeoDataFrame:
+    """Read a NIFC snapshot, with only the columns `profile` needs
+
+    Arguments:
+        nifc_filename {str} -- snapshot path
+        profile {str} -- one of `PROFILES`, or a `LoaderProfile`
+        bbox {tuple} -- (xmin, ymin, xmax, ymax) in epsg:5070; only read perimeters whose
+            bounding box intersects it
+
+    Returns:
+        geopandas.GeoDataFrame -- perimeters in the snapshot's crs, with `RENAMES` applied
+    """
+    profile = PROFILES[profile] if isinstance(profile, str) else profile
     with fsspec.open(nifc_filename) as f:
-        gdf = geopandas.read_parquet(f)
-    gdf = gdf.rename(
-        columns={'attr_FireDiscoveryDateTime': 'start_date', 'poly_IncidentName': 'name'}  # noqa
+        parquet = pq.ParquetFile(f)
+        geo = json.loads(parquet.schema_arrow.metadata[b'geo'])
+        geometry = geo['columns'][geo['primary_column']]
+        names = parquet.schema_arrow.names
+        # the bbox covering column only exists to filter on, never read it back
+        covering = {path[0] for path in geometry.get('covering', {}).get('bbox', {}).values()}
+        columns = (
+            [name for name in names if name not in covering]
+            if profile.columns is None
+            else [*profile.columns, geo['primary_column']]
+        )
+        skipped = sum(
+            chunk.total_uncompressed_size
+            for i in range(parquet.metadata.num_row_groups)
+            for chunk in map(
+                parquet.metadata.row_group(i).column, range(parquet.metadata.num_columns)
+            )
+            if chunk.path_in_schema not in columns
+        )
+
+        if bbox is not None:
+            crs = pyproj.CRS.from_user_input(geometry.get('crs', 'OGC:CRS84'))
+            transformer = pyproj.Transformer.from_crs('epsg:5070', crs, always_xy=True)
+            bbox = transformer.transform_bounds(*bbox)
+        # without a bbox covering column, rows can only be filtered after reading
+        pushdown = bbox if 'covering' in geometry else None
+        f.seek(0)
+        gdf = geopandas.read_parquet(f, columns=columns, bbox=pushdown)
+    if bbox is not None and pushdown is None:
+        # the same bounding box test the covering column pushdown does
+        xmin, ymin, xmax, ymax = bbox
+        bounds = gdf.bounds
+        gdf = gdf[
+            (bounds['minx'] <= xmax)
+            & (bounds['maxx'] >= xmin)
+            & (bounds['miny'] <= ymax)
+            & (bounds['maxy'] >= ymin)
+        ]
+
+    loaded = _memory_mb(gdf)
+    _compact(gdf, profile.categorical)
+    compacted = _memory_mb(gdf)
+    logger.info(
+        f'Read {len(gdf)} perimeters, skipping {len(names) - len(columns)} of {len(names)} '
+        f'columns ({skipped / 1e6:.1f} MB uncompressed); attributes take {compacted:.1f} MB, '
+        f'{loaded - compacted:.1f} MB less with compact dtypes'
     )
-    return gdf
+    return gdf.rename(columns=RENAMES)
 
 
 @prefect.task
-def load_nifc_asof(as_of: datetime = None) -> geopandas.GeoDataFrame:
+def load_nifc_asof(
+    as_of: datetime = None, profile: str = 'full', bbox: tuple = None
+) -> geopandas.GeoDataFrame:
+    """Latest NIFC snapshot (or the latest taken on `as_of`'s date), in epsg:5070
+
+    See `load_nifc_data` for `profile` and `bbox`.
+    """
     fn = get_nifc_filename(NIFC_BUCKET, as_of)
-    perims = load_nifc_data(fn)
+    perims = load_nifc_data(fn, profile=profile, bbox=bbox)
     perims = perims.to_crs('epsg:5070')
     return perims
 
@@ -50,17 +211,9 @@ def get_nifc_unary_union(gdf: geopandas.GeoDataFrame):
 
 
 @prefect.task
-def get_fires_json(nifc_data: geopandas.GeoDataFrame) -> str:
-    """Create json that we pass to tippecanoe for tiling"""
-    return nifc_data[['poly_IRWINID', 'geometry']].to_crs('EPSG:4326').to_json()
-
-
-@prefect.task
-def write_fire_json(data: str, tempdir: str) -> str:
-    out_fn = Path(tempdir) / 'fires.json'
-    with open(out_fn, 'w') as f:
-        f.write(data)
-    return out_fn
+def write_fire_json(data: geopandas.GeoDataFrame, tempdir: str) -> str:
+    """Stream fire perimeters to newline-delimited GeoJSON for tippecanoe"""
+    return write_geojson(data, Path(tempdir) / 'fires.json', ['poly_IRWINID'])
 
 
 @prefect.task
@@ -88,19 +241,11 @@ def build_tippecanoe_cmd(
 
 
 @prefect.task
-def build_pbf_cmd(tempdir: str, stem: str) -> str:
-    return f'mb-util --image_format=pbf {tempdir}/tmp/{stem}.mbtiles {tempdir}/processed/{stem}'  # noqa
-
-
-@prefect.task
-def upload_tiles(tempdir: str, stem: str, dst_bucket: str, clear_existing: bool = False):
-    fs = fsspec.filesystem('s3', anon=False)
-    lpath = f'{tempdir}/processed/{stem}/'
+def upload_tiles(tempdir: str, stem: str, dst_bucket: str):
+    """Publish a new version of the tiles straight from the mbtiles, uploading only what
+    changed, see `tiles.publish`
+    """
+    mbtiles_path = f'{tempdir}/tmp/{stem}.mbtiles'
     rpath = f'{dst_bucket}/{stem}'
-    if rpath == 'carbonplan-forest-offsets/web/tiles/current-nifc-perimeters' and clear_existing:
-        print(f'Removing old tiles and uploading to {rpath}')
-        fs.rm(rpath, recursive=True)
-        fs.put(lpath, rpath, recursive=True)
-    else:
-        print(f'Uploading to {rpath}')
-        fs.put(lpath, rpath, recursive=True)
+    print(f'Publishing to {rpath}')
+    publish_mbtiles(mbtiles_path, rpath)
@@ -0,0 +1,128 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import prefect
+from prefect import Flow, Parameter
+from prefect.core.parameter import DateTimeParameter
+
+from carbonplan_forest_offsets_fires import canonical, inciweb, profiling, stats
+from carbonplan_forest_offsets_fires.prefect.tasks import geometry, nifc
+from carbonplan_forest_offsets_fires.prefect.workflows import calculate_project_stats
+
+MAX_WORKERS = os.cpu_count()
+
+# per-process state, loaded once by `_init_worker`
+_worker = {}
+
+
+def _init_worker():
+    _worker['project_index'] = geometry.load_project_index.run()
+    _worker['geometries'] = {}
+    _worker['artifact'] = canonical.artifact_identity()
+
+
+def _load_geometries(opr_ids: list):
+    """`canonical.load_project_geometries`, memoized for the lifetime of the worker"""
+    loaded = _worker['geometries']
+    missing = [opr_id for opr_id in opr_ids if opr_id not in loaded]
+    if missing:
+        gdf = canonical.load_project_geometries(missing)
+        loaded.update(dict(tuple(gdf.groupby('opr_id', sort=False))))
+    return pd.concat([loaded[opr_id] for opr_id in opr_ids if opr_id in loaded], ignore_index=True)
+
+
+def process_snapshots(
+    snapshots: list, inciweb_index: inciweb.InciWebIndex, resolution: float = None
+) -> list:
+    """Write `state_YYYY-MM-DD.json` for consecutive NIFC snapshots
+
+    State is carried from one day to the next with `stats.update_project_state`, so only
+    projects near perimeters that changed overnight are recomputed.
+
+    Arguments:
+        snapshots {list} -- (date, s3 path) tuples, in date order
+        inciweb_index {inciweb.InciWebIndex} -- incidents to link fires to
+        resolution {float} -- raster engine resolution, exact burned area if None
+
+    Returns:
+        list -- dates written
+    """
+    if not _worker:
+        _init_worker()
+    project_state = stats.empty_project_state()
+    for as_of, path in snapshots:
+        print(f'Processing {as_of:%Y-%m-%d} from {path}')
+        nifc_perimeters = nifc.load_nifc_data(path, profile='stats').to_crs('epsg:5070')
+        candidate_fires = stats.get_candidate_fires(nifc_perimeters, _worker['project_index'])
+        project_state = stats.update_project_state(
+            project_state,
+            candidate_fires,
+            nifc_perimeters,
+            load_geometries=_load_geometries,
+            summarize=calculate_project_stats.get_summarize(resolution),
+            settings={'resolution': resolution, 'geometries': _worker['artifact']},
+        )
+        annotated = [
+            calculate_project_stats.append_inciweb_urls.run(result, inciweb_index)
+            for result in calculate_project_stats.get_project_results.run(project_state)
+        ]
+        calculate_project_stats.write_state_as_of.run(as_of, annotated)
+    return [as_of for as_of, _ in snapshots]
+
+
+def backfill_project_stats(
+    start: datetime, end: datetime, max_workers: int = MAX_WORKERS, resolution: float = None
+):
+    """Rebuild dated project-stats state files for every NIFC snapshot in a date range
+
+    The InciWeb index is loaded once. Snapshots are split into one contiguous run of
+    days per worker; each worker loads the project index once, keeps the project
+    geometries it has loaded, and processes its days in order.
+
+    Returns:
+        list -- dates written
+    """
+    snapshots = nifc.resolve_nifc_snapshots(nifc.NIFC_BUCKET, start, end)
+    print(
+        f'Backfilling {len(snapshots)} NIFC snapshots between {start:%Y-%m-%d} and {end:%Y-%m-%d}'
+    )
+    if not snapshots:
+        return []
+
+    inciweb_index = inciweb.load_inciweb_index()
+
+    n_chunks = max(1, min(max_workers, len(snapshots)))
+    chunks = [
+        [snapshots[i] for i in idx] for idx in np.array_split(np.arange(len(snapshots)), n_chunks)
+    ]
+    if n_chunks == 1:
+        return process_snapshots(chunks[0], inciweb_index, resolution)
+
+    with ProcessPoolExecutor(max_workers=n_chunks, initializer=_init_worker) as pool:
+        futures = [
+            pool.submit(process_snapshots, chunk, inciweb_index, resolution) for chunk in chunks
+        ]
+        return [as_of for future in futures for as_of in future.result()]
+
+
+@prefect.task
+def run_backfill(start: datetime, end: datetime, max_workers: int, resolution: float) -> list:
+    return backfill_project_stats(
+        start, end, max_workers=max_workers or MAX_WORKERS, resolution=resolution
+    )
+
+
+with Flow('backfill-project-stats') as flow:
+    start = DateTimeParameter(name='start')
+    end = DateTimeParameter(name='end')
+    max_workers = Parameter(name='max_workers', default=None)
+    resolution = Parameter(name='resolution', default=None)
+    run_backfill(start, end, max_workers, resolution)
+
+profiling.instrument_flow(flow)
+flow.run_config = prefect.run_configs.KubernetesRun(
+    image='quay.io/carbonplan/forest-offsets-fires:latest'
+)
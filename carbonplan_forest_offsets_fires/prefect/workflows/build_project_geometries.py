@@ -0,0 +1,26 @@
+import prefect
+from prefect import Flow
+
+from carbonplan_forest_offsets_fires import canonical, profiling, sindex
+
+
+@prefect.task
+def build_project_geometries() -> str:
+    """Validate, reproject and simplify all raw CARB geometries into one GeoParquet"""
+    return canonical.build_project_geometries()
+
+
+@prefect.task
+def build_project_index(src: str) -> str:
+    """Rebuild the project spatial index from the new full resolution geometries"""
+    return sindex.build_project_index(src=src)
+
+
+with Flow('build-project-geometries') as flow:
+    projects_path = build_project_geometries()
+    build_project_index(projects_path)
+
+profiling.instrument_flow(flow)
+flow.run_config = prefect.run_configs.KubernetesRun(
+    image='quay.io/carbonplan/forest-offsets-fires:latest'
+)
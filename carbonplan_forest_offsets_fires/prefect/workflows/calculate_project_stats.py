@@ -1,104 +1,117 @@
+import copy
 import datetime
+import functools
 import json
 
 import fsspec
 import geopandas
 import prefect
-from prefect import Flow
+from prefect import Flow, Parameter, unmapped
 from prefect.core.parameter import DateTimeParameter
-from prefect.tasks.control_flow.filter import FilterTask
-from thefuzz import process
 
-from carbonplan_forest_offsets_fires import utils
+from carbonplan_forest_offsets_fires import canonical, inciweb, profiling, raster, sindex, stats
 from carbonplan_forest_offsets_fires.prefect.tasks import geometry, nifc
+from carbonplan_forest_offsets_fires.stats import get_fire_metadata  # noqa
 
 NIFC_BUCKET = 'carbonplan-forest-offsets'
+PROJECT_STATE_PATH = f'{NIFC_BUCKET}/fires/project_fires/incremental/project_state.json'
 
 serializer = prefect.engine.serializers.JSONSerializer()
 
 
-def get_fire_metadata(project_fires: geopandas.GeoDataFrame) -> dict:
-    centroids = (
-        project_fires.centroid.to_crs('epsg:4326')
-        .apply(lambda x: [x.centroid.x, x.centroid.y])
-        .rename('centroid')
-    )
-    label_coords = project_fires.convex_hull.exterior.apply(
-        utils.extract_northern_corner
-    ).rename(  # noqa
-        'label_coords'
-    )
-    project_fires = project_fires.join(centroids).join(label_coords)
-    return project_fires.set_index('poly_IRWINID')[
-        ['name', 'start_date', 'centroid', 'label_coords']
-    ].to_dict(orient='index')
+@prefect.task
+def get_candidate_fires(
+    nifc_perimeters: geopandas.GeoDataFrame, project_index: sindex.ProjectIndex
+) -> dict:
+    """Find the fires touching each project's convex hull
 
+    Returns:
+        dict -- opr_id -> sorted list of IRWINIDs of fires intersecting the project hull
+    """
+    return stats.get_candidate_fires(nifc_perimeters, project_index)
 
-@prefect.task
-def get_candidate_opr_ids(
-    nifc_perimeters: geopandas.GeoDataFrame, proj_hulls: geopandas.GeoDataFrame
-) -> list:
-    """Intersect fire perimeters and convex hulls of projects and return list of opr_ids
 
-    We do a first pass to speed things up.
-    Hulls are super simple geometries which makes the intersection lightning fast.
-    Arguments:
-        nifc_perimeters {geopandas.GeoDataFrame} -- fire perimeters, to date.
-        proj_hulls {geopandas.GeoDataFrame} -- simplified project geometries.
+@prefect.task
+def load_project_state(incremental: bool) -> dict:
+    """Load per-project results from the previous run
 
-    Returns:
-        list -- projects that _might_ have intersection with fire.
+    Returns an empty state (forcing a full recompute) if not running incrementally or if
+    no previous state exists.
     """
-    candidate_opr_ids = geopandas.sjoin(nifc_perimeters, proj_hulls).opr_id.unique()
-    return candidate_opr_ids
+    s3 = fsspec.filesystem('s3', anon=False)
+    if not incremental or not s3.exists(PROJECT_STATE_PATH):
+        return stats.empty_project_state()
+    with s3.open(PROJECT_STATE_PATH) as f:
+        return json.load(f)
 
 
 @prefect.task
-def summarize_project_fires(
-    opr_id: str, nifc_perimeters: geopandas.GeoDataFrame
-) -> geopandas.GeoDataFrame:
-    """[summary]
+def update_project_state(
+    previous_state: dict,
+    candidate_fires: dict,
+    nifc_perimeters: geopandas.GeoDataFrame,
+    resolution: float = None,
+) -> dict:
+    """Recompute the projects whose inputs changed, see `stats.update_project_state`
 
     Arguments:
-        nifc_perimeters {geopandas.GeoDataFrame} -- [description]
-        proj_geom {geopandas.GeoDataFrame} -- [description]
-
-    Returns:
-        geopandas.GeoDataFrame -- [description]
+        resolution {float} -- if set, estimate burned area on a raster grid of this many
+            meters instead (see `raster.summarize_projects_raster`)
     """
-    proj_geom = utils.load_project_geometry(opr_id)
-    intersecting_fire_idxs = nifc_perimeters.sindex.query(
-        proj_geom.geometry[0], predicate='intersects'
+    return stats.update_project_state(
+        previous_state,
+        candidate_fires,
+        nifc_perimeters,
+        summarize=get_summarize(resolution),
+        settings={'resolution': resolution, 'geometries': canonical.artifact_identity()},
     )
-    if len(intersecting_fire_idxs) > 0:
-        project_fires = nifc_perimeters.iloc[intersecting_fire_idxs]
-        # prevent double counting burned area
-        fire_geom = project_fires.unary_union.buffer(0)
-        burned_area = proj_geom.intersection(fire_geom).area.sum()
-        burned_frac = burned_area / proj_geom.area.sum()
-        fires_summary = get_fire_metadata(project_fires)
-        if burned_area > 4046.86 * 50: # fifty acre minimum
-            return {
-                'opr_id': opr_id,
-                'burned_area': burned_area,
-                'burned_fraction': round(burned_frac, 3),
-                'fires': fires_summary,
-            }
-        else:
-            return None
+
+
+def get_summarize(resolution: float = None):
+    """The burned area engine: exact, or raster if a `resolution` is given"""
+    if not resolution:
+        return stats.summarize_projects
+    return functools.partial(raster.summarize_projects_raster, resolution=resolution)
+
+
+@prefect.task
+def get_project_results(project_state: dict) -> list:
+    """Summaries of projects with more than fifty acres burned, in candidate order"""
+    # copy so that annotating results downstream doesn't leak into the persisted state
+    return [
+        copy.deepcopy(project['result'])
+        for project in project_state['projects'].values()
+        if project['result'] is not None
+    ]
 
 
 @prefect.task
-def append_inciweb_urls(project_fires):
-    inciweb_uris = utils.get_inciweb_uris()
+def save_project_state(project_state: dict, incremental: bool, as_of=None):
+    """Persist the state for the next incremental run
+
+    Only runs on the latest snapshot advance the shared state; a historical `as_of` run
+    must not replace it with an older snapshot's.
+    """
+    if not incremental:
+        return
+    if as_of:
+        prefect.context.get('logger').info(f'Not saving project state of historical run {as_of}')
+        return
+    s3 = fsspec.filesystem('s3', anon=False)
+    with s3.open(PROJECT_STATE_PATH, 'w') as f:
+        json.dump(project_state, f)
 
+
+@prefect.task
+def get_inciweb_index() -> inciweb.InciWebIndex:
+    return inciweb.load_inciweb_index()
+
+
+@prefect.task
+def append_inciweb_urls(project_fires, inciweb_index: inciweb.InciWebIndex):
     annotated_fires = {}
     for k, v in project_fires['fires'].items():
-        match = process.extractOne(v['name'], inciweb_uris.keys(), score_cutoff=90)
-        inciweb_link = None
-        if match is not None:
-            inciweb_link = 'https://inciweb.nwcg.gov' + inciweb_uris[match[0]]
-        v['url'] = inciweb_link
+        v['url'] = inciweb_index.match(v['name'])
         annotated_fires[k] = v
     project_fires['fires'] = annotated_fires
     return project_fires
@@ -123,24 +136,26 @@ def write_state_as_of(as_of, annotated_projects: list):
             json.dump(to_write, f)
 
 
-filter_project_results = FilterTask(filter_func=lambda x: x is not None)
-
 with Flow('project-stats') as flow:
     as_of = DateTimeParameter(name='as_of', required=False)
-    nifc_perimeters = nifc.load_nifc_asof(as_of)
+    nifc_perimeters = nifc.load_nifc_asof(as_of, profile='stats')
 
-    all_proj_geoms = geometry.load_all_project_geometries()
-    proj_hulls = geometry.get_project_convex_hulls(all_proj_geoms)
+    project_index = geometry.load_project_index()
 
-    candidate_opr_ids = get_candidate_opr_ids(nifc_perimeters, proj_hulls)
-    project_fires = summarize_project_fires.map(
-        candidate_opr_ids, prefect.unmapped(nifc_perimeters)
+    incremental = Parameter(name='incremental', default=True)
+    previous_state = load_project_state(incremental)
+    candidate_fires = get_candidate_fires(nifc_perimeters, project_index)
+    resolution = Parameter(name='resolution', default=None)
+    project_state = update_project_state(
+        previous_state, candidate_fires, nifc_perimeters, resolution
     )
-    filtered_projects = filter_project_results(project_fires)
-    appended = append_inciweb_urls.map(filtered_projects)
-    write_state_as_of(as_of, appended)
-    write_state_as_of(None, appended)
+    project_fires = get_project_results(project_state)
+    inciweb_index = get_inciweb_index()
+    appended = append_inciweb_urls.map(project_fires, unmapped(inciweb_index))
+    written = [write_state_as_of(as_of, appended), write_state_as_of(None, appended)]
+    save_project_state(project_state, incremental, as_of, upstream_tasks=written)
 
+profiling.instrument_flow(flow)
 flow.run_config = prefect.run_configs.KubernetesRun(
-    image='carbonplan/fire-monitor-prefect:2022.06.06'
+    image='quay.io/carbonplan/forest-offsets-fires:latest'
 )
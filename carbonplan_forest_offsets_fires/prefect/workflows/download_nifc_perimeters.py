@@ -1,16 +1,32 @@
+import collections
 import datetime
+import itertools
+import json
+import os
+import tempfile
+import time
 import urllib
+from concurrent.futures import ThreadPoolExecutor
 
 import fsspec
 import geopandas
-import pandas as pd
 import prefect
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import requests
+import shapely
 from prefect.storage import S3
+from prefect.utilities.logging import get_logger
+
+from carbonplan_forest_offsets_fires import catalog, profiling
+from carbonplan_forest_offsets_fires.prefect.tasks import nifc
 
 CRS = '+proj=aea +lat_0=23 +lon_0=-96 +lat_1=29.5 +lat_2=45.5 +x_0=0 +y_0=0 +ellps=WGS84 +towgs84=0,0,0,0,0,0,0 +units=m +no_defs +type=crs'  # noqa
 UPLOAD_TO = 's3://carbonplan-forest-offsets/fires/nifc-data'
 
+logger = get_logger('nifc')
+
 schedule = prefect.schedules.IntervalSchedule(interval=datetime.timedelta(hours=3))
 
 NIFC_ENDPOINT = (
@@ -19,68 +35,359 @@ NIFC_ENDPOINT = (
 )
 
 
+MAX_WORKERS = 8
+MAX_RETRIES = 4
+MISSING_IDS_PER_REQUEST = 200  # ids go in the url
+HIGH_WATER_MARK_OVERLAP = datetime.timedelta(hours=1)
+
+ESRI_TO_ARROW = {
+    'esriFieldTypeOID': pa.int64(),
+    'esriFieldTypeSmallInteger': pa.int64(),
+    'esriFieldTypeInteger': pa.int64(),
+    'esriFieldTypeBigInteger': pa.int64(),
+    'esriFieldTypeSingle': pa.float64(),
+    'esriFieldTypeDouble': pa.float64(),
+    'esriFieldTypeDate': pa.int64(),  # epoch milliseconds in geojson responses
+    'esriFieldTypeString': pa.string(),
+    'esriFieldTypeGUID': pa.string(),
+    'esriFieldTypeGlobalID': pa.string(),
+}
+
+
 def get_fire_url(url):
     fires = geopandas.read_file(f'GeoJSON:{url}').to_crs(CRS).reset_index(drop=True)
     return fires
 
 
-@prefect.task
-def get_nifc_perimeter_count():
-    """Return count of perimeters in nifc dataset to enable pagination
-    Previously, we used a static download provided by NIFC, which could go stale.
-    Now, we"re hitting the underlying database (per NIFC suggestion)
+def get_fire_page(url: str, max_retries: int = MAX_RETRIES):
+    """Fetch one page of perimeters, retrying with exponential backoff"""
+    for attempt in range(max_retries + 1):
+        try:
+            return get_fire_url(url)
+        except Exception as err:
+            if attempt == max_retries:
+                raise
+            logger.warning(f'Retrying {url} after error: {err}')
+            time.sleep(2**attempt)
+
+
+def get_layer_info() -> dict:
+    """FeatureServer layer description (fields, edit tracking, etc.)"""
+    r = requests.get(NIFC_ENDPOINT.rsplit('/', 1)[0], params={'f': 'pjson'})
+    r.raise_for_status()
+    return r.json()
+
+
+def get_perimeter_schema(layer_info: dict = None) -> pa.Schema:
+    """Arrow schema of the perimeter layer, derived from the FeatureServer field list
+
+    Types can't be inferred page by page: a column that is all null on one page and
+    populated on the next would otherwise produce pages with incompatible schemas.
     """
-    params = {'where': 'OBJECTID >0', 'returnCountOnly': 'true', 'f': 'pjson'}
-    r = requests.get(NIFC_ENDPOINT, params=params)
-    return r.json()['count']
+    layer_info = layer_info or get_layer_info()
+    fields = [
+        pa.field(field['name'], ESRI_TO_ARROW.get(field['type'], pa.string()))
+        for field in layer_info['fields']
+        if field['type'] != 'esriFieldTypeGeometry'
+    ]
+    geo = {
+        'version': '1.0.0',
+        'primary_column': 'geometry',
+        'columns': {
+            'geometry': {
+                'encoding': 'WKB',
+                'geometry_types': [],
+                'crs': geopandas.GeoSeries(crs=CRS).crs.to_json_dict(),
+            }
+        },
+    }
+    return pa.schema(
+        fields + [pa.field('geometry', pa.binary())], metadata={'geo': json.dumps(geo)}
+    )
 
 
-@prefect.task
-def get_paginated_fire_urls(record_count, request_size=1_000):
-    """Generate urls for grabbing all NIFC data.
+def perimeters_to_arrow(perimeters: geopandas.GeoDataFrame, schema: pa.Schema) -> pa.Table:
+    """Convert perimeters to an arrow table (WKB geometry) matching `schema`"""
+    columns = []
+    for field in schema:
+        if field.name == 'geometry':
+            array = pa.array(shapely.to_wkb(perimeters.geometry.values), type=pa.binary())
+        elif field.name in perimeters:
+            array = pa.array(perimeters[field.name], from_pandas=True).cast(field.type)
+        else:
+            array = pa.nulls(len(perimeters), type=field.type)
+        columns.append(array)
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def write_perimeter_pages(pages, path: str, schema: pa.Schema) -> int:
+    """Write an iterable of perimeter GeoDataFrames to one parquet file, a row group per page
+
+    Returns:
+        int -- number of records written
+    """
+    record_count = 0
+    with pq.ParquetWriter(path, schema, compression='gzip') as writer:
+        for page in pages:
+            writer.write_table(perimeters_to_arrow(page, schema))
+            record_count += len(page)
+    return record_count
+
+
+def query_nifc(**params) -> dict:
+    r = requests.get(NIFC_ENDPOINT, params={'f': 'pjson', **params})
+    r.raise_for_status()
+    return r.json()
+
+
+def fire_page_url(where='OBJECTID > 0', request_size=1_000, offset=0) -> str:
+    """Url of one page of NIFC records matching `where`.
     Geopandas doesnt support requests-style params,
     so it"s easier to just premake the urls
     """
-    record_offsets = range(1, record_count, request_size)
-
-    base_params = {
+    params = {
         'f': 'geojson',
-        'where': 'OBJECTID > 0',
+        'where': where,
+        'orderByFields': 'OBJECTID',  # pagination is only stable with an explicit order
         'resultRecordCount': request_size,
         'returnGeometry': 'true',
         'outFields': '*',
+        'resultOffset': offset,
     }
+    return NIFC_ENDPOINT + '?' + urllib.parse.urlencode(params)
+
 
-    base_url = (
-        NIFC_ENDPOINT + '?'
-    )  # not sure if can go through `params` but this allows to encode url directly
-    urls = [
-        base_url + urllib.parse.urlencode(base_params) + f'&resultOffset={record_offset}'  # noqa
-        for record_offset in record_offsets
+def paginated_fire_urls(record_count, request_size=1_000, where='OBJECTID > 0'):
+    """Generate urls for grabbing `record_count` NIFC records matching `where`"""
+    return [
+        fire_page_url(where, request_size=request_size, offset=offset)
+        for offset in range(0, record_count, request_size)
     ]
-    return urls
+
+
+def iter_fire_pages(
+    record_count, request_size=1_000, where='OBJECTID > 0', max_workers=MAX_WORKERS
+):
+    """Fetch pages with a bounded pool of threads, yielding them in order
+
+    `record_count` only plans the concurrent requests. Records added since it was taken
+    are picked up by paging on until a page comes back short.
+    """
+    urls = iter(paginated_fire_urls(record_count, request_size=request_size, where=where))
+    page = None
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = collections.deque(
+            pool.submit(get_fire_page, url) for url in itertools.islice(urls, 2 * max_workers)
+        )
+        while pending:
+            page = pending.popleft().result()
+            for url in itertools.islice(urls, 1):
+                pending.append(pool.submit(get_fire_page, url))
+            yield page
+
+    offset = -(-record_count // request_size) * request_size
+    while page is None or len(page) == request_size:
+        page = get_fire_page(fire_page_url(where, request_size=request_size, offset=offset))
+        offset += request_size
+        yield page
+
+
+def iter_perimeters(record_count, request_size=1_000, where='OBJECTID > 0'):
+    """Yield every record matching `where` once, tolerating edits made while paging
+
+    Deleting a record shifts every later record back an offset, so a page can repeat
+    records of the previous one or skip past records entirely. Repeats are dropped by
+    OBJECTID and skipped records are fetched by id once paging is done.
+    """
+    seen = set()
+
+    def unseen(page):
+        if page.empty:
+            return page
+        page = page[~page['OBJECTID'].isin(seen)]
+        seen.update(page['OBJECTID'])
+        return page
+
+    for page in iter_fire_pages(record_count, request_size=request_size, where=where):
+        yield unseen(page)
+
+    missing = query_object_ids(where) - seen
+    if missing:
+        logger.info(f'Fetching {len(missing)} perimeters skipped while paging')
+    for page in iter_perimeters_by_id(missing):
+        yield unseen(page)
+
+
+def query_object_ids(where='OBJECTID > 0') -> set:
+    return set(query_nifc(where=where, returnIdsOnly='true')['objectIds'] or [])
+
+
+def iter_perimeters_by_id(object_ids):
+    """Fetch specific records, a few hundred ids per request"""
+    object_ids = sorted(object_ids)
+    for i in range(0, len(object_ids), MISSING_IDS_PER_REQUEST):
+        chunk = object_ids[i : i + MISSING_IDS_PER_REQUEST]
+        where = f"OBJECTID IN ({','.join(str(object_id) for object_id in chunk)})"
+        yield get_fire_page(fire_page_url(where, request_size=len(chunk)))
+
+
+def read_perimeter_pages(f, request_size=1_000):
+    """Iterate over a perimeter parquet file `request_size` records at a time"""
+    parquet = pq.ParquetFile(f)
+    crs = json.loads(parquet.schema_arrow.metadata[b'geo'])['columns']['geometry'].get('crs')
+    for batch in parquet.iter_batches(batch_size=request_size):
+        page = batch.to_pandas()
+        geometry = geopandas.GeoSeries.from_wkb(page.pop('geometry'), crs=crs)
+        yield geopandas.GeoDataFrame(page, geometry=geometry)
+
+
+def make_perimeters_tempfile() -> str:
+    fd, path = tempfile.mkstemp(suffix='_raw_nifc_perimeters.parquet')
+    os.close(fd)
+    return path
+
+
+def write_perimeters_tempfile(pages, schema: pa.Schema) -> tuple:
+    """Write perimeter pages to a new local parquet file, removing it if writing fails
+
+    Returns:
+        tuple -- path of the local parquet file, number of records written
+    """
+    path = make_perimeters_tempfile()
+    written = None
+    try:
+        written = write_perimeter_pages(pages, path, schema)
+    finally:
+        if written is None:
+            os.remove(path)
+    return path, written
+
+
+def download_perimeters(record_count, request_size=1_000, layer_info=None) -> str:
+    """Download all pages and stream them into a local parquet file
+
+    Pages are written in order as they arrive, so peak memory is a handful of pages
+    regardless of how many perimeters there are. `record_count` can drift while paging;
+    the file holds whatever the layer contains once paging is done.
+
+    Returns:
+        str -- path of the local parquet file
+    """
+    pages = iter_perimeters(record_count, request_size=request_size)
+    path, written = write_perimeters_tempfile(pages, get_perimeter_schema(layer_info))
+    if written != record_count:
+        logger.info(f'Counted {record_count} perimeters, downloaded {written}')
+    return path
+
+
+def iter_updated_perimeters(previous_fn: str, edited_pages, current_ids: set, request_size=1_000):
+    """Yield edited records, then the previous records that are current and weren't edited
+
+    Records are matched on OBJECTID, the only field the layer keeps unique. Current
+    records found in neither (e.g. edited just before the high-water mark overlap) are
+    fetched by id, so the result holds every current record exactly once.
+    """
+    updated = set()
+    for page in edited_pages:
+        if not page.empty:
+            page = page[~page['OBJECTID'].isin(updated)]
+            updated.update(page['OBJECTID'])
+        yield page
+
+    kept = previous_count = 0
+    with fsspec.open(previous_fn) as f:
+        for page in read_perimeter_pages(f, request_size=request_size):
+            previous_count += len(page)
+            page = page[page['OBJECTID'].isin(current_ids) & ~page['OBJECTID'].isin(updated)]
+            updated.update(page['OBJECTID'])
+            kept += len(page)
+            yield page
+    logger.info(f'Replaced or dropped {previous_count - kept} of {previous_count} perimeters')
+
+    missing = current_ids - updated
+    if missing:
+        logger.info(f'Fetching {len(missing)} perimeters missing from the previous snapshot')
+    yield from iter_perimeters_by_id(missing)
+
+
+def update_perimeters(previous_fn: str, request_size=1_000) -> str:
+    """Bring a previous snapshot up to date by only downloading edited perimeters
+
+    Records edited since the previous snapshot's high-water mark (minus some overlap)
+    replace the previous records with the same OBJECTID. Records that no longer exist are
+    found with a cheap ids-only query and dropped. Edited pages and the previous snapshot
+    are both streamed, so peak memory is a handful of pages.
+
+    Returns:
+        str -- path of a local parquet file with the same schema as a full download
+    """
+    layer_info = get_layer_info()
+    edit_field = (layer_info.get('editFieldsInfo') or {}).get('editDateField')
+    if not edit_field:
+        raise ValueError('Perimeter layer does not track edit dates')
+
+    with fsspec.open(previous_fn) as f:
+        edited_at = pq.read_table(f, columns=[edit_field])[edit_field]
+    high_water_mark = datetime.datetime.fromtimestamp(
+        pc.max(edited_at).as_py() / 1000, tz=datetime.timezone.utc
+    )
+    since = (high_water_mark - HIGH_WATER_MARK_OVERLAP).strftime('%Y-%m-%d %H:%M:%S')
+    where = f"OBJECTID > 0 AND {edit_field} >= TIMESTAMP '{since}'"
+
+    current_ids = query_object_ids()
+    edited_count = query_nifc(where=where, returnCountOnly='true')['count']
+    logger.info(f'{edited_count} perimeters edited since {since}')
+    edited_pages = iter_perimeters(edited_count, request_size=request_size, where=where)
+    pages = iter_updated_perimeters(previous_fn, edited_pages, current_ids, request_size)
+    path, _ = write_perimeters_tempfile(pages, get_perimeter_schema(layer_info))
+    return path
 
 
 @prefect.task
-def get_nifc_perimeters(fire_urls):
-    fires = pd.concat([get_fire_url(fire_url) for fire_url in fire_urls]).reset_index(
-        drop=True
-    )  # noqa
-    return fires
+def get_nifc_perimeter_count():
+    """Return count of perimeters in nifc dataset to enable pagination
+    Previously, we used a static download provided by NIFC, which could go stale.
+    Now, we"re hitting the underlying database (per NIFC suggestion)
+    """
+    return query_nifc(where='OBJECTID >0', returnCountOnly='true')['count']
+
+
+@prefect.task
+def get_latest_nifc_perimeters(record_count, incremental=True) -> str:
+    """Download perimeters, incrementally updating the last snapshot if possible
+
+    Falls back to a full download if the update fails for any reason, e.g. there is no
+    previous snapshot, it can't be read or the layer doesn't track edits.
+    """
+    if incremental:
+        try:
+            previous_fn = nifc.get_nifc_filename(nifc.NIFC_BUCKET)
+            return update_perimeters(previous_fn)
+        except Exception as err:
+            logger.warning(f'Incremental update failed, downloading everything: {err}')
+    return download_perimeters(record_count)
 
 
 @prefect.task
-def save_nifc_perimeters(perimeters):
-    now = datetime.datetime.utcnow().isoformat()
-    with fsspec.open(f'{UPLOAD_TO}/{now}_raw_nifc_perimeters.parquet', mode='wb') as f:
-        perimeters.to_parquet(f, compression='gzip')
+def save_nifc_perimeters(perimeters_path):
+    """Upload a snapshot, then record it in the snapshot catalog"""
+    now = datetime.datetime.utcnow()
+    path = f'{UPLOAD_TO}/{now.isoformat()}_raw_nifc_perimeters.parquet'
+    entry = catalog.describe_snapshot(perimeters_path, path, now)
+    fs = fsspec.filesystem('s3', anon=False)
+    fs.put(perimeters_path, path)
+    # only catalog snapshots that were uploaded
+    catalog.append_snapshot(entry)
+    os.remove(perimeters_path)
 
 
 with prefect.Flow('get-nifc-perimeters') as flow:
+    incremental = prefect.Parameter('incremental', default=True)
     record_count = get_nifc_perimeter_count()
-    urls = get_paginated_fire_urls(record_count)
-    perimeters = get_nifc_perimeters(urls)
-    save_nifc_perimeters(perimeters)
+    perimeters_path = get_latest_nifc_perimeters(record_count, incremental)
+    save_nifc_perimeters(perimeters_path)
+
+profiling.instrument_flow(flow)
 
 
 env = {
@@ -91,6 +398,6 @@ env = {
 flow.storage = S3(bucket='carbonplan-prefect')
 flow.run_config = prefect.run_configs.KubernetesRun(
     labels=['gcp-us-central1-b'],
-    image='carbonplan/fire-monitor-prefect:2022.06.06',
+    image='quay.io/carbonplan/forest-offsets-fires:latest',
     env=env,  # noqa
 )
@@ -1,87 +1,26 @@
 import json
 import pathlib
-from datetime import timedelta
 
-import censusgeocode as cg
 import fsspec
 import geopandas
 import prefect
 import shapely
-from carbonplan_forest_offsets.load.issuance import load_issuance_table
 
-from carbonplan_forest_offsets_fires import utils
+from carbonplan_forest_offsets_fires import canonical, profiling, reference
+from carbonplan_forest_offsets_fires.geocode import CountyGeocoder, us_state_abbrev  # noqa
 from carbonplan_forest_offsets_fires.prefect.tasks.geometry import (
-    buffer_geometry,
-    load_simplified_geometry,
+    buffer_geometries,
+    simplify_project_geometries,
 )
 
-us_state_abbrev = {
-    'Alabama': 'AL',
-    'Alaska': 'AK',
-    'American Samoa': 'AS',
-    'Arizona': 'AZ',
-    'Arkansas': 'AR',
-    'California': 'CA',
-    'Colorado': 'CO',
-    'Connecticut': 'CT',
-    'Delaware': 'DE',
-    'District of Columbia': 'DC',
-    'Florida': 'FL',
-    'Georgia': 'GA',
-    'Guam': 'GU',
-    'Hawaii': 'HI',
-    'Idaho': 'ID',
-    'Illinois': 'IL',
-    'Indiana': 'IN',
-    'Iowa': 'IA',
-    'Kansas': 'KS',
-    'Kentucky': 'KY',
-    'Louisiana': 'LA',
-    'Maine': 'ME',
-    'Maryland': 'MD',
-    'Massachusetts': 'MA',
-    'Michigan': 'MI',
-    'Minnesota': 'MN',
-    'Mississippi': 'MS',
-    'Missouri': 'MO',
-    'Montana': 'MT',
-    'Nebraska': 'NE',
-    'Nevada': 'NV',
-    'New Hampshire': 'NH',
-    'New Jersey': 'NJ',
-    'New Mexico': 'NM',
-    'New York': 'NY',
-    'North Carolina': 'NC',
-    'North Dakota': 'ND',
-    'Northern Mariana Islands': 'MP',
-    'Ohio': 'OH',
-    'Oklahoma': 'OK',
-    'Oregon': 'OR',
-    'Pennsylvania': 'PA',
-    'Puerto Rico': 'PR',
-    'Rhode Island': 'RI',
-    'South Carolina': 'SC',
-    'South Dakota': 'SD',
-    'Tennessee': 'TN',
-    'Texas': 'TX',
-    'Utah': 'UT',
-    'Vermont': 'VT',
-    'Virgin Islands': 'VI',
-    'Virginia': 'VA',
-    'Washington': 'WA',
-    'West Virginia': 'WV',
-    'Wisconsin': 'WI',
-    'Wyoming': 'WY',
-}
-
 
 def get_centroids(gdf):
     crs = '+proj=aea +lat_0=23 +lon_0=-96 +lat_1=29.5 +lat_2=45.5 +x_0=0 +y_0=0 +ellps=WGS84 +towgs84=0,0,0,0,0,0,0 +units=m +no_defs +type=crs'  # noqa
     geom = gdf.to_crs(crs).simplify(8000).buffer(8000).to_crs('lonlat').geometry.item()
 
     if isinstance(geom, shapely.geometry.multipolygon.MultiPolygon):
-        areas = [g.area for g in geom]
-        centroids = [[g.centroid.x, g.centroid.y] for g in geom]
+        areas = [g.area for g in geom.geoms]
+        centroids = [[g.centroid.x, g.centroid.y] for g in geom.geoms]
         # sort by area (largest first)
         centroids = [x for _, x in sorted(zip(areas, centroids), reverse=True)]
     elif isinstance(geom, shapely.geometry.polygon.Polygon):
@@ -93,22 +32,18 @@ def get_centroids(gdf):
 
 @prefect.task
 def load_issuance_to_date():
-    issuance = load_issuance_table(most_recent=True)
-    issuance_to_date = issuance.groupby('arb_id')['allocation'].sum().to_dict()
-    return issuance_to_date
+    return reference.issuance_totals()
 
 
 @prefect.task
 def get_project_area(opr_id):
-    geom = utils.load_project_geometry(opr_id)
-    return int(round((geom.area / 4046.86).item()))
+    geom = canonical.load_project_geometries([opr_id])
+    return int(round(geom.area.sum() / 4046.86))
 
 
 @prefect.task
 def load_arbid_map():
-    issuance = load_issuance_table(most_recent=True)
-    df = issuance[['opr_id', 'arb_id']].set_index('arb_id').copy()
-    return df.opr_id.to_dict()
+    return reference.arb_id_to_opr_id()
 
 
 @prefect.task
@@ -120,15 +55,13 @@ def load_display_names():
     return {x['arb_id']: x['name'] for x in display_names}
 
 
-@prefect.task(max_retries=3, retry_delay=timedelta(seconds=5))
-def get_location_name(coords):
-    results = cg.coordinates(x=coords[0], y=coords[1])
-    name = (
-        results['Counties'][0]['NAME']
-        + ', '
-        + us_state_abbrev[results['States'][0]['NAME']]  # noqa
-    )  # noqa
-    return name
+@prefect.task
+def get_location_names(centroids: list) -> list:
+    """Resolve all project centroids to "County, ST" in one offline batch
+
+    The Census geocoder API is only queried for centroids outside every county boundary.
+    """
+    return CountyGeocoder().reverse(centroids)
 
 
 @prefect.task
@@ -148,9 +81,10 @@ def get_arb_ids(display_names: dict) -> list:
 
 
 @prefect.task
-def get_centroid(gdf: geopandas.GeoDataFrame) -> list:
-    centroids = get_centroids(gdf)
-    return centroids[0]
+def get_project_centroids(gdf: geopandas.GeoDataFrame, opr_ids: list) -> list:
+    """Centroid of the largest part of each project, in `opr_ids` order"""
+    by_opr_id = gdf.set_index('opr_id', drop=False)
+    return [get_centroids(by_opr_id.loc[[opr_id]])[0] for opr_id in opr_ids]
 
 
 @prefect.task
@@ -176,7 +110,7 @@ def construct_record(
 @prefect.task
 def write_results(records: list):
     with fsspec.open('s3://carbonplan-forest-offsets/web/display-data.json', 'w') as f:
-        ea_opr_ids = utils.list_all_ea_opr_ids()
+        ea_opr_ids = reference.ea_opr_ids()
         to_write = [record for record in records if record['opr_id'] not in ea_opr_ids]
         json.dump(to_write, f)
 
@@ -189,17 +123,18 @@ with prefect.Flow('generate-display-data') as flow:
     arb_ids = get_arb_ids(display_names)
     opr_ids = get_opr_id.map(arb_ids, prefect.unmapped(arbid_to_oprid))
 
-    geometries = load_simplified_geometry.map(opr_ids)
-    buffered = buffer_geometry.map(geometries, prefect.unmapped(30))
-    centroids = get_centroid.map(buffered)
+    geometries = simplify_project_geometries(opr_ids)
+    buffered = buffer_geometries(geometries, 30)
+    centroids = get_project_centroids(buffered, opr_ids)
 
     arbocs = get_arbocs_to_date.map(arb_ids, prefect.unmapped(arbocs_to_date))
     project_areas = get_project_area.map(opr_ids)
     display_names = get_display_name.map(arb_ids, prefect.unmapped(display_names))
-    location_names = get_location_name.map(centroids)
+    location_names = get_location_names(centroids)
     records = construct_record.map(
         opr_ids, display_names, arbocs, project_areas, centroids, location_names
     )
     write_results(records)
 
+profiling.instrument_flow(flow)
 flow.executor = prefect.executors.LocalDaskExecutor(scheduler='processes', num_workers=2)  # noqa
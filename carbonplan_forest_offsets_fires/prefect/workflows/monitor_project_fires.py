@@ -1,55 +1,78 @@
-import csv
 import datetime
 import os
 from typing import Union
 
-import geopandas
+import numpy as np
+import pandas as pd
 import prefect
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyproj
 import requests
+import shapely
 
+from carbonplan_forest_offsets_fires import profiling, sindex
 from carbonplan_forest_offsets_fires.prefect.tasks import geometry
 
 schedule = prefect.schedules.IntervalSchedule(interval=datetime.timedelta(hours=8))
 
 
 @prefect.task
-def get_active_fires() -> geopandas.GeoDataFrame:
+def get_active_fires() -> pd.DataFrame:
     """load NOAA viirs active fire points
 
     Returns:
-        geopandas.GeoDataFrame -- [description]
+        pd.DataFrame -- `x` and `y` coordinates of each fire pixel, in epsg:5070
     """
 
     url = 'https://firms.modaps.eosdis.nasa.gov/data/active_fire/noaa-20-viirs-c2/csv/J1_VIIRS_C2_USA_contiguous_and_Hawaii_24h.csv'  # noqa
     r = requests.get(url)
-    records = csv.DictReader(r.text.splitlines())
-    lats = []
-    lons = []
-    for record in records:
-        lats.append(float(record['latitude']))
-        lons.append(float(record['longitude']))
-
-    geoms = geopandas.points_from_xy(lons, lats, crs='epsg:4326')
-    gdf = geopandas.GeoDataFrame(geometry=geoms)
-    gdf = gdf.to_crs('epsg:5070')
-    return gdf
+    table = pa_csv.read_csv(
+        pa.BufferReader(r.content),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=['latitude', 'longitude'],
+            column_types={'latitude': pa.float64(), 'longitude': pa.float64()},
+        ),
+    )
+    transformer = pyproj.Transformer.from_crs('epsg:4326', 'epsg:5070', always_xy=True)
+    x, y = transformer.transform(table['longitude'].to_numpy(), table['latitude'].to_numpy())
+    return pd.DataFrame({'x': x, 'y': y})
 
 
 @prefect.task
 def get_active_fires_by_project(
-    project_geoms: geopandas.GeoDataFrame, active_fires: geopandas.GeoDataFrame
+    project_index: sindex.ProjectIndex, active_fires: pd.DataFrame
 ) -> Union[None, dict]:
-    """[summary]
+    """Count active fire pixels falling within each project
+
+    Points are pruned in increasingly expensive stages: the packed bounding boxes of the
+    project index (plain array comparisons), then project convex hulls, and only the
+    remaining point/project pairs are tested against the full project geometries. Hulls
+    and geometries are decoded from the index only for projects that survive the
+    previous stage.
 
     Arguments:
-        project_geoms {geopandas.GeoDataFrame} -- [description]
-        active_fires {geopandas.GeoDataFrame} -- [description]
+        project_index {sindex.ProjectIndex} -- spatial index of project geometries
+        active_fires {pd.DataFrame} -- fire pixel coordinates, from `get_active_fires`
 
     Returns:
-        dict -- [description]
+        dict -- opr_id -> number of fire pixels
     """
-    intersection = geopandas.sjoin(active_fires, project_geoms)
-    fire_counts = intersection['opr_id'].value_counts().to_dict()
+    points = shapely.points(active_fires['x'].to_numpy(), active_fires['y'].to_numpy())
+    point_idx, position = project_index.query(points, predicate=None)
+    n_bbox = len(np.unique(point_idx))
+
+    in_hull = shapely.intersects(project_index.hulls(position), points[point_idx])
+    point_idx, position = point_idx[in_hull], position[in_hull]
+    n_hull = len(np.unique(point_idx))
+
+    hits = shapely.intersects(project_index.geometries(position), points[point_idx])
+    print(
+        f'{len(points)} fire pixels, {n_bbox} in project bboxes, '
+        f'{n_hull} in project hulls, {len(np.unique(point_idx[hits]))} in projects'
+    )
+
+    fire_counts = pd.Series(project_index.opr_ids[position[hits]]).value_counts().to_dict()
     return fire_counts
 
 
@@ -87,13 +110,14 @@ def send_slack_alert(message):
 
 with prefect.Flow('monitor-project-fires', schedule=schedule) as flow:
     active_fires = get_active_fires()
-    project_geoms = geometry.load_all_project_geometries()
-    fire_counts = get_active_fires_by_project(project_geoms, active_fires)
+    project_index = geometry.load_project_index()
+    fire_counts = get_active_fires_by_project(project_index, active_fires)
     send_messages = check_send_messages(fire_counts)
     with prefect.case(send_messages, True):
         messages = generate_slack_messages(fire_counts)
         send_slack_alert.map(messages)
 
+profiling.instrument_flow(flow)
 flow.run_config = prefect.run_configs.KubernetesRun(
-    image='carbonplan/fire-monitor-prefect:2022.06.06'
+    image='quay.io/carbonplan/forest-offsets-fires:latest'
 )
@@ -0,0 +1,232 @@
+"""Per-task timing, memory, I/O and feature-count instrumentation for prefect flows
+
+Instrumentation is attached to every task of a flow with `instrument_flow(flow)` and is
+switched on at run time by pointing `FOREST_OFFSETS_FIRES_PROFILE_DIR` at a directory;
+when it's unset, instrumented tasks only pay for one environment lookup. Each process
+appends one JSON record per task run to `{dir}/{flow_run_id}/tasks-{pid}.jsonl`, and the
+records are collected into `profile.parquet` when the flow run finishes.
+
+Setting `FOREST_OFFSETS_FIRES_PROFILE_CPROFILE` to a number of seconds also runs every
+task under cProfile and keeps a `.prof` dump for task runs that took at least that long.
+Setting `FOREST_OFFSETS_FIRES_PROFILE_UPLOAD_TO` to an fsspec url copies the collected
+profile and dumps there, since local disks don't outlive Kubernetes pods.
+
+Memory and I/O are read from /proc, so they are process-wide: with a threaded executor,
+tasks running at the same time share their peak RSS and bytes read/written.
+"""
+import cProfile
+import datetime
+import functools
+import json
+import os
+import resource
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import fsspec
+import numpy as np
+import pandas as pd
+import prefect
+import shapely
+
+PROFILE_DIR_ENV = 'FOREST_OFFSETS_FIRES_PROFILE_DIR'
+CPROFILE_ENV = 'FOREST_OFFSETS_FIRES_PROFILE_CPROFILE'
+UPLOAD_ENV = 'FOREST_OFFSETS_FIRES_PROFILE_UPLOAD_TO'
+
+_lock = threading.Lock()
+
+
+def _profile_dir():
+    return os.environ.get(PROFILE_DIR_ENV)
+
+
+def _run_dir(profile_dir: str) -> Path:
+    run_id = prefect.context.get('flow_run_id') or 'local'
+    return Path(profile_dir) / run_id
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the process' peak RSS (VmHWM), if the kernel lets us"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss() -> int:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _io_counters() -> dict:
+    """Bytes read and written by this process, including sockets (so S3 traffic too)"""
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return {'read': int(counters['rchar']), 'written': int(counters['wchar'])}
+    except (OSError, KeyError, ValueError):
+        return {'read': 0, 'written': 0}
+
+
+def _children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def count_features(obj):
+    """Number of features in a task input or output, or None if it isn't a collection"""
+    if isinstance(obj, shapely.Geometry):
+        return int(shapely.get_num_geometries(obj))
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray, list, tuple, dict, set)):
+        return len(obj)
+    return None
+
+
+def _total_features(objs):
+    counts = [c for c in map(count_features, objs) if c is not None]
+    return sum(counts) if counts else None
+
+
+def _write_record(run_dir: Path, record: dict):
+    run_dir.mkdir(parents=True, exist_ok=True)
+    line = json.dumps(record, default=str) + '\n'
+    with _lock, open(run_dir / f'tasks-{os.getpid()}.jsonl', 'a') as f:
+        f.write(line)
+
+
+def profiled(fn=None, *, name: str = None):
+    """Record wall and CPU time, peak RSS, I/O and feature counts of each call to `fn`
+
+    Can be used as a decorator on plain functions; `instrument_flow` applies it to the
+    `run` method of every task in a flow.
+    """
+    if fn is None:
+        return functools.partial(profiled, name=name)
+    name = name or fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        profile_dir = _profile_dir()
+        if not profile_dir:
+            return fn(*args, **kwargs)
+
+        cprofile_seconds = os.environ.get(CPROFILE_ENV)
+        profiler = cProfile.Profile() if cprofile_seconds else None
+        record = {
+            'flow_name': prefect.context.get('flow_name'),
+            'task': prefect.context.get('task_full_name') or name,
+            'map_index': prefect.context.get('map_index'),
+            'pid': os.getpid(),
+            'thread': threading.current_thread().name,
+            'started_at': datetime.datetime.utcnow().isoformat(),
+            'input_features': _total_features([*args, *kwargs.values()]),
+            'peak_rss_reset': _reset_peak_rss(),
+        }
+        io_before, children_before = _io_counters(), _children_cpu()
+        wall_before, cpu_before = time.perf_counter(), time.thread_time()
+        error = None
+        try:
+            if profiler:
+                result = profiler.runcall(fn, *args, **kwargs)
+            else:
+                result = fn(*args, **kwargs)
+            return result
+        except BaseException as e:
+            result, error = None, type(e).__name__
+            raise
+        finally:
+            wall = time.perf_counter() - wall_before
+            io_after = _io_counters()
+            record.update(
+                {
+                    'wall_seconds': wall,
+                    'cpu_seconds': time.thread_time() - cpu_before,
+                    'subprocess_cpu_seconds': _children_cpu() - children_before,
+                    'peak_rss_mb': _peak_rss() / 2**20,
+                    'read_mb': (io_after['read'] - io_before['read']) / 2**20,
+                    'written_mb': (io_after['written'] - io_before['written']) / 2**20,
+                    'output_features': count_features(result),
+                    'error': error,
+                    'cprofile': None,
+                }
+            )
+            run_dir = _run_dir(profile_dir)
+            if profiler and wall >= float(cprofile_seconds):
+                dump = run_dir / 'cprofile' / f'{record["task"]}-{uuid.uuid4().hex[:8]}.prof'
+                dump.parent.mkdir(parents=True, exist_ok=True)
+                profiler.dump_stats(dump)
+                record['cprofile'] = dump.name
+            _write_record(run_dir, record)
+
+    return wrapper
+
+
+def collect_profile(run_dir: str, upload_to: str = None) -> pd.DataFrame:
+    """Gather the per-process task records of one flow run into `profile.parquet`
+
+    Arguments:
+        run_dir {str} -- directory holding the run's `tasks-*.jsonl` files
+        upload_to {str} -- if set, fsspec url to copy the profile and cProfile dumps to
+
+    Returns:
+        pd.DataFrame -- one row per task run, slowest first
+    """
+    run_dir = Path(run_dir)
+    records = [
+        json.loads(line)
+        for path in sorted(run_dir.glob('tasks-*.jsonl'))
+        for line in path.read_text().splitlines()
+    ]
+    df = pd.DataFrame(records)
+    if len(df):
+        df = df.sort_values('wall_seconds', ascending=False, ignore_index=True)
+    df.to_parquet(run_dir / 'profile.parquet', index=False)
+
+    if upload_to:
+        dst = f'{upload_to.rstrip("/")}/{run_dir.name}'
+        fs, _ = fsspec.core.url_to_fs(dst)
+        fs.put(str(run_dir / 'profile.parquet'), f'{dst}/profile.parquet')
+        dumps = sorted((run_dir / 'cprofile').glob('*.prof'))
+        if dumps:
+            fs.put([str(p) for p in dumps], [f'{dst}/cprofile/{p.name}' for p in dumps])
+    return df
+
+
+def print_profile(df: pd.DataFrame, n: int = 10):
+    """Print the `n` slowest task runs"""
+    columns = ['task', 'wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'read_mb', 'written_mb']
+    print(f'Slowest {min(n, len(df))} of {len(df)} task runs:')
+    print(df[columns].head(n).to_string(index=False, float_format='{:.2f}'.format))
+
+
+def _collect_on_finish(flow, old_state, new_state):
+    profile_dir = _profile_dir()
+    if profile_dir and new_state.is_finished():
+        run_dir = _run_dir(profile_dir)
+        if run_dir.exists():
+            print_profile(collect_profile(run_dir, upload_to=os.environ.get(UPLOAD_ENV)))
+    return new_state
+
+
+def instrument_flow(flow: prefect.Flow) -> prefect.Flow:
+    """Profile every task in `flow`, and collect the profile when a flow run finishes
+
+    Tasks are wrapped unconditionally, so that flows pickled to storage can still be
+    profiled by setting the environment variable where they run.
+    """
+    for task in flow.tasks:
+        if not getattr(task.run, '_profiled', False):
+            task.run = profiled(task.run, name=task.name)
+            task.run._profiled = True
+    flow.state_handlers.append(_collect_on_finish)
+    return flow
@@ -0,0 +1,212 @@
+import copy
+
+import geopandas
+import numpy as np
+import pandas as pd
+import shapely
+
+from carbonplan_forest_offsets_fires.stats import (
+    CASCADE_STAGES,
+    MIN_BURNED_AREA,
+    build_project_summaries,
+    cascade_pairs,
+    log_cascade_report,
+    summarize_projects,
+)
+
+RESOLUTION = 60  # meters, in epsg:5070
+# number of set bits of every byte value
+_BYTE_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _prepare_copies(geoms: np.ndarray, idx: np.ndarray = None) -> np.ndarray:
+    """A copy of `geoms` with prepared copies of the geometries at `idx` (all if None)
+
+    `shapely.prepare` changes geometries in place, so preparing the caller's geometries
+    would leave them prepared (and holding the extra memory) after we return.
+    """
+    geoms = np.array(geoms, dtype=object)
+    idx = np.arange(len(geoms)) if idx is None else np.unique(idx)
+    copies = np.empty(len(idx), dtype=object)
+    copies[:] = [copy.copy(geom) for geom in geoms[idx]]
+    shapely.prepare(copies)
+    geoms[idx] = copies
+    return geoms
+
+
+def _popcount(packed: np.ndarray) -> int:
+    return int(_BYTE_POPCOUNT[packed].sum(dtype=np.int64))
+
+
+class _Grid:
+    """Cells of the shared grid (aligned to multiples of `resolution`) covering `bounds`
+
+    Grids are built per project part, so their size follows the part's extent rather
+    than the extent of the whole (possibly far-flung) project.
+    """
+
+    def __init__(self, bounds, resolution: float):
+        xmin, ymin, xmax, ymax = bounds
+        self.resolution = resolution
+        self.x0 = np.floor(xmin / resolution) * resolution
+        self.y0 = np.floor(ymin / resolution) * resolution
+        self.nx = max(1, int(np.ceil(xmax / resolution) - np.floor(xmin / resolution)))
+        self.ny = max(1, int(np.ceil(ymax / resolution) - np.floor(ymin / resolution)))
+        xx, yy = np.meshgrid(
+            self.x0 + (np.arange(self.nx) + 0.5) * resolution,
+            self.y0 + (np.arange(self.ny) + 0.5) * resolution,
+        )
+        self.xx, self.yy = xx.ravel(), yy.ravel()
+
+    def boundary_cells(self, geoms: np.ndarray) -> np.ndarray:
+        """Flattened mask of cells that may be crossed by the boundary of `geoms`
+
+        Boundaries are densified so consecutive vertices are at most one cell apart;
+        every point of a boundary is then less than a cell from a vertex, so the cells
+        holding vertices plus their neighbors cover every cell the boundary crosses.
+        """
+        r = self.resolution
+        # clip away far-off boundary; the clip rectangle's own edges fall off the grid
+        x1, y1 = self.x0 + self.nx * r, self.y0 + self.ny * r
+        clipped = shapely.clip_by_rect(
+            geoms, self.x0 - 2 * r, self.y0 - 2 * r, x1 + 2 * r, y1 + 2 * r
+        )
+        coords = shapely.get_coordinates(shapely.segmentize(shapely.boundary(clipped), r))
+        ix = np.floor((coords[:, 0] - self.x0) / r).astype(np.int64) + 1
+        iy = np.floor((coords[:, 1] - self.y0) / r).astype(np.int64) + 1
+        keep = (ix >= 0) & (ix <= self.nx + 1) & (iy >= 0) & (iy <= self.ny + 1)
+        padded = np.zeros((self.ny + 4, self.nx + 4), dtype=bool)
+        padded[iy[keep] + 1, ix[keep] + 1] = True
+        dilated = np.zeros_like(padded)
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                dilated |= np.roll(np.roll(padded, dy, axis=0), dx, axis=1)
+        return dilated[2:-2, 2:-2].ravel()
+
+
+def rasterize_burned_area(parts: np.ndarray, fires: np.ndarray, resolution: float) -> tuple:
+    """Approximate burned area of one project, with a strict error bound
+
+    Each project part and the fires near it are rasterized by testing cell centers, on a
+    grid covering just that part. Burned area is the popcount of the AND of the packed
+    part and fire masks, summed over parts (like the exact engine, which sums per-part
+    intersections). Only cells crossed by a part or fire boundary can be misclassified,
+    and only if they touch both the part and a fire, so those cells bound the error.
+
+    Returns:
+        tuple -- burned area and maximum absolute error, in square meters
+    """
+    fire_bounds = shapely.bounds(fires)
+    burned_cells, uncertain_cells = 0, 0
+    for part, (xmin, ymin, xmax, ymax) in zip(parts, shapely.bounds(parts)):
+        nearby = fires[
+            (fire_bounds[:, 0] <= xmax)
+            & (fire_bounds[:, 2] >= xmin)
+            & (fire_bounds[:, 1] <= ymax)
+            & (fire_bounds[:, 3] >= ymin)
+        ]
+        if len(nearby) == 0:
+            continue
+        grid = _Grid((xmin, ymin, xmax, ymax), resolution)
+        in_part = shapely.contains_xy(part, grid.xx, grid.yy)
+        near_part = grid.boundary_cells(np.array([part], dtype=object))
+
+        # fires only matter where there's a project
+        candidates = np.flatnonzero(in_part | near_part)
+        fire_mask = np.zeros(len(grid.xx), dtype=bool)
+        for fire in nearby:
+            fire_mask[candidates] |= shapely.contains_xy(
+                fire, grid.xx[candidates], grid.yy[candidates]
+            )
+        near_fire = grid.boundary_cells(nearby)
+
+        burned_cells += _popcount(np.packbits(in_part) & np.packbits(fire_mask))
+        uncertain = (near_part & (fire_mask | near_fire)) | (near_fire & (in_part | near_part))
+        uncertain_cells += int(uncertain.sum())
+    return burned_cells * resolution**2, uncertain_cells * resolution**2
+
+
+def summarize_projects_raster(
+    project_geoms: geopandas.GeoDataFrame,
+    nifc_perimeters: geopandas.GeoDataFrame,
+    min_burned_area: float = MIN_BURNED_AREA,
+    resolution: float = RESOLUTION,
+    stages: tuple = CASCADE_STAGES,
+) -> list:
+    """Raster approximation of `stats.summarize_projects`
+
+    Burned area is estimated on a shared epsg:5070 grid of `resolution` meters and
+    reported with a `burned_area_error` bound. Projects whose estimate is within the
+    error bound of `min_burned_area` are recomputed exactly with the vector path (and
+    get a `burned_area_error` of 0), so which projects are reported matches the exact
+    engine. Fires are paired with projects exactly as in `stats.summarize_projects`.
+
+    Returns:
+        list -- one summary dict per project with more than `min_burned_area` burned,
+            in the order projects appear in `project_geoms`
+    """
+    if len(project_geoms) == 0 or len(nifc_perimeters) == 0:
+        return []
+
+    first_geoms = project_geoms.drop_duplicates('opr_id')
+    fire_geoms = nifc_perimeters.geometry.values.to_numpy()
+    proj_idx, fire_idx, _, report = cascade_pairs(
+        first_geoms.geometry.values.to_numpy(), fire_geoms, stages=stages
+    )
+    log_cascade_report(report)
+    if len(fire_idx) == 0:
+        return []
+
+    pair_opr_ids = first_geoms['opr_id'].values[proj_idx]
+    fire_idx_by_project = pd.Series(fire_idx).groupby(pair_opr_ids).agg(list)
+    hit = project_geoms[project_geoms['opr_id'].isin(pair_opr_ids)]
+    fire_geoms = _prepare_copies(fire_geoms, fire_idx)
+
+    estimates = {}
+    for opr_id, parts in hit.groupby('opr_id', sort=False):
+        parts = _prepare_copies(parts.geometry.values.to_numpy())
+        estimates[opr_id] = rasterize_burned_area(
+            parts, fire_geoms[fire_idx_by_project[opr_id]], resolution
+        )
+    burned_areas = pd.Series({k: v[0] for k, v in estimates.items()}, dtype=float)
+    errors = pd.Series({k: v[1] for k, v in estimates.items()}, dtype=float)
+    project_areas = hit.area.groupby(hit['opr_id']).sum()
+
+    ambiguous = (burned_areas - min_burned_area).abs() <= errors
+    print(
+        f'Raster estimate for {len(estimates)} projects at {resolution}m, '
+        f'{ambiguous.sum()} near the threshold recomputed exactly'
+    )
+    exact = {
+        result['opr_id']: result
+        for result in summarize_projects(
+            project_geoms[project_geoms['opr_id'].isin(ambiguous.index[ambiguous])],
+            nifc_perimeters,
+            min_burned_area=min_burned_area,
+            stages=stages,
+        )
+    }
+
+    approximate_opr_ids = [
+        opr_id
+        for opr_id in first_geoms['opr_id']
+        if opr_id in burned_areas.index
+        and not ambiguous[opr_id]
+        and burned_areas[opr_id] > min_burned_area
+    ]
+    approximate = {
+        result['opr_id']: {**result, 'burned_area_error': errors[result['opr_id']]}
+        for result in build_project_summaries(
+            approximate_opr_ids,
+            burned_areas,
+            project_areas,
+            pair_opr_ids,
+            fire_idx,
+            nifc_perimeters,
+        )
+    }
+    return [
+        approximate.get(opr_id) or {**exact[opr_id], 'burned_area_error': 0.0}
+        for opr_id in first_geoms['opr_id']
+        if opr_id in approximate or opr_id in exact
+    ]
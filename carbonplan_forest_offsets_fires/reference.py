@@ -0,0 +1,150 @@
+import datetime
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from carbonplan_forest_offsets_fires.cache import CACHE_DIR, OFFLINE
+
+REFERENCE_TTL = datetime.timedelta(
+    seconds=int(os.environ.get('FOREST_OFFSETS_FIRES_REFERENCE_TTL', 24 * 3600))
+)
+EA_PROJECTS_URL = (
+    'https://ww2.arb.ca.gov/our-work/programs/compliance-offset-program/'
+    'early-action-offset-credits/early-action-projects'
+)
+
+_snapshots = {}  # name -> Snapshot
+_lookups = {}  # (name, content hash) -> lookup
+
+
+class Snapshot:
+    """A reference table along with when it was fetched and a hash of its contents"""
+
+    def __init__(self, data: pd.DataFrame, fetched_at: datetime.datetime, content_hash: str):
+        self.data = data
+        self.fetched_at = fetched_at
+        self.content_hash = content_hash
+
+    def is_fresh(self, ttl: datetime.timedelta) -> bool:
+        return OFFLINE or datetime.datetime.utcnow() - self.fetched_at <= ttl
+
+
+def _content_hash(df: pd.DataFrame) -> str:
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy()).hexdigest()
+
+
+def _typed(df: pd.DataFrame) -> pd.DataFrame:
+    """Store free-form object columns as strings so the parquet schema is stable"""
+    df = df.reset_index(drop=True)
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].astype('string')
+    return df
+
+
+def _snapshot_path(name: str, cache_dir: str) -> str:
+    return os.path.join(cache_dir, 'reference', f'{name}.parquet')
+
+
+def _read_snapshot(path: str):
+    try:
+        table = pq.read_table(path)
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+    metadata = table.schema.metadata or {}
+    return Snapshot(
+        table.to_pandas(),
+        datetime.datetime.fromisoformat(metadata[b'fetched_at'].decode()),
+        metadata[b'content_hash'].decode(),
+    )
+
+
+def _write_snapshot(path: str, snapshot: Snapshot):
+    table = pa.Table.from_pandas(snapshot.data, preserve_index=False)
+    table = table.replace_schema_metadata(
+        {
+            **(table.schema.metadata or {}),
+            'fetched_at': snapshot.fetched_at.isoformat(),
+            'content_hash': snapshot.content_hash,
+        }
+    )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    pq.write_table(table, tmp)
+    os.replace(tmp, path)
+
+
+def load_snapshot(
+    name: str, fetch, ttl: datetime.timedelta = REFERENCE_TTL, cache_dir: str = CACHE_DIR
+) -> Snapshot:
+    """Return the reference table `name`, calling `fetch()` only if no fresh copy exists
+
+    Snapshots are served from memory, then from a parquet file in `cache_dir`, and are
+    only re-fetched once older than `ttl`. In offline mode any cached copy is fresh.
+    """
+    snapshot = _snapshots.get(name)
+    if snapshot is None or not snapshot.is_fresh(ttl):
+        snapshot = _read_snapshot(_snapshot_path(name, cache_dir))
+    if snapshot is None or not snapshot.is_fresh(ttl):
+        data = _typed(fetch())
+        snapshot = Snapshot(data, datetime.datetime.utcnow(), _content_hash(data))
+        _write_snapshot(_snapshot_path(name, cache_dir), snapshot)
+    _snapshots[name] = snapshot
+    return snapshot
+
+
+def _lookup(name: str, snapshot: Snapshot, build):
+    key = (name, snapshot.content_hash)
+    if key not in _lookups:
+        _lookups[key] = build(snapshot.data)
+    return _lookups[key]
+
+
+def fetch_issuance() -> pd.DataFrame:
+    from carbonplan_forest_offsets.load.issuance import load_issuance_table
+
+    return load_issuance_table(most_recent=True)
+
+
+def fetch_ea_projects() -> pd.DataFrame:
+    """Scrape the CARB early action project table"""
+    data = pd.read_html(EA_PROJECTS_URL)[0]
+    return pd.DataFrame({'opr_id': np.unique(data.T.values[4]).astype(str)})
+
+
+def load_issuance(ttl: datetime.timedelta = REFERENCE_TTL) -> pd.DataFrame:
+    """Most recent CARB issuance table"""
+    return load_snapshot('issuance', fetch_issuance, ttl=ttl).data
+
+
+def arb_id_to_opr_id(ttl: datetime.timedelta = REFERENCE_TTL) -> dict:
+    snapshot = load_snapshot('issuance', fetch_issuance, ttl=ttl)
+    return _lookup(
+        'arb_id_to_opr_id',
+        snapshot,
+        lambda df: df.set_index('arb_id')['opr_id']
+        .astype(object)
+        .pipe(lambda s: s.where(s.notna(), None))
+        .to_dict(),
+    )
+
+
+def issuance_totals(ttl: datetime.timedelta = REFERENCE_TTL) -> dict:
+    """Total ARBOCs allocated to date, by arb_id"""
+    snapshot = load_snapshot('issuance', fetch_issuance, ttl=ttl)
+    return _lookup(
+        'issuance_totals',
+        snapshot,
+        lambda df: df.groupby('arb_id')['allocation'].sum().to_dict(),
+    )
+
+
+def ea_opr_ids(ttl: datetime.timedelta = REFERENCE_TTL) -> frozenset:
+    """opr_ids of all early action projects"""
+    snapshot = load_snapshot('ea_projects', fetch_ea_projects, ttl=ttl)
+    return _lookup('ea_opr_ids', snapshot, lambda df: frozenset(df['opr_id']))
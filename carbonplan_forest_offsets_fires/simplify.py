@@ -0,0 +1,125 @@
+import geopandas
+import numpy as np
+import pandas as pd
+import shapely
+
+DEFAULT_PERCENTAGE = 80
+# ACR361 shapefile is so broken we have to really goose the simplification
+PERCENTAGE_OVERRIDES = {'ACR361': 5}
+# bisection of log10(tolerance): at most ITERATIONS steps, stopping at PRECISION
+ITERATIONS = 40
+PRECISION = 1e-3
+
+
+def _vertex_counts(geoms: np.ndarray) -> tuple:
+    """Total and fixed (ring start/end) coordinate counts of each geometry"""
+    total = shapely.get_num_coordinates(geoms)
+    # two levels, to get down to polygons from collections of multipolygons
+    parts, idx = shapely.get_parts(geoms, return_index=True)
+    parts, part_idx = shapely.get_parts(parts, return_index=True)
+    part_idx = idx[part_idx]
+    rings = shapely.get_num_interior_rings(parts) + (shapely.get_type_id(parts) == 3)
+    fixed = 2 * np.bincount(part_idx, weights=rings, minlength=len(geoms))
+    return total, fixed
+
+
+def percentage_tolerances(geoms: np.ndarray, percentages: np.ndarray) -> np.ndarray:
+    """Largest simplification tolerance retaining a percentage of removable vertices
+
+    This mirrors `mapshaper -simplify {pct}%`, where the percentage is the share of
+    removable vertices (those that aren't ring endpoints) to keep, rather than a distance
+    tolerance. Tolerances are found by bisection over all geometries at once, so every
+    step is a single vectorized `shapely.simplify` call. Geometries drop out of the
+    bisection as soon as they keep exactly their target vertex count or their tolerance
+    is known to within `PRECISION`, so later steps only simplify the few left.
+
+    Arguments:
+        geoms {np.ndarray} -- geometries to simplify
+        percentages {np.ndarray} -- percentage of removable vertices to retain, per geometry
+
+    Returns:
+        np.ndarray -- tolerance of each geometry, 0 where nothing is to be removed
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    percentages = np.broadcast_to(np.asarray(percentages, dtype=np.float64), geoms.shape)
+    total, fixed = _vertex_counts(geoms)
+    target = np.ceil(fixed + percentages / 100 * (total - fixed))
+
+    xmin, ymin, xmax, ymax = shapely.bounds(geoms).T
+    # bisect log10(tolerance); `lo` always keeps at least `target` vertices
+    lo = np.log10(np.maximum(np.hypot(xmax - xmin, ymax - ymin), 1e-9)) - 12
+    hi = lo + 12
+    kept_lo = total.copy()
+    active = (percentages < 100) & (kept_lo > target)
+    for _ in range(ITERATIONS):
+        active &= hi - lo > PRECISION
+        if not active.any():
+            break
+        idx = np.flatnonzero(active)
+        mid = (lo[idx] + hi[idx]) / 2
+        kept = shapely.get_num_coordinates(
+            shapely.simplify(geoms[idx], 10**mid, preserve_topology=True)
+        )
+        enough = kept >= target[idx]
+        lo[idx] = np.where(enough, mid, lo[idx])
+        hi[idx] = np.where(enough, hi[idx], mid)
+        kept_lo[idx] = np.where(enough, kept, kept_lo[idx])
+        active[idx] = kept_lo[idx] > target[idx]
+
+    return np.where(percentages >= 100, 0, 10**lo)
+
+
+def simplify_percentage(geoms: np.ndarray, percentages: np.ndarray) -> np.ndarray:
+    """Topology-preserving simplification retaining a percentage of removable vertices
+
+    See `percentage_tolerances`. Douglas-Peucker picks slightly different vertices than
+    mapshaper's Visvalingam, but vertex budgets match.
+
+    Arguments:
+        geoms {np.ndarray} -- geometries to simplify
+        percentages {np.ndarray} -- percentage of removable vertices to retain, per geometry
+
+    Returns:
+        np.ndarray -- simplified geometries
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    tolerances = percentage_tolerances(geoms, percentages)
+    simplified = shapely.simplify(geoms, tolerances, preserve_topology=True)
+    return np.where(tolerances > 0, simplified, geoms)
+
+
+def get_percentages(opr_ids, overrides: dict = None, default: float = DEFAULT_PERCENTAGE):
+    """Simplification percentage of each project, honoring per-project overrides"""
+    overrides = PERCENTAGE_OVERRIDES if overrides is None else overrides
+    return np.array([overrides.get(opr_id, default) for opr_id in opr_ids], dtype=np.float64)
+
+
+def simplify_geometries(
+    gdf: geopandas.GeoDataFrame, overrides: dict = None, default: float = DEFAULT_PERCENTAGE
+) -> geopandas.GeoDataFrame:
+    """Simplify raw project geometries, all projects at once
+
+    Each project keeps the same share of removable vertices `mapshaper -simplify 80%`
+    kept (5% for ACR361, see `PERCENTAGE_OVERRIDES`), counted over all of its features
+    together.
+
+    Arguments:
+        gdf {geopandas.GeoDataFrame} -- raw geometries with an `opr_id` column, in epsg:4326
+        overrides {dict} -- opr_id -> percentage, replacing `PERCENTAGE_OVERRIDES`
+        default {float} -- percentage for projects without an override
+
+    Returns:
+        geopandas.GeoDataFrame -- simplified geometries in epsg:5070
+    """
+    gdf = gdf[gdf.geometry.notna()].reset_index(drop=True)
+    geoms = gdf.geometry.values.to_numpy()
+    codes, opr_ids = pd.factorize(gdf['opr_id'])
+    # collect each project's features, so vertex budgets are per project like mapshaper's
+    order = np.argsort(codes, kind='stable')
+    projects = shapely.geometrycollections(geoms[order], indices=codes[order])
+    tolerances = percentage_tolerances(projects, get_percentages(opr_ids, overrides, default))
+    # then simplify each feature with its project's tolerance, keeping rows one to one
+    simplified = shapely.simplify(geoms, tolerances[codes], preserve_topology=True)
+    simplified = np.where(tolerances[codes] > 0, simplified, geoms)
+    gdf = gdf.set_geometry(geopandas.GeoSeries(simplified, index=gdf.index, crs=gdf.crs))
+    return gdf.to_crs('epsg:5070')
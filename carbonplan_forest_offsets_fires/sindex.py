@@ -0,0 +1,229 @@
+import json
+import os
+import struct
+import tempfile
+
+import fsspec
+import geopandas
+import numpy as np
+import shapely
+
+from carbonplan_forest_offsets_fires import canonical
+from carbonplan_forest_offsets_fires.cache import cached_copy
+
+FORMAT_VERSION = 1
+MAGIC = b'CPFSIDX\x00'
+NODE_SIZE = 16
+GEOM_PATH = 's3://carbonplan-forest-offsets/carb-geometries'
+INDEX_PATH = f'{GEOM_PATH}/all_carb_geoms.v{FORMAT_VERSION}.sindex'
+CHUNK_SIZE = 10_000
+
+
+def _overlaps(bounds: np.ndarray, query_bounds: np.ndarray) -> np.ndarray:
+    """(k, n) boolean matrix of which of `bounds` (n x 4) overlap each `query_bounds` (k x 4)"""
+    return (
+        (bounds[None, :, 0] <= query_bounds[:, None, 2])
+        & (bounds[None, :, 2] >= query_bounds[:, None, 0])
+        & (bounds[None, :, 1] <= query_bounds[:, None, 3])
+        & (bounds[None, :, 3] >= query_bounds[:, None, 1])
+    )
+
+
+def _pack_wkb(geoms) -> tuple:
+    wkbs = shapely.to_wkb(geoms)
+    offsets = np.zeros(len(wkbs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(wkb) for wkb in wkbs])
+    return offsets, np.frombuffer(b''.join(wkbs), dtype=np.uint8)
+
+
+def write_project_index(gdf: geopandas.GeoDataFrame, path: str, node_size: int = NODE_SIZE):
+    """Write a packed, Hilbert-sorted R-tree of project geometries to `path`
+
+    The file holds a small JSON header followed by raw arrays: leaf bounding boxes sorted
+    along a Hilbert curve, one level of node bounding boxes (`node_size` leaves each), and
+    offsets into WKB blobs of the geometries and their convex hulls. Every array can be
+    memory mapped, so loading the index doesn't parse a single geometry.
+
+    Arguments:
+        gdf {geopandas.GeoDataFrame} -- projects with an `opr_id` column, in epsg:5070
+        path {str} -- local output path
+        node_size {int} -- leaves per node
+    """
+    if len(gdf):
+        gdf = gdf.iloc[np.argsort(gdf.geometry.hilbert_distance().to_numpy(), kind='stable')]
+    leaf_bounds = shapely.bounds(gdf.geometry.values).astype(np.float64)
+    node_bounds = np.array(
+        [
+            [*chunk[:, :2].min(axis=0), *chunk[:, 2:].max(axis=0)]
+            for chunk in np.array_split(leaf_bounds, range(node_size, len(leaf_bounds), node_size))
+            if len(chunk)
+        ],
+        dtype=np.float64,
+    ).reshape(-1, 4)
+    geom_offsets, geom_wkb = _pack_wkb(gdf.geometry.values)
+    hull_offsets, hull_wkb = _pack_wkb(gdf.convex_hull.values)
+    arrays = {
+        'leaf_bounds': leaf_bounds,
+        'node_bounds': node_bounds,
+        'geom_offsets': geom_offsets,
+        'geom_wkb': geom_wkb,
+        'hull_offsets': hull_offsets,
+        'hull_wkb': hull_wkb,
+    }
+
+    header = {
+        'format_version': FORMAT_VERSION,
+        'crs': gdf.crs.to_string(),
+        'count': len(gdf),
+        'node_size': node_size,
+        'opr_ids': gdf['opr_id'].astype(str).tolist(),
+        'arrays': {},
+    }
+    # lay arrays out after the header, 8-byte aligned
+    offset = 0
+    for name, array in arrays.items():
+        header['arrays'][name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': array.shape}
+        offset += -(-array.nbytes // 8) * 8
+    header_bytes = json.dumps(header).encode()
+    data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // 8) * 8
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + header['arrays'][name]['offset'])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+
+
+class ProjectIndex:
+    """Memory-mapped spatial index of project geometries written by `write_project_index`
+
+    Queries only touch bounding box arrays; geometries (and hulls) are decoded from WKB
+    lazily, and only for the projects a query actually returns.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{path} is not a project index')
+            (header_length,) = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(header_length))
+        if header['format_version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported project index version {header['format_version']}")
+
+        data_start = -(-(len(MAGIC) + 8 + header_length) // 8) * 8
+        for name, spec in header['arrays'].items():
+            array = (
+                np.memmap(
+                    path,
+                    mode='r',
+                    dtype=np.dtype(spec['dtype']),
+                    offset=data_start + spec['offset'],
+                    shape=tuple(spec['shape']),
+                )
+                if np.prod(spec['shape'])
+                else np.empty(spec['shape'], dtype=spec['dtype'])
+            )
+            setattr(self, name, array)
+        self.crs = header['crs']
+        self.node_size = header['node_size']
+        self.opr_ids = np.array(header['opr_ids'], dtype=object)
+        self._geoms = {}
+        self._hulls = {}
+
+    def __len__(self):
+        return len(self.opr_ids)
+
+    def _decode(self, positions, offsets, wkb, decoded: dict) -> np.ndarray:
+        missing = [p for p in np.unique(positions) if p not in decoded]
+        if missing:
+            blobs = [wkb[offsets[p] : offsets[p + 1]].tobytes() for p in missing]
+            geoms = shapely.from_wkb(blobs)
+            shapely.prepare(geoms)
+            decoded.update(zip(missing, geoms))
+        return np.array([decoded[p] for p in positions], dtype=object)
+
+    def geometries(self, positions) -> np.ndarray:
+        """Decode (and cache) the geometries at `positions`"""
+        return self._decode(positions, self.geom_offsets, self.geom_wkb, self._geoms)
+
+    def hulls(self, positions) -> np.ndarray:
+        """Decode (and cache) the convex hulls at `positions`"""
+        return self._decode(positions, self.hull_offsets, self.hull_wkb, self._hulls)
+
+    def to_geodataframe(self, positions=None, hulls: bool = False) -> geopandas.GeoDataFrame:
+        positions = np.arange(len(self)) if positions is None else np.asarray(positions)
+        geoms = self.hulls(positions) if hulls else self.geometries(positions)
+        return geopandas.GeoDataFrame(
+            {'opr_id': self.opr_ids[positions]}, geometry=geoms, crs=self.crs
+        )
+
+    def query_bounds(self, query_bounds: np.ndarray) -> tuple:
+        """Find projects whose bounding box overlaps each of `query_bounds` (k x 4)
+
+        Returns:
+            tuple -- (input indices, project positions) of overlapping pairs
+        """
+        query_bounds = np.asarray(query_bounds, dtype=np.float64).reshape(-1, 4)
+        leaf_offsets = np.arange(self.node_size)
+        inputs, positions = [], []
+        for start in range(0, len(query_bounds), CHUNK_SIZE):
+            chunk = query_bounds[start : start + CHUNK_SIZE]
+            query_idx, node_idx = np.nonzero(_overlaps(self.node_bounds, chunk))
+            leaves = (node_idx[:, None] * self.node_size + leaf_offsets).ravel()
+            query_idx = np.repeat(query_idx, self.node_size)
+            valid = leaves < len(self)
+            query_idx, leaves = query_idx[valid], leaves[valid]
+            b, q = self.leaf_bounds[leaves], chunk[query_idx]
+            hit = (
+                (b[:, 0] <= q[:, 2])
+                & (b[:, 2] >= q[:, 0])
+                & (b[:, 1] <= q[:, 3])
+                & (b[:, 3] >= q[:, 1])
+            )
+            inputs.append(query_idx[hit] + start)
+            positions.append(leaves[hit])
+        if not inputs:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        return np.concatenate(inputs), np.concatenate(positions)
+
+    def query(self, geoms, predicate: str = 'intersects', hulls: bool = False) -> tuple:
+        """Find projects satisfying `predicate` with each of `geoms`
+
+        Arguments:
+            geoms -- array of shapely geometries, in the index crs
+            predicate {str} -- shapely binary predicate, e.g. `intersects`; None for bbox only
+            hulls {bool} -- test against project convex hulls instead of exact geometries
+
+        Returns:
+            tuple -- (input indices, project positions) of matching pairs
+        """
+        geoms = np.asarray(geoms, dtype=object)
+        input_idx, positions = self.query_bounds(shapely.bounds(geoms))
+        if predicate is None or len(positions) == 0:
+            return input_idx, positions
+        project_geoms = self.hulls(positions) if hulls else self.geometries(positions)
+        hit = getattr(shapely, predicate)(geoms[input_idx], project_geoms)
+        return input_idx[hit], positions[hit]
+
+
+def load_project_index(path: str = INDEX_PATH) -> ProjectIndex:
+    """Memory map the project index, downloading it once per version if it's remote"""
+    return ProjectIndex(cached_copy(path, 'sindex'))
+
+
+def build_project_index(src: str = canonical.PROJECTS_PATH, dst: str = INDEX_PATH) -> str:
+    """Build the project index from full resolution canonical geometries and upload it
+
+    Returns:
+        str -- path of the written index
+    """
+    gdf = canonical.read_project_geometries(level='geometry', path=src)
+    fs, _, (rpath,) = fsspec.get_fs_token_paths(dst)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        local = os.path.join(tmpdir, os.path.basename(rpath))
+        write_project_index(gdf, local)
+        fs.put(local, rpath)
+    return dst
@@ -0,0 +1,411 @@
+import hashlib
+import time
+
+import geopandas
+import numpy as np
+import pandas as pd
+import shapely
+from prefect.utilities.logging import get_logger
+
+from carbonplan_forest_offsets_fires import canonical, utils
+
+logger = get_logger('stats')
+
+ACRE = 4046.86  # square meters
+MIN_BURNED_AREA = ACRE * 50  # fifty acre minimum
+
+FIRE_METADATA_COLUMNS = ['name', 'start_date', 'centroid', 'label_coords']
+# bump when the layout of the project state, or how results are computed, changes
+STATE_VERSION = 2
+
+CASCADE_STAGES = ('hull',)
+
+
+def get_fire_metadata_frame(fires: geopandas.GeoDataFrame) -> pd.DataFrame:
+    """Compute per-fire display metadata (centroid and label coordinates)
+
+    Arguments:
+        fires {geopandas.GeoDataFrame} -- fire perimeters in epsg:5070
+
+    Returns:
+        pd.DataFrame -- `poly_IRWINID` plus metadata columns, indexed like `fires`
+    """
+    centroids = (
+        fires.centroid.to_crs('epsg:4326')
+        .apply(lambda x: [x.centroid.x, x.centroid.y])
+        .rename('centroid')
+    )
+    label_coords = fires.convex_hull.exterior.apply(utils.extract_northern_corner).rename(
+        'label_coords'
+    )
+    fires = fires.join(centroids).join(label_coords)
+    return pd.DataFrame(fires[['poly_IRWINID'] + FIRE_METADATA_COLUMNS])
+
+
+def get_fire_metadata(project_fires: geopandas.GeoDataFrame) -> dict:
+    return (
+        get_fire_metadata_frame(project_fires)
+        .set_index('poly_IRWINID')[FIRE_METADATA_COLUMNS]
+        .to_dict(orient='index')
+    )
+
+
+def cascade_pairs(geoms: np.ndarray, fires: np.ndarray, stages: tuple = CASCADE_STAGES) -> tuple:
+    """Find intersecting (geometry, fire) pairs with progressively more precise filters
+
+    Candidate pairs come from a bounding box query and always end with an exact
+    `intersects` test. In between, `stages` run in order:
+
+    - `hull`: pairs whose convex hulls are disjoint are dropped, and pairs where the
+      fire contains the geometry's hull are accepted as fully contained
+
+    Pairs settled by a stage skip all later ones.
+
+    Arguments:
+        geoms {np.ndarray} -- project geometries
+        fires {np.ndarray} -- fire perimeters, in the same crs
+        stages {tuple} -- intermediate stages to run
+
+    Returns:
+        tuple -- geometry indices, fire indices, and whether each fire fully contains the
+            geometry (only known when proven by the `hull` stage), plus a list with one
+            dict of pair counts and timings per stage
+    """
+    unknown_stages = set(stages) - {'hull'}
+    if unknown_stages:
+        raise ValueError(f'Unknown cascade stages: {sorted(unknown_stages)}')
+
+    report = []
+    start = time.perf_counter()
+    geom_idx, fire_idx = shapely.STRtree(fires).query(geoms)
+    report.append(
+        {
+            'stage': 'bbox',
+            'pairs_in': len(geoms) * len(fires),
+            'pruned': len(geoms) * len(fires) - len(geom_idx),
+            'contained': 0,
+            'seconds': time.perf_counter() - start,
+        }
+    )
+
+    accepted_geom, accepted_fire = [], []
+    for stage in (*stages, 'exact'):
+        start = time.perf_counter()
+        pairs_in = len(geom_idx)
+        if stage == 'hull':
+            geom_hulls = np.empty(len(geoms), dtype=object)
+            fire_hulls = np.empty(len(fires), dtype=object)
+            used_geoms, used_fires = np.unique(geom_idx), np.unique(fire_idx)
+            geom_hulls[used_geoms] = shapely.convex_hull(geoms[used_geoms])
+            fire_hulls[used_fires] = shapely.convex_hull(fires[used_fires])
+            keep = shapely.intersects(geom_hulls[geom_idx], fire_hulls[fire_idx])
+            geom_idx, fire_idx = geom_idx[keep], fire_idx[keep]
+            contained = shapely.contains(fires[fire_idx], geom_hulls[geom_idx])
+            accepted_geom.append(geom_idx[contained])
+            accepted_fire.append(fire_idx[contained])
+            geom_idx, fire_idx = geom_idx[~contained], fire_idx[~contained]
+        else:
+            # most geometries are in a pair or two, too few tests to pay for preparing them
+            keep = shapely.intersects(geoms[geom_idx], fires[fire_idx])
+            geom_idx, fire_idx = geom_idx[keep], fire_idx[keep]
+            contained = np.zeros(0, dtype=bool)
+        report.append(
+            {
+                'stage': stage,
+                'pairs_in': pairs_in,
+                'pruned': pairs_in - len(geom_idx) - int(contained.sum()),
+                'contained': int(contained.sum()),
+                'seconds': time.perf_counter() - start,
+            }
+        )
+
+    n_contained = sum(len(idx) for idx in accepted_geom)
+    geom_idx = np.concatenate([*accepted_geom, geom_idx]).astype(np.int64)
+    fire_idx = np.concatenate([*accepted_fire, fire_idx]).astype(np.int64)
+    contained = np.arange(len(geom_idx)) < n_contained
+    # restore the (geometry, fire) order of a plain spatial index query
+    order = np.lexsort((fire_idx, geom_idx))
+    return geom_idx[order], fire_idx[order], contained[order], report
+
+
+def log_cascade_report(report: list):
+    for row in report:
+        logger.debug(
+            f"{row['stage']:>10}: {row['pairs_in']} pairs in, {row['pruned']} pruned, "
+            f"{row['contained']} contained, {row['seconds']:.3f}s"
+        )
+
+
+def summarize_projects(
+    project_geoms: geopandas.GeoDataFrame,
+    nifc_perimeters: geopandas.GeoDataFrame,
+    min_burned_area: float = MIN_BURNED_AREA,
+    stages: tuple = CASCADE_STAGES,
+) -> list:
+    """Compute burned area and burned fraction for many projects in one pass
+
+    Projects are paired with fires by `cascade_pairs`, fires are unioned per project
+    (to prevent double counting burned area) and intersected with the projects array-wise.
+    Project parts proven to lie inside a single fire skip the union and intersection.
+
+    Arguments:
+        project_geoms {geopandas.GeoDataFrame} -- project geometries with an `opr_id` column,
+            as returned by `canonical.load_project_geometries`
+        nifc_perimeters {geopandas.GeoDataFrame} -- fire perimeters, in the same crs
+        stages {tuple} -- intermediate filters passed to `cascade_pairs`
+
+    Returns:
+        list -- one summary dict per project with more than `min_burned_area` burned,
+            in the order projects appear in `project_geoms`
+    """
+    if len(project_geoms) == 0 or len(nifc_perimeters) == 0:
+        return []
+
+    # the per-project version pairs fires with the first feature of each project
+    first_geoms = project_geoms.drop_duplicates('opr_id')
+    proj_idx, fire_idx, contained, report = cascade_pairs(
+        first_geoms.geometry.values.to_numpy(),
+        nifc_perimeters.geometry.values.to_numpy(),
+        stages=stages,
+    )
+    log_cascade_report(report)
+    if len(fire_idx) == 0:
+        return []
+
+    pair_opr_ids = first_geoms['opr_id'].values[proj_idx]
+    hit = project_geoms[project_geoms['opr_id'].isin(pair_opr_ids)]
+    shortcut = hit.index.isin(first_geoms.index) & hit['opr_id'].isin(pair_opr_ids[contained])
+    overlay = hit[~shortcut]
+
+    pairs = geopandas.GeoDataFrame(
+        {'opr_id': pair_opr_ids},
+        geometry=nifc_perimeters.geometry.values[fire_idx],
+        crs=nifc_perimeters.crs,
+    )
+    pairs = pairs[pairs['opr_id'].isin(overlay['opr_id'])]
+    burned_parts = [hit[shortcut].area]
+    if len(pairs):
+        fire_geoms = pairs.dissolve(by='opr_id').geometry.buffer(0)
+        aligned_fire_geoms = geopandas.GeoSeries(
+            fire_geoms.loc[overlay['opr_id']].values, index=overlay.index, crs=fire_geoms.crs
+        )
+        burned_parts.append(overlay.geometry.intersection(aligned_fire_geoms).area)
+    burned_areas = pd.concat(burned_parts).groupby(hit['opr_id']).sum()
+    project_areas = hit.area.groupby(hit['opr_id']).sum()
+
+    burned_opr_ids = [
+        opr_id
+        for opr_id in first_geoms['opr_id']
+        if opr_id in burned_areas.index and burned_areas[opr_id] > min_burned_area
+    ]
+    if not burned_opr_ids:
+        return []
+
+    return build_project_summaries(
+        burned_opr_ids, burned_areas, project_areas, pair_opr_ids, fire_idx, nifc_perimeters
+    )
+
+
+def build_project_summaries(
+    opr_ids: list,
+    burned_areas: pd.Series,
+    project_areas: pd.Series,
+    pair_opr_ids: np.ndarray,
+    fire_idx: np.ndarray,
+    nifc_perimeters: geopandas.GeoDataFrame,
+) -> list:
+    """Assemble summary dicts for `opr_ids` from per-project areas and (project, fire) pairs
+
+    Fire metadata is computed once per fire, even if it touches several projects.
+    """
+    keep = np.isin(pair_opr_ids, opr_ids)
+    fire_positions = np.unique(fire_idx[keep])
+    metadata = get_fire_metadata_frame(nifc_perimeters.iloc[fire_positions])
+    metadata.index = fire_positions
+    fire_idx_by_project = pd.Series(fire_idx).groupby(pair_opr_ids).agg(list)
+
+    results = []
+    for opr_id in opr_ids:
+        burned_area = burned_areas[opr_id]
+        fires_summary = (
+            metadata.loc[fire_idx_by_project[opr_id]]
+            .set_index('poly_IRWINID')[FIRE_METADATA_COLUMNS]
+            .to_dict(orient='index')
+        )
+        results.append(
+            {
+                'opr_id': opr_id,
+                'burned_area': burned_area,
+                'burned_fraction': round(burned_area / project_areas[opr_id], 3),
+                'fires': fires_summary,
+            }
+        )
+    return results
+
+
+def get_candidate_fires(nifc_perimeters: geopandas.GeoDataFrame, project_index) -> dict:
+    """Find the fires touching each project's convex hull
+
+    Only the hulls of projects whose bounding box overlaps a perimeter are decoded.
+
+    Arguments:
+        nifc_perimeters {geopandas.GeoDataFrame} -- fire perimeters, in epsg:5070
+        project_index {sindex.ProjectIndex} -- spatial index of project geometries
+
+    Returns:
+        dict -- opr_id -> sorted list of IRWINIDs of fires intersecting the project hull
+    """
+    fire_idx, position = project_index.query(nifc_perimeters.geometry.values, hulls=True)
+    order = np.argsort(fire_idx, kind='stable')
+    fire_ids = pd.Series(nifc_perimeters['poly_IRWINID'].astype(str).to_numpy()[fire_idx[order]])
+    grouped = fire_ids.groupby(project_index.opr_ids[position[order]], sort=False)
+    return grouped.agg(lambda x: sorted(set(x))).to_dict()
+
+
+def _sha1(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def hash_geometries(geoms: geopandas.GeoSeries) -> list:
+    """Return a stable hash of each geometry's WKB"""
+    return [_sha1(wkb) for wkb in geoms.to_wkb()]
+
+
+def hash_project_geometries(project_geoms: geopandas.GeoDataFrame) -> dict:
+    """Map each `opr_id` to a hash of all its features, in order"""
+    hashes = pd.Series(hash_geometries(project_geoms.geometry), index=project_geoms.index)
+    return (
+        hashes.groupby(project_geoms['opr_id'], sort=False)
+        .agg(''.join)
+        .map(lambda x: _sha1(x.encode()))
+        .to_dict()
+    )
+
+
+def _fill_str(values: pd.Series) -> pd.Series:
+    """Values as strings, with missing ones as '' rather than 'nan', 'None' or 'NaT'"""
+    values = values.astype(object)  # categoricals can't take '' as a new value
+    return values.where(values.notna(), '').astype(str)
+
+
+def fingerprint_fires(fires: geopandas.GeoDataFrame) -> dict:
+    """Map each `poly_IRWINID` to a hash of its geometry and reported attributes
+
+    The fire name and start date are part of the hash because they end up in project
+    summaries, so renaming a fire invalidates summaries just like reshaping it does.
+    Missing names and dates hash like empty strings.
+    """
+    attrs = _fill_str(fires['name']) + '|' + _fill_str(fires['start_date'])
+    hashes = pd.Series(
+        [
+            _sha1(wkb + attr)
+            for wkb, attr in zip(fires.geometry.to_wkb(), attrs.str.encode('utf-8'))
+        ],
+        index=fires['poly_IRWINID'].astype(str),
+    )
+    # IRWINIDs are not guaranteed to be unique, so fold duplicates into one hash
+    return hashes.groupby(level=0).agg(lambda x: _sha1(''.join(sorted(x)).encode())).to_dict()
+
+
+def diff_fire_fingerprints(previous: dict, current: dict) -> dict:
+    """Compare two snapshots' fingerprints (see `fingerprint_fires`)
+
+    Returns:
+        dict -- sorted lists of `added`, `removed` and `changed` IRWINIDs
+    """
+    return {
+        'added': sorted(current.keys() - previous.keys()),
+        'removed': sorted(previous.keys() - current.keys()),
+        'changed': sorted(k for k in current.keys() & previous.keys() if current[k] != previous[k]),
+    }
+
+
+def empty_project_state(settings: dict = None) -> dict:
+    return {'settings': state_settings(settings), 'fires': {}, 'projects': {}}
+
+
+def state_settings(settings: dict = None) -> dict:
+    """Everything that affects results besides the fires and project geometries
+
+    Callers include `canonical.artifact_identity()`, so that state is discarded when the
+    project geometry artifact is rebuilt.
+    """
+    return {'version': STATE_VERSION, **(settings or {})}
+
+
+def update_project_state(
+    previous_state: dict,
+    candidate_fires: dict,
+    nifc_perimeters: geopandas.GeoDataFrame,
+    load_geometries=None,
+    summarize=None,
+    settings: dict = None,
+) -> dict:
+    """Recompute summaries only for projects whose inputs changed
+
+    A project is recomputed if it is new, its geometry changed, a fire started or stopped
+    touching its hull, or one of the fires touching its hull was added, removed or
+    reshaped since the previous snapshot. Everything else is carried forward. A previous
+    state computed with other `settings` is discarded entirely.
+
+    Arguments:
+        previous_state {dict} -- state returned by the previous run, or `empty_project_state()`
+        candidate_fires {dict} -- opr_id -> IRWINIDs of fires intersecting the project hull
+        nifc_perimeters {geopandas.GeoDataFrame} -- fire perimeters, to date.
+        load_geometries {callable} -- loads geometries of a list of opr_ids, defaults to
+            `canonical.load_project_geometries`
+        summarize {callable} -- summarizes (project geometries, fire perimeters), defaults
+            to `summarize_projects`
+        settings {dict} -- JSON-serializable description of how results are computed
+
+    Returns:
+        dict -- new state; `projects` holds one entry per candidate, in candidate order
+    """
+    settings = state_settings(settings)
+    if previous_state.get('settings') != settings:
+        if previous_state['projects']:
+            logger.info('Previous project state was computed with other settings, discarding it')
+        previous_state = empty_project_state(settings)
+
+    fingerprints = fingerprint_fires(nifc_perimeters)
+    diff = diff_fire_fingerprints(previous_state['fires'], fingerprints)
+    changed = set(diff['added']) | set(diff['removed']) | set(diff['changed'])
+    logger.info(
+        f"NIFC diff: {len(diff['added'])} added, {len(diff['removed'])} removed, "
+        f"{len(diff['changed'])} changed"
+    )
+
+    # hash exactly the geometries that would be summarized
+    project_geoms = (load_geometries or canonical.load_project_geometries)(list(candidate_fires))
+    geometry_hashes = hash_project_geometries(project_geoms)
+
+    dirty = []
+    for opr_id, fire_ids in candidate_fires.items():
+        previous = previous_state['projects'].get(opr_id)
+        if (
+            previous is None
+            or previous['geometry'] != geometry_hashes.get(opr_id)
+            or set(previous['fires']) != set(fire_ids)
+            or changed.intersection(fire_ids)
+        ):
+            dirty.append(opr_id)
+    logger.info(f'Recomputing {len(dirty)} of {len(candidate_fires)} candidate projects')
+
+    results = {}
+    if dirty:
+        dirty_geoms = project_geoms[project_geoms['opr_id'].isin(dirty)]
+        summarized = (summarize or summarize_projects)(dirty_geoms, nifc_perimeters)
+        results = {r['opr_id']: r for r in summarized}
+
+    projects = {}
+    for opr_id, fire_ids in candidate_fires.items():
+        if opr_id in dirty:
+            result = results.get(opr_id)
+        else:
+            result = previous_state['projects'][opr_id]['result']
+        projects[opr_id] = {
+            'geometry': geometry_hashes.get(opr_id),
+            'fires': fire_ids,
+            'result': result,
+        }
+    return {'settings': settings, 'fires': fingerprints, 'projects': projects}
@@ -0,0 +1,231 @@
+"""Publishing vector tiles to object storage
+
+Each publish writes a complete tile set to a new `{rpath}/{version}/` prefix, with the
+tiles at `{version}/{z}/{x}/{y}.pbf`, a `manifest.json` of tile path -> md5 and, for
+tiles from an mbtiles file, the tile set's `metadata.json`. Only new or changed tiles
+are uploaded; unchanged tiles are copied server-side from the previous version. Once
+the version is complete, `{rpath}/latest.json` is replaced in a single put, so the web
+map, which resolves its tile url through the pointer, switches from one complete tile
+set to the next and never sees a half-written one.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import fsspec
+
+POINTER = 'latest.json'
+MANIFEST = 'manifest.json'
+METADATA = 'metadata.json'
+VERSION_PATTERN = re.compile(r'^\d{8}T\d{6}\d*$')
+MAX_WORKERS = 16
+BATCH_SIZE = 1_000
+
+
+def _md5(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
+
+
+def hash_tile_dir(lpath: str, max_workers: int = MAX_WORKERS) -> dict:
+    """Hash every tile below `lpath`
+
+    Returns:
+        dict -- tile path relative to `lpath` (e.g. `3/1/2.pbf`) -> md5 of its contents
+    """
+    root = Path(lpath)
+    files = [p for p in root.rglob('*') if p.is_file() and p.suffix == '.pbf']
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        hashes = pool.map(lambda p: _md5(p.read_bytes()), files)
+        return {p.relative_to(root).as_posix(): h for p, h in zip(files, hashes)}
+
+
+def read_pointer(rpath: str, fs=None):
+    """Return the currently published version under `rpath`, or None"""
+    fs = fs or fsspec.filesystem('s3', anon=False)
+    try:
+        with fs.open(f'{rpath}/{POINTER}') as f:
+            return json.load(f)['version']
+    except FileNotFoundError:
+        return None
+
+
+def read_manifest(rpath: str, version: str, fs=None) -> dict:
+    """Hashes of the tiles in a published version, empty if there's no manifest"""
+    fs = fs or fsspec.filesystem('s3', anon=False)
+    try:
+        with fs.open(f'{rpath}/{version}/{MANIFEST}') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _versions(rpath: str, fs) -> list:
+    try:
+        names = [os.path.basename(p.rstrip('/')) for p in fs.ls(rpath, detail=False)]
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names if VERSION_PATTERN.match(name))
+
+
+def publish(hashes: dict, rpath: str, upload, fs=None, files: dict = None) -> dict:
+    """Publish a new version of a tile set, transferring only new or changed tiles
+
+    Tiles are written below `{rpath}/{version}/`. Tiles whose hash matches the manifest
+    of the published version are copied server-side from it; the rest are handed to
+    `upload(rel_paths, dst_prefix)`. Once every tile, `files` and the manifest are in
+    place, `{rpath}/latest.json` is overwritten in a single put, so readers switch from
+    the complete old set to the complete new set at once.
+
+    Afterwards every version but the new and the previous one is deleted: readers that
+    resolved the pointer just before the flip keep working, and versions left behind
+    by failed publishes, which were never pointed to, go away.
+
+    Arguments:
+        hashes {dict} -- tile path (e.g. `3/1/2.pbf`) -> md5 of every tile in the new set
+        rpath {str} -- tile set location, e.g. `bucket/web/tiles/{stem}`
+        upload {callable} -- uploads tiles, given their paths and the version prefix
+        fs {fsspec.AbstractFileSystem} -- where `rpath` is, s3 by default
+        files {dict} -- file name -> bytes, written into the version (e.g. `metadata.json`)
+
+    Returns:
+        dict -- the published `version`, and counts of `changed`, `unchanged` and
+            `removed` tiles
+    """
+    fs = fs or fsspec.filesystem('s3', anon=False)
+    version = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+    dst = f'{rpath}/{version}'
+
+    previous = read_pointer(rpath, fs=fs)
+    previous_hashes = read_manifest(rpath, previous, fs=fs) if previous else {}
+    unchanged = [rel for rel, h in hashes.items() if previous_hashes.get(rel) == h]
+    changed = [rel for rel, h in hashes.items() if previous_hashes.get(rel) != h]
+    counts = {
+        'changed': len(changed),
+        'unchanged': len(unchanged),
+        'removed': len(previous_hashes.keys() - hashes.keys()),
+    }
+    print(
+        f"Publishing {rpath}@{version}: {counts['changed']} new or changed, "
+        f"{counts['unchanged']} unchanged, {counts['removed']} removed"
+    )
+
+    if unchanged:
+        fs.copy(
+            [f'{rpath}/{previous}/{rel}' for rel in unchanged],
+            [f'{dst}/{rel}' for rel in unchanged],
+        )
+    if changed:
+        upload(changed, dst)
+    for name, data in (files or {}).items():
+        fs.pipe(f'{dst}/{name}', data)
+    fs.pipe(f'{dst}/{MANIFEST}', json.dumps(hashes).encode())
+
+    pointer = {
+        'version': version,
+        'tiles': f'{version}/{{z}}/{{x}}/{{y}}.pbf',
+        'published_at': datetime.datetime.utcnow().isoformat(),
+    }
+    fs.pipe(f'{rpath}/{POINTER}', json.dumps(pointer).encode())
+
+    for old in _versions(rpath, fs):
+        if old not in (version, previous):
+            fs.rm(f'{rpath}/{old}', recursive=True)
+    return {'version': version, **counts}
+
+
+def publish_tiles(lpath: str, rpath: str, fs=None) -> dict:
+    """Publish the tile tree in `lpath` to `rpath`, see `publish`"""
+    fs = fs or fsspec.filesystem('s3', anon=False)
+
+    def upload(rels, dst):
+        fs.put([f'{lpath}/{rel}' for rel in rels], [f'{dst}/{rel}' for rel in rels])
+
+    return publish(hash_tile_dir(lpath), rpath, upload, fs=fs)
+
+
+def iter_mbtiles(mbtiles_path: str, batch_size: int = BATCH_SIZE):
+    """Yield batches of tiles from an mbtiles file
+
+    mbtiles stores rows in TMS order, so rows are flipped to the XYZ scheme used by web
+    maps (this is what `mb-util` did by default).
+
+    Yields:
+        list -- (`z/x/y.pbf`, tile bytes) tuples
+    """
+    con = sqlite3.connect(f'file:{mbtiles_path}?mode=ro', uri=True)
+    try:
+        cursor = con.execute('SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [(f'{z}/{x}/{(1 << z) - 1 - y}.pbf', data) for z, x, y, data in rows]
+    finally:
+        con.close()
+
+
+def read_mbtiles_metadata(mbtiles_path: str) -> dict:
+    """The mbtiles metadata table (name, bounds, zoom range, vector layers, ...)"""
+    con = sqlite3.connect(f'file:{mbtiles_path}?mode=ro', uri=True)
+    try:
+        return dict(con.execute('SELECT name, value FROM metadata').fetchall())
+    finally:
+        con.close()
+
+
+def extract_mbtiles(
+    mbtiles_path: str, out_dir: str, batch_size: int = BATCH_SIZE, max_workers: int = MAX_WORKERS
+) -> int:
+    """Unpack an mbtiles file into a `z/x/y.pbf` directory tree, with a `metadata.json`
+    like `mb-util` wrote
+
+    Returns:
+        int -- number of tiles written
+    """
+
+    def write(tile):
+        rel, data = tile
+        path = Path(out_dir) / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+    count = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for batch in iter_mbtiles(mbtiles_path, batch_size=batch_size):
+            list(pool.map(write, batch))
+            count += len(batch)
+    metadata = json.dumps(read_mbtiles_metadata(mbtiles_path), indent=4)
+    (Path(out_dir) / METADATA).write_text(metadata)
+    return count
+
+
+def publish_mbtiles(mbtiles_path: str, rpath: str, fs=None, batch_size: int = BATCH_SIZE) -> dict:
+    """Publish tiles straight from an mbtiles file to `rpath`, see `publish`
+
+    No intermediate directory tree is written: tiles are hashed in a first pass over the
+    file and changed tiles are uploaded in concurrent batches in a second pass. The
+    metadata table goes to `{version}/metadata.json`, as it did when tiles were unpacked
+    with `mb-util` and uploaded as a directory.
+    """
+    fs = fs or fsspec.filesystem('s3', anon=False)
+    hashes = {
+        rel: _md5(data)
+        for batch in iter_mbtiles(mbtiles_path, batch_size=batch_size)
+        for rel, data in batch
+    }
+
+    def upload(rels, dst):
+        rels = set(rels)
+        for batch in iter_mbtiles(mbtiles_path, batch_size=batch_size):
+            to_upload = {f'{dst}/{rel}': data for rel, data in batch if rel in rels}
+            if to_upload:
+                fs.pipe(to_upload)
+
+    metadata = json.dumps(read_mbtiles_metadata(mbtiles_path), indent=4)
+    return publish(hashes, rpath, upload, fs=fs, files={METADATA: metadata.encode()})
@@ -7,7 +7,12 @@ import numpy as np
 import pandas as pd
 from bs4 import BeautifulSoup
 
+from carbonplan_forest_offsets_fires import reference
+from carbonplan_forest_offsets_fires.cache import GeometryCache, get_geometry_cache
+
 GEOM_PATH = 's3://carbonplan-forest-offsets/carb-geometries/raw'
+SIMPLIFIED_GEOM_PATH = 'carbonplan-forest-offsets/carb-geometries/simplified'
+
 
 def list_all_opr_ids() -> list:
     """Return list of all opr ids
@@ -23,13 +28,11 @@ def list_all_opr_ids() -> list:
 
 
 def list_all_ea_opr_ids() -> list:
-    """Create list of all EA projects from CARB source"""
-    data = pd.read_html(
-        'https://ww2.arb.ca.gov/our-work/programs/compliance-offset-program/'
-        'early-action-offset-credits/early-action-projects'
-    )[0]
+    """Create list of all EA projects from CARB source
 
-    return np.unique(data.T.values[4]).tolist()
+    The CARB table is scraped at most once per `reference.REFERENCE_TTL`.
+    """
+    return sorted(reference.ea_opr_ids())
 
 
 def extract_northern_corner(polygon):
@@ -40,13 +43,25 @@ def extract_northern_corner(polygon):
     return max_coords
 
 
-def load_project_geometry(opr_id: str) -> geopandas.GeoDataFrame:
-    s3 = fsspec.filesystem('s3', anon=False)
-    with s3.open(
-        f'carbonplan-forest-offsets/carb-geometries/simplified/{opr_id.upper()}.json'
-    ) as f:  # noqa
-        d = json.load(f)
+def load_raw_geometries(opr_ids: list) -> geopandas.GeoDataFrame:
+    """Load raw project geometries from s3 concurrently
 
+    Returns:
+        geopandas.GeoDataFrame -- one row per feature, with an `opr_id` column, in epsg:4326
+    """
+    fs = fsspec.filesystem('s3')
+    # `cat` keys its results by path without the protocol
+    raw_path = GEOM_PATH.removeprefix('s3://')
+    paths = {opr_id: f'{raw_path}/{opr_id}.json' for opr_id in opr_ids}
+    blobs = fs.cat(list(paths.values()))
+    gdfs = [
+        geopandas.GeoDataFrame.from_features(json.loads(blobs[path])).assign(opr_id=opr_id)
+        for opr_id, path in paths.items()
+    ]
+    return pd.concat(gdfs, ignore_index=True).set_crs('epsg:4326')
+
+
+def _read_project_geometry(d: dict) -> geopandas.GeoDataFrame:
     geo = geopandas.GeoDataFrame.from_features(d)
     geo = geo.set_crs('epsg:4326')
     geo = geo.to_crs('epsg:5070')
@@ -54,6 +69,65 @@ def load_project_geometry(opr_id: str) -> geopandas.GeoDataFrame:
     return geo
 
 
+def _get_etags(s3, paths: list) -> dict:
+    if len(paths) == 1:
+        return {paths[0]: s3.info(paths[0])['ETag']}
+    # one listing is much cheaper than a HEAD request per project
+    listing = s3.ls(SIMPLIFIED_GEOM_PATH, detail=True)
+    etags = {entry['name']: entry.get('ETag') for entry in listing}
+    return {path: etags.get(path) or s3.info(path)['ETag'] for path in paths}
+
+
+def _load_cached_project_geometries(opr_ids: list, cache: GeometryCache = None) -> dict:
+    """Load cleaned project geometries, going to s3 only for those missing from `cache`"""
+    cache = cache or get_geometry_cache()
+    s3 = fsspec.filesystem('s3', anon=False)
+    paths = {opr_id: f'{SIMPLIFIED_GEOM_PATH}/{opr_id.upper()}.json' for opr_id in opr_ids}
+    check_etags = cache.enabled and not cache.offline
+    etags = _get_etags(s3, list(paths.values())) if check_etags else {}
+
+    geoms = {}
+    for opr_id, path in paths.items():
+        geoms[opr_id] = cache.get(path, etags.get(path))
+
+    missing = [opr_id for opr_id, geo in geoms.items() if geo is None]
+    if missing and cache.offline:
+        raise FileNotFoundError(f'Geometries for {missing} are not cached and running offline')
+    if missing:
+        blobs = s3.cat([paths[opr_id] for opr_id in missing])
+        for opr_id in missing:
+            path = paths[opr_id]
+            geoms[opr_id] = _read_project_geometry(json.loads(blobs[path]))
+            if cache.enabled:
+                cache.put(path, etags[path], geoms[opr_id])
+    return geoms
+
+
+def load_project_geometry(opr_id: str, cache: GeometryCache = None) -> geopandas.GeoDataFrame:
+    return _load_cached_project_geometries([opr_id], cache=cache)[opr_id]
+
+
+def load_project_geometries(opr_ids: list, cache: GeometryCache = None) -> geopandas.GeoDataFrame:
+    """Load simplified geometries for many projects at once
+
+    Geometries are served from the local geometry cache when possible, the rest are
+    fetched from s3 concurrently and cleaned up exactly like `load_project_geometry`.
+
+    Arguments:
+        opr_ids {list} -- OPR ids to load
+        cache {GeometryCache} -- defaults to `cache.get_geometry_cache()`
+
+    Returns:
+        geopandas.GeoDataFrame -- one row per feature, with an `opr_id` column, in epsg:5070
+    """
+    if len(opr_ids) == 0:
+        return geopandas.GeoDataFrame({'opr_id': []}, geometry=[], crs='epsg:5070')
+
+    geoms = _load_cached_project_geometries(opr_ids, cache=cache)
+    gdf = pd.concat([geo.assign(opr_id=opr_id) for opr_id, geo in geoms.items()], ignore_index=True)
+    return gdf[['opr_id', *gdf.columns.drop('opr_id')]]
+
+
 def get_inciweb_uris() -> dict:
     """Key-value store of fire names and inciweb uris
 
@@ -0,0 +1,8 @@
+from carbonplan_forest_offsets_fires.catalog import CATALOG_PATH, rebuild_catalog
+from carbonplan_forest_offsets_fires.prefect.tasks.nifc import NIFC_BUCKET
+
+# Bootstraps the NIFC snapshot catalog, or catalogs snapshots it missed, by downloading
+# every snapshot in the bucket once
+print(f"Cataloguing snapshots in {NIFC_BUCKET}")
+catalog = rebuild_catalog(NIFC_BUCKET)
+print(f"Wrote {len(catalog)} snapshots to {CATALOG_PATH}")
@@ -0,0 +1,127 @@
+"""Seeded generators of synthetic projects, fire perimeters and FIRMS detections
+
+Everything is generated in epsg:5070 over a CONUS-sized extent, so benchmarks run fully
+offline with data that has the shapes real inputs have: irregular, vertex-heavy
+boundaries, multipart projects, holes, and a few self-intersecting rings like ACR361's.
+"""
+import geopandas
+import numpy as np
+import pandas as pd
+import shapely
+
+EXTENT = (-2_000_000, 300_000, 2_200_000, 3_100_000)  # xmin, ymin, xmax, ymax in epsg:5070
+
+
+def irregular_ring(rng, x: float, y: float, radius: float, n_vertices: int) -> np.ndarray:
+    """A closed, star-shaped ring with a smoothly noisy radius"""
+    theta = np.sort(rng.uniform(0, 2 * np.pi, n_vertices))
+    harmonics = np.arange(1, 8)
+    amplitude = rng.normal(0, 0.15, len(harmonics)) / harmonics
+    phase = rng.uniform(0, 2 * np.pi, len(harmonics))
+    r = radius * (1 + (amplitude * np.sin(np.outer(theta, harmonics) + phase)).sum(axis=1))
+    ring = np.column_stack([x + r * np.cos(theta), y + r * np.sin(theta)])
+    return np.vstack([ring, ring[:1]])
+
+
+def bowtie(ring: np.ndarray) -> np.ndarray:
+    """Swap two vertices so the ring crosses itself"""
+    ring = ring.copy()
+    i = len(ring) // 3
+    ring[[i, 2 * i]] = ring[[2 * i, i]]
+    return ring
+
+
+def make_projects(
+    n: int,
+    seed: int = 0,
+    multipart_fraction: float = 0.3,
+    hole_fraction: float = 0.2,
+    invalid_fraction: float = 0.05,
+    n_vertices: int = 400,
+) -> geopandas.GeoDataFrame:
+    """Synthetic project geometries with an `opr_id` column, in epsg:5070
+
+    Invalid geometries are left invalid, as they are in the raw CARB files.
+    """
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = EXTENT
+    geoms = []
+    for _ in range(n):
+        x, y = rng.uniform(xmin, xmax), rng.uniform(ymin, ymax)
+        radius = rng.lognormal(np.log(4_000), 0.6)
+        parts = []
+        for k in range(1 + (rng.random() < multipart_fraction) * rng.integers(1, 4)):
+            px, py = (x, y) if k == 0 else (x, y) + rng.normal(0, 4 * radius, 2)
+            shell = irregular_ring(rng, px, py, radius / (1 + k), n_vertices)
+            holes = []
+            if rng.random() < hole_fraction:
+                holes.append(irregular_ring(rng, px, py, radius / (4 + k), n_vertices // 8))
+            if rng.random() < invalid_fraction:
+                shell = bowtie(shell)
+            parts.append(shapely.Polygon(shell, holes))
+        geoms.append(parts[0] if len(parts) == 1 else shapely.MultiPolygon(parts))
+    return geopandas.GeoDataFrame(
+        {'opr_id': [f'SYN{i:04d}' for i in range(n)]}, geometry=geoms, crs='epsg:5070'
+    )
+
+
+def make_fires(
+    n: int, seed: int = 1, projects: geopandas.GeoDataFrame = None, near_projects: float = 0.5
+) -> geopandas.GeoDataFrame:
+    """Synthetic fire perimeters with NIFC-style columns, in epsg:5070
+
+    A `near_projects` share of fires is started close to `projects`, so that summaries
+    have overlaps to compute.
+    """
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = EXTENT
+    centers = np.column_stack([rng.uniform(xmin, xmax, n), rng.uniform(ymin, ymax, n)])
+    if projects is not None and len(projects):
+        near = rng.random(n) < near_projects
+        anchors = shapely.get_coordinates(
+            projects.geometry.representative_point().values[rng.integers(0, len(projects), n)]
+        )
+        centers[near] = anchors[near] + rng.normal(0, 5_000, (near.sum(), 2))
+    geoms = [
+        shapely.Polygon(
+            irregular_ring(rng, cx, cy, rng.lognormal(np.log(2_000), 1.0), rng.integers(50, 800))
+        ).buffer(0)
+        for cx, cy in centers
+    ]
+    return geopandas.GeoDataFrame(
+        {
+            'poly_IRWINID': [f'{{{i:08d}-SYN}}' for i in range(n)],
+            'name': [f'Synthetic {i} Fire' for i in range(n)],
+            'start_date': pd.Timestamp('2022-06-01')
+            + pd.to_timedelta(rng.integers(0, 120, n), 'D'),
+        },
+        geometry=geoms,
+        crs='epsg:5070',
+    )
+
+
+def make_detections(n: int, seed: int = 2) -> pd.DataFrame:
+    """Synthetic FIRMS detections in lat/lon, clustered like active fire pixels"""
+    rng = np.random.default_rng(seed)
+    clusters = np.column_stack(
+        [rng.uniform(25, 70, n // 20 + 1), rng.uniform(-170, -65, n // 20 + 1)]
+    )
+    points = clusters[rng.integers(0, len(clusters), n)] + rng.normal(0, 0.05, (n, 2))
+    return pd.DataFrame(
+        {
+            'latitude': points[:, 0].astype(np.float32),
+            'longitude': points[:, 1].astype(np.float32),
+            'frp': rng.lognormal(2, 1, n).astype(np.float32),
+        }
+    )
+
+
+def make_mask(seed: int = 3) -> shapely.Geometry:
+    """A multipart lat/lon mask standing in for the US boundary"""
+    rng = np.random.default_rng(seed)
+    parts = [
+        shapely.Polygon(irregular_ring(rng, -98, 39, 14, 2_000)),
+        shapely.Polygon(irregular_ring(rng, -152, 64, 8, 1_000)),
+        shapely.Polygon(irregular_ring(rng, -157, 20.5, 1.5, 200)),
+    ]
+    return shapely.union_all([p.buffer(0) for p in parts])
@@ -0,0 +1,140 @@
+"""Offline benchmarks of the hot paths, run with `pytest --run-benchmarks`
+
+Results (time and peak memory per data size) are written to `--benchmark-json`, and can
+be compared against a previous run with `--benchmark-compare`.
+"""
+import pytest
+
+from carbonplan_forest_offsets_fires import sindex, stats
+from carbonplan_forest_offsets_fires.geojson import write_geojson
+from carbonplan_forest_offsets_fires.prefect.tasks import geometry, nifc
+
+from ..conftest import BENCHMARK_SIZES
+from .synthetic import make_detections, make_fires, make_mask, make_projects
+
+pytestmark = pytest.mark.benchmark
+
+
+@pytest.fixture(scope='session')
+def synthetic(benchmark_size):
+    n_projects, n_fires, n_detections = BENCHMARK_SIZES[benchmark_size]
+    projects = make_projects(n_projects)
+    # loaded project geometries are always valid, see `canonical.load_project_geometries`
+    cleaned = projects.assign(geometry=projects.buffer(0))
+    return {
+        'projects': cleaned,
+        'fires': make_fires(n_fires, projects=projects),
+        'detections': make_detections(n_detections),
+    }
+
+
+@pytest.fixture(scope='session')
+def project_index(synthetic, tmp_path_factory):
+    path = tmp_path_factory.mktemp('sindex') / 'projects.sindex'
+    sindex.write_project_index(synthetic['projects'], str(path))
+    return sindex.ProjectIndex(str(path))
+
+
+@pytest.fixture(scope='session')
+def candidate_fires(synthetic, project_index):
+    return stats.get_candidate_fires(synthetic['fires'], project_index)
+
+
+def load_geometries(projects):
+    """Stand-in for `canonical.load_project_geometries`"""
+    return lambda opr_ids: projects[projects['opr_id'].isin(opr_ids)]
+
+
+def test_get_candidate_fires(measure, synthetic, project_index):
+    candidates = measure(stats.get_candidate_fires, synthetic['fires'], project_index)
+    assert len(candidates)
+
+
+def test_cascade_pairs(measure, synthetic):
+    _, fire_idx, _, _ = measure(
+        stats.cascade_pairs,
+        synthetic['projects'].geometry.values.to_numpy(),
+        synthetic['fires'].geometry.values.to_numpy(),
+    )
+    assert len(fire_idx)
+
+
+def test_update_project_state_full(measure, synthetic, candidate_fires):
+    # a first run, or one after the state was discarded, recomputes every candidate
+    state = measure(
+        stats.update_project_state,
+        stats.empty_project_state(),
+        candidate_fires,
+        synthetic['fires'],
+        load_geometries=load_geometries(synthetic['projects']),
+    )
+    assert len(state['projects']) == len(candidate_fires)
+
+
+def test_update_project_state_incremental(measure, synthetic, candidate_fires):
+    fires, projects = synthetic['fires'], synthetic['projects']
+    state = stats.update_project_state(
+        stats.empty_project_state(),
+        candidate_fires,
+        fires,
+        load_geometries=load_geometries(projects),
+    )
+    # a typical overnight update: a few fires near projects grew
+    grown = sorted({fire_id for fire_ids in candidate_fires.values() for fire_id in fire_ids})[:5]
+    fires = fires.copy()
+    edited = fires['poly_IRWINID'].isin(grown)
+    fires.loc[edited, 'geometry'] = fires[edited].buffer(500)
+
+    updated = measure(
+        stats.update_project_state,
+        state,
+        candidate_fires,
+        fires,
+        load_geometries=load_geometries(projects),
+    )
+    assert len(updated['projects']) == len(candidate_fires)
+
+
+def test_buffer_geometries(measure, synthetic):
+    buffered = measure(geometry.buffer_geometries.run, synthetic['projects'], 30)
+    assert len(buffered) == len(synthetic['projects'])
+
+
+def test_get_nifc_unary_union(measure, synthetic):
+    union = measure(nifc.get_nifc_unary_union.run, synthetic['fires'])
+    assert union.is_valid
+
+
+def test_mask_df(measure, synthetic, firms):
+    mask = make_mask()
+    masked = measure(firms.mask_df, synthetic['detections'], mask=mask)
+    assert 0 < len(masked) < len(synthetic['detections'])
+
+
+def test_get_fire_metadata(measure, synthetic):
+    metadata = measure(stats.get_fire_metadata, synthetic['fires'])
+    assert len(metadata) == len(synthetic['fires'])
+
+
+def test_write_project_geojson(measure, synthetic, tmp_path):
+    measure(write_geojson, synthetic['projects'], tmp_path / 'projects.json', ['opr_id'])
+
+
+def test_write_fire_json(measure, synthetic, tmp_path):
+    measure(nifc.write_fire_json.run, synthetic['fires'], str(tmp_path))
+
+
+def test_write_firms_json(measure, synthetic, tmp_path, firms):
+    masked = firms.mask_df(synthetic['detections'], mask=make_mask())
+    measure(firms.write_firms_json, data=masked, tempdir=str(tmp_path))
+
+
+@pytest.mark.parametrize('profile', ['full', 'stats'])
+def test_load_nifc_data(measure, synthetic, tmp_path, profile):
+    fires = synthetic['fires'].rename(columns={v: k for k, v in nifc.RENAMES.items()})
+    # WFIGS snapshots carry ~100 attribute columns that no flow reads
+    extra = {f'attr_Unused{i}': fires['poly_IRWINID'] + f' {i}' for i in range(50)}
+    path = tmp_path / 'perimeters.parquet'
+    fires.assign(**extra).to_parquet(path)
+    perimeters = measure(nifc.load_nifc_data, str(path), profile=profile)
+    assert len(perimeters) == len(fires)
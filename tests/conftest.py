@@ -0,0 +1,207 @@
+import datetime
+import importlib
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+import tracemalloc
+
+import pytest
+
+BENCHMARK_SIZES = {
+    # name -> (projects, fires, FIRMS detections)
+    'small': (50, 200, 10_000),
+    'medium': (250, 1_000, 100_000),
+    'large': (1_000, 5_000, 1_000_000),
+}
+REGRESSION_RATIO = 1.5  # flag benchmarks this much slower than the compared run
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('benchmarks')
+    group.addoption('--run-benchmarks', action='store_true', help='run the offline benchmark suite')
+    group.addoption(
+        '--benchmark-sizes',
+        default='small,medium',
+        help=f"comma separated data sizes to run, from {', '.join(BENCHMARK_SIZES)}",
+    )
+    group.addoption('--benchmark-rounds', type=int, default=3, help='timed runs per benchmark')
+    group.addoption(
+        '--benchmark-json', default='benchmark-results.json', help='where to write results'
+    )
+    group.addoption(
+        '--benchmark-compare', default=None, help='previous results json to compare against'
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if 'benchmark_size' in metafunc.fixturenames:
+        sizes = metafunc.config.getoption('--benchmark-sizes').split(',')
+        metafunc.parametrize('benchmark_size', [s.strip() for s in sizes], scope='session')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--run-benchmarks'):
+        return
+    skip = pytest.mark.skip(reason='benchmarks only run with --run-benchmarks')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'benchmark: offline performance benchmark')
+    config._benchmark_results = []
+
+
+def _rss() -> int:
+    """Resident set size of this process in bytes, or 0 where /proc isn't available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return 0
+
+
+class _RSSSampler(threading.Thread):
+    """Track peak RSS growth while running, to catch memory allocated by GEOS"""
+
+    def __init__(self, interval: float = 0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.baseline = self.peak = _rss()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, _rss())
+
+    def stop(self) -> int:
+        self._done.set()
+        self.join()
+        return max(self.peak, _rss()) - self.baseline
+
+
+class Measure:
+    """Time a callable over several rounds and record its peak memory
+
+    Memory is measured on one extra, untimed run: `peak_traced_mb` covers Python and
+    numpy allocations (via tracemalloc), `peak_rss_mb` is the growth of resident memory,
+    which also sees allocations made in GEOS.
+    """
+
+    def __init__(self, request, rounds: int):
+        self.request = request
+        self.rounds = rounds
+        self.results = request.config._benchmark_results
+
+    def __call__(self, fn, *args, **kwargs):
+        sampler = _RSSSampler()
+        sampler.start()
+        tracemalloc.start()
+        result = fn(*args, **kwargs)
+        _, peak_traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_rss = sampler.stop()
+
+        times = []
+        for _ in range(self.rounds):
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            times.append(time.perf_counter() - start)
+        times.sort()
+        params = dict(self.request.node.callspec.params)
+        size = params.pop('benchmark_size', None)
+        self.results.append(
+            {
+                # other parameters tell variants apart, the size is reported separately
+                'name': self.request.node.originalname + ''.join(f'[{v}]' for v in params.values()),
+                'size': size,
+                'rounds': self.rounds,
+                'min_seconds': times[0],
+                'median_seconds': times[len(times) // 2],
+                'peak_traced_mb': peak_traced / 2**20,
+                'peak_rss_mb': peak_rss / 2**20,
+            }
+        )
+        return result
+
+
+@pytest.fixture
+def measure(request):
+    return Measure(request, request.config.getoption('--benchmark-rounds'))
+
+
+@pytest.fixture(scope='session')
+def firms():
+    """The firms module, imported with a placeholder API key if none is set
+
+    firms reads its key at import; tests and benchmarks never hit the API.
+    """
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('FIRMS_MAP_KEY', os.environ.get('FIRMS_MAP_KEY', 'offline'))
+        return importlib.import_module('carbonplan_forest_offsets_fires.firms')
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def pytest_sessionfinish(session):
+    results = session.config._benchmark_results
+    if not results:
+        return
+    with open(session.config.getoption('--benchmark-json'), 'w') as f:
+        json.dump(
+            {
+                'created_at': datetime.datetime.utcnow().isoformat(),
+                'commit': _git_commit(),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cpu_count': os.cpu_count(),
+                'results': results,
+            },
+            f,
+            indent=2,
+        )
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = config._benchmark_results
+    if not results:
+        return
+    previous = {}
+    compare = config.getoption('--benchmark-compare')
+    if compare:
+        with open(compare) as f:
+            previous = {(r['name'], r['size']): r for r in json.load(f)['results']}
+
+    terminalreporter.section('benchmarks')
+    terminalreporter.write_line(
+        f"{'benchmark':<40} {'size':<8} {'median s':>10} {'traced MB':>10} {'rss MB':>10} "
+        f"{'vs prev':>8}"
+    )
+    regressions = []
+    for r in results:
+        prev = previous.get((r['name'], r['size']))
+        ratio = r['median_seconds'] / prev['median_seconds'] if prev else None
+        if ratio is not None and ratio > REGRESSION_RATIO:
+            regressions.append(r)
+        terminalreporter.write_line(
+            f"{r['name']:<40} {r['size'] or '':<8} {r['median_seconds']:>10.4f} "
+            f"{r['peak_traced_mb']:>10.1f} {r['peak_rss_mb']:>10.1f} "
+            f"{f'{ratio:.2f}x' if ratio is not None else '':>8}"
+        )
+    for r in regressions:
+        terminalreporter.write_line(
+            f"regression: {r['name']} [{r['size']}] is over {REGRESSION_RATIO}x slower than "
+            f'{compare}',
+            red=True,
+        )
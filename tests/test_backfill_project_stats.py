@@ -0,0 +1,138 @@
+import datetime
+import json
+import os
+
+import geopandas
+import pytest
+import shapely
+
+from carbonplan_forest_offsets_fires import sindex
+from carbonplan_forest_offsets_fires.prefect.workflows import backfill_project_stats as backfill
+
+CRS = 'epsg:5070'
+DAYS = [datetime.datetime(2026, 7, day) for day in range(1, 7)]
+PROJECTS = geopandas.GeoDataFrame(
+    {'opr_id': ['A', 'B']},
+    geometry=[shapely.box(0, 0, 10_000, 10_000), shapely.box(100_000, 0, 110_000, 10_000)],
+    crs=CRS,
+)
+
+
+def fires_on(day: datetime.datetime) -> geopandas.GeoDataFrame:
+    """A fire in each project; the one in A grows on the fourth day"""
+    size = 6_000 if day < DAYS[3] else 8_000
+    return geopandas.GeoDataFrame(
+        {
+            'poly_IRWINID': ['f1', 'f2'],
+            'name': ['Alpha Fire', 'Bravo Fire'],
+            'start_date': [1_656_633_600_000] * 2,
+        },
+        geometry=[shapely.box(0, 0, size, size), shapely.box(100_000, 0, 106_000, 6_000)],
+        crs=CRS,
+    )
+
+
+@pytest.fixture
+def run(monkeypatch, tmp_path):
+    """Backfill DAYS with stubbed inputs; returns the states written and a per-day log
+
+    Stubs are inherited by the forked workers, which log to one file per process.
+    """
+    index_path = str(tmp_path / 'projects.sindex')
+    sindex.write_project_index(PROJECTS, index_path)
+    snapshots = [(day, f's3://nifc/{day:%Y-%m-%d}.parquet') for day in DAYS]
+    by_path = {path: day for day, path in snapshots}
+    written_dir = tmp_path / 'written'
+    written_dir.mkdir()
+
+    def log(*entry):
+        with open(tmp_path / f'log-{os.getpid()}.jsonl', 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def load_nifc_data(path, profile='full'):
+        log('load', f'{by_path[path]:%Y-%m-%d}')
+        return fires_on(by_path[path])
+
+    def summarize(project_geoms, nifc_perimeters):
+        log('summarize', sorted(project_geoms['opr_id']))
+        return summarize_projects(project_geoms, nifc_perimeters)
+
+    def write_state_as_of(as_of, annotated):
+        # exclusive create: writing a date twice fails
+        with open(written_dir / f'{as_of:%Y-%m-%d}.json', 'x') as f:
+            json.dump(annotated, f)
+
+    summarize_projects = backfill.stats.summarize_projects
+    monkeypatch.setattr(backfill.nifc, 'resolve_nifc_snapshots', lambda *args: snapshots)
+    monkeypatch.setattr(backfill.nifc, 'load_nifc_data', load_nifc_data)
+    monkeypatch.setattr(backfill.stats, 'summarize_projects', summarize)
+    monkeypatch.setattr(
+        backfill.calculate_project_stats.write_state_as_of, 'run', write_state_as_of
+    )
+    monkeypatch.setattr(
+        backfill.geometry.load_project_index, 'run', lambda: sindex.ProjectIndex(index_path)
+    )
+    monkeypatch.setattr(
+        backfill.canonical,
+        'load_project_geometries',
+        lambda opr_ids: PROJECTS[PROJECTS['opr_id'].isin(opr_ids)],
+    )
+    monkeypatch.setattr(backfill.canonical, 'artifact_identity', lambda: {'path': None})
+    monkeypatch.setattr(
+        backfill.inciweb, 'load_inciweb_index', lambda: backfill.inciweb.InciWebIndex({})
+    )
+
+    def run(max_workers: int):
+        monkeypatch.setattr(backfill, '_worker', {})
+        for path in [*written_dir.iterdir(), *tmp_path.glob('log-*.jsonl')]:
+            path.unlink()
+        dates = backfill.backfill_project_stats(DAYS[0], DAYS[-1], max_workers=max_workers)
+        written = {p.stem: json.loads(p.read_text()) for p in sorted(written_dir.iterdir())}
+        recomputed = {}
+        logs = list(tmp_path.glob('log-*.jsonl'))
+        for path in logs:
+            day = None
+            for kind, value in map(json.loads, path.read_text().splitlines()):
+                if kind == 'load':
+                    day = value
+                    recomputed[day] = []
+                else:
+                    recomputed[day] = value
+        return dates, written, recomputed, len(logs)
+
+    return run
+
+
+def test_backfill_in_one_process(run):
+    dates, written, recomputed, processes = run(max_workers=1)
+    assert processes == 1
+    assert dates == DAYS
+    assert list(written) == [f'{day:%Y-%m-%d}' for day in DAYS]
+    # state carries from day to day: only the first day and the day A's fire grew
+    assert recomputed == {
+        '2026-07-01': ['A', 'B'],
+        '2026-07-02': [],
+        '2026-07-03': [],
+        '2026-07-04': ['A'],
+        '2026-07-05': [],
+        '2026-07-06': [],
+    }
+    assert [p['opr_id'] for p in written['2026-07-06']] == ['A', 'B']
+
+
+def test_backfill_chunks_match_one_process(run):
+    _, serial, _, _ = run(max_workers=1)
+    dates, written, recomputed, processes = run(max_workers=3)
+    assert processes == 3
+    # every date written exactly once, in date order, with the same results
+    assert dates == DAYS
+    assert written == serial
+    # each chunk of two days starts from an empty state
+    assert recomputed == {
+        '2026-07-01': ['A', 'B'],
+        '2026-07-02': [],
+        '2026-07-03': ['A', 'B'],
+        '2026-07-04': ['A'],
+        '2026-07-05': ['A', 'B'],
+        '2026-07-06': [],
+    }
@@ -0,0 +1,105 @@
+import geopandas
+import numpy as np
+import pytest
+import shapely
+
+from carbonplan_forest_offsets_fires import canonical
+
+
+def wiggly_polygon(x: float, y: float, n: int = 200) -> shapely.Polygon:
+    angles = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    radii = 0.05 * (1 + 0.05 * np.sin(17 * angles))
+    return shapely.Polygon(
+        np.column_stack([x + radii * np.cos(angles), y + radii * np.sin(angles)])
+    )
+
+
+@pytest.fixture
+def raw():
+    """Raw CARB-like geometries in epsg:4326, with a two-feature project and a bowtie"""
+    bowtie = shapely.Polygon([(-119, 38), (-118.9, 38.1), (-118.9, 38), (-119, 38.1)])
+    return geopandas.GeoDataFrame(
+        {'opr_id': ['C', 'A', 'B', 'A', 'D']},
+        geometry=[
+            wiggly_polygon(-122, 42),
+            wiggly_polygon(-120, 40),
+            wiggly_polygon(-110, 45),
+            wiggly_polygon(-120.2, 40.1),
+            bowtie,
+        ],
+        crs='epsg:4326',
+    )
+
+
+@pytest.fixture
+def artifact(raw, tmp_path) -> str:
+    path = str(tmp_path / 'projects.parquet')
+    canonical.write_project_geometries(canonical.prepare_project_geometries(raw), path)
+    return path
+
+
+def test_prepare_project_geometries(raw):
+    gdf = canonical.prepare_project_geometries(raw)
+    assert gdf.columns.tolist() == ['opr_id', 'part', 'area', 'repaired', *canonical.LEVELS]
+    assert gdf.crs == canonical.CRS
+    # each project's features stay together, in their original order
+    a = gdf.index[gdf['opr_id'] == 'A']
+    assert a.tolist() == [a[0], a[0] + 1]
+    assert gdf.loc[a, 'part'].tolist() == [0, 1]
+    assert gdf.set_index('opr_id')['repaired'].to_dict() == {
+        'A': False,
+        'B': False,
+        'C': False,
+        'D': True,
+    }
+    for level in canonical.LEVELS:
+        assert gdf[level].is_valid.all()
+    vertices = {
+        level: shapely.get_num_coordinates(gdf[level].values).sum()
+        for level in ['simplified', 'overview']
+    }
+    assert (
+        vertices['overview']
+        < vertices['simplified']
+        < shapely.get_num_coordinates(gdf.geometry.values).sum()
+    )
+
+
+def test_read_project_geometries_levels(artifact):
+    full = canonical.read_project_geometries(level='geometry', path=artifact)
+    overview = canonical.read_project_geometries(level='overview', path=artifact)
+    assert full['opr_id'].tolist() == overview['opr_id'].tolist()
+    assert overview.geometry.name == 'geometry'
+    assert (
+        shapely.get_num_coordinates(overview.geometry.values)
+        < shapely.get_num_coordinates(full.geometry.values)
+    )[full['opr_id'] != 'D'].all()
+
+    with pytest.raises(ValueError, match='Unknown level'):
+        canonical.read_project_geometries(level='raw', path=artifact)
+
+
+def test_read_project_geometries_in_opr_id_order(artifact):
+    gdf = canonical.read_project_geometries(
+        ['B', 'A', 'C', 'A'], columns=('opr_id', 'part'), path=artifact
+    )
+    assert gdf.columns.tolist() == ['opr_id', 'part', 'geometry']
+    assert gdf[['opr_id', 'part']].values.tolist() == [['B', 0], ['A', 0], ['A', 1], ['C', 0]]
+
+    empty = canonical.read_project_geometries([], path=artifact)
+    assert empty.columns.tolist() == ['opr_id', 'geometry'] and len(empty) == 0
+
+
+def test_read_project_geometries_bbox(artifact):
+    full = canonical.read_project_geometries(path=artifact)
+    a = full.loc[full['opr_id'] == 'A'].total_bounds
+    gdf = canonical.read_project_geometries(bbox=tuple(a), path=artifact)
+    assert gdf['opr_id'].tolist() == ['A', 'A']
+
+
+def test_artifact_identity(artifact, tmp_path):
+    identity = canonical.artifact_identity(artifact)
+    assert identity['path'] == artifact
+    assert identity['levels'] == canonical.LEVELS
+    assert identity['format_version'] == canonical.FORMAT_VERSION
+    assert canonical.artifact_identity(str(tmp_path / 'missing.parquet')) == {'path': None}
@@ -0,0 +1,134 @@
+import datetime
+
+import geopandas
+import pandas as pd
+import pytest
+import shapely
+
+from carbonplan_forest_offsets_fires import catalog
+from carbonplan_forest_offsets_fires.prefect.tasks import nifc
+
+BUCKET = 'carbonplan-forest-offsets/fires/nifc-data'
+TIMESTAMPS = [
+    datetime.datetime(2026, 7, 1, 6),
+    datetime.datetime(2026, 7, 1, 18),
+    datetime.datetime(2026, 7, 3, 6),
+    datetime.datetime(2026, 7, 4, 6),
+]
+
+
+def snapshot_path(timestamp: datetime.datetime) -> str:
+    return f's3://{BUCKET}/{timestamp.isoformat()}_raw_nifc_perimeters.parquet'
+
+
+def entry(timestamp: datetime.datetime) -> dict:
+    return {
+        'timestamp': timestamp,
+        'path': snapshot_path(timestamp),
+        'record_count': 1,
+        'xmin': 0.0,
+        'ymin': 0.0,
+        'xmax': 1.0,
+        'ymax': 1.0,
+        'schema_version': 'abc',
+        'content_hash': 'def',
+    }
+
+
+@pytest.fixture
+def snapshots() -> catalog.SnapshotCatalog:
+    # out of order, like a catalog appended to by hand
+    return catalog.SnapshotCatalog(pd.DataFrame([entry(t) for t in TIMESTAMPS[::-1]]))
+
+
+def test_latest(snapshots):
+    assert snapshots.latest()['path'] == snapshot_path(TIMESTAMPS[-1])
+    assert snapshots.latest(before=TIMESTAMPS[1])['path'] == snapshot_path(TIMESTAMPS[1])
+    between = TIMESTAMPS[1] + datetime.timedelta(hours=1)
+    assert snapshots.latest(before=between)['path'] == snapshot_path(TIMESTAMPS[1])
+    assert snapshots.latest(before=datetime.datetime(2026, 6, 30)) is None
+    assert catalog.SnapshotCatalog.empty().latest() is None
+
+
+def test_on_date(snapshots):
+    # the latest of the day's snapshots
+    assert snapshots.on_date(datetime.date(2026, 7, 1))['path'] == snapshot_path(TIMESTAMPS[1])
+    assert snapshots.on_date(datetime.date(2026, 7, 2)) is None
+    assert snapshots.on_date(datetime.date(2026, 7, 4))['path'] == snapshot_path(TIMESTAMPS[3])
+
+
+def test_between_and_daily(snapshots):
+    between = snapshots.between(TIMESTAMPS[1], TIMESTAMPS[2])
+    assert between['path'].tolist() == [snapshot_path(t) for t in TIMESTAMPS[1:3]]
+    assert snapshots.daily(datetime.date(2026, 7, 1), datetime.date(2026, 7, 3)) == [
+        (datetime.datetime(2026, 7, 1), snapshot_path(TIMESTAMPS[1])),
+        (datetime.datetime(2026, 7, 3), snapshot_path(TIMESTAMPS[2])),
+    ]
+
+
+def test_append_save_and_load(snapshots, tmp_path):
+    path = str(tmp_path / 'snapshots.parquet')
+    later = datetime.datetime(2026, 7, 5, 6)
+    appended = snapshots.append(entry(later))
+    assert appended.append(entry(later)) is appended
+    appended.save(path)
+
+    loaded = catalog.load_catalog(path)
+    assert len(loaded) == 5
+    assert loaded.latest()['path'] == snapshot_path(later)
+    with pytest.raises(FileNotFoundError):
+        catalog.load_catalog(str(tmp_path / 'missing.parquet'))
+
+
+def test_describe_snapshot(tmp_path):
+    local = str(tmp_path / 'snapshot.parquet')
+    geopandas.GeoDataFrame(
+        {'poly_IRWINID': ['a', 'b']},
+        geometry=[shapely.box(0, 0, 1, 1), shapely.box(2, -1, 3, 1)],
+        crs='epsg:4326',
+    ).to_parquet(local)
+    described = catalog.describe_snapshot(local, snapshot_path(TIMESTAMPS[0]))
+    assert described['timestamp'] == TIMESTAMPS[0]
+    assert described['record_count'] == 2
+    assert [described[k] for k in ['xmin', 'ymin', 'xmax', 'ymax']] == [0, -1, 3, 1]
+
+
+class FakeS3:
+    """Prefix listings of a bucket of snapshot keys"""
+
+    def __init__(self, paths: list):
+        self.keys = [path.removeprefix('s3://') for path in paths]
+        self.prefixes = []
+
+    def find(self, path, prefix=''):
+        self.prefixes.append(prefix)
+        return sorted(key for key in self.keys if key.startswith(f'{path}/{prefix}'))
+
+
+def test_uncatalogued_snapshots(snapshots):
+    missed = [datetime.datetime(2026, 7, 4, 18), datetime.datetime(2026, 7, 6, 6)]
+    fs = FakeS3([snapshot_path(t) for t in [*TIMESTAMPS, *missed]])
+    newer = catalog.uncatalogued_snapshots(
+        snapshots, BUCKET, until=datetime.date(2026, 7, 6), fs=fs
+    )
+    assert newer == [snapshot_path(t) for t in missed]
+    # only the days since the latest catalogued snapshot are listed
+    assert fs.prefixes == ['2026-07-04', '2026-07-05', '2026-07-06']
+
+    fs = FakeS3([snapshot_path(t) for t in TIMESTAMPS])
+    until = datetime.date(2026, 7, 4)
+    assert catalog.uncatalogued_snapshots(snapshots, BUCKET, until=until, fs=fs) == []
+
+
+def test_get_nifc_filename_finds_uncatalogued_snapshots(snapshots, monkeypatch):
+    monkeypatch.setattr(nifc.catalog, 'load_catalog', lambda: snapshots)
+    missed = snapshot_path(datetime.datetime(2026, 7, 5, 6))
+    fs = FakeS3([snapshot_path(t) for t in TIMESTAMPS] + [missed])
+    monkeypatch.setattr(catalog.fsspec, 'filesystem', lambda *args, **kwargs: fs)
+
+    assert nifc.get_nifc_filename(nifc.NIFC_BUCKET) == missed
+    # dated lookups stay catalog-only
+    fs.prefixes.clear()
+    as_of = datetime.datetime(2026, 7, 1)
+    assert nifc.get_nifc_filename(nifc.NIFC_BUCKET, as_of) == snapshot_path(TIMESTAMPS[1])
+    assert fs.prefixes == []
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+DEDUPED_COLUMNS = [
+    'latitude',
+    'longitude',
+    'frp',
+    'frp_sum',
+    'acquired_at',
+    'count',
+    'sensors',
+    'confidence',
+]
+
+
+def make_detections(rows: list) -> pd.DataFrame:
+    """Detections from (latitude, longitude, frp, HHMM time, source, confidence) tuples"""
+    latitude, longitude, frp, acq_time, source, confidence = zip(*rows) if rows else [()] * 6
+    return pd.DataFrame(
+        {
+            'latitude': np.array(latitude, dtype=np.float32),
+            'longitude': np.array(longitude, dtype=np.float32),
+            'frp': np.array(frp, dtype=np.float32),
+            'confidence': pd.Categorical(confidence, categories=['l', 'n', 'h']),
+            'acq_date': pd.to_datetime(['2026-08-01'] * len(rows)).astype('datetime64[s]'),
+            'acq_time': np.array(acq_time, dtype=np.int16),
+            'source': pd.Categorical(source, categories=['MODIS_NRT', 'VIIRS_SNPP_NRT']),
+        }
+    )
+
+
+def test_dedup_detections_merges_co_located_detections(firms):
+    df = make_detections(
+        [
+            (40.0001, -120.0001, 10.0, 1005, 'MODIS_NRT', 'n'),
+            (40.0002, -120.0002, 30.0, 1010, 'VIIRS_SNPP_NRT', 'h'),
+            # another cell, and the same cell in another time window
+            (41.0, -120.0, 5.0, 1005, 'VIIRS_SNPP_NRT', 'n'),
+            (40.0001, -120.0001, 7.0, 1105, 'VIIRS_SNPP_NRT', 'l'),
+        ]
+    )
+    deduped = firms.dedup_detections(df).sort_values(['acquired_at', 'latitude'])
+    assert list(deduped.columns) == DEDUPED_COLUMNS
+    assert deduped['count'].tolist() == [2, 1, 1]
+
+    merged = deduped.iloc[0]
+    assert merged['frp'] == 30
+    assert merged['frp_sum'] == 40
+    assert merged['confidence'] == 'h'
+    assert merged['acquired_at'] == pd.Timestamp('2026-08-01 10:05')
+    assert merged['latitude'] == pytest.approx(40.00015)
+
+
+def test_dedup_detections_lists_contributing_sensors(firms):
+    df = make_detections(
+        [
+            (40.0001, -120.0001, 1.0, 1000, 'MODIS_NRT', 'n'),
+            (40.0001, -120.0001, 1.0, 1000, 'VIIRS_SNPP_NRT', 'n'),
+            (40.0001, -120.0001, 1.0, 1000, 'VIIRS_SNPP_NRT', 'n'),
+            (41.0, -120.0, 1.0, 1000, 'VIIRS_SNPP_NRT', 'n'),
+            (42.0, -120.0, 1.0, 1000, 'MODIS_NRT', 'n'),
+        ]
+    )
+    deduped = firms.dedup_detections(df).sort_values('latitude')
+    assert deduped['sensors'].astype(str).tolist() == [
+        'MODIS_NRT,VIIRS_SNPP_NRT',
+        'VIIRS_SNPP_NRT',
+        'MODIS_NRT',
+    ]
+    assert deduped['count'].tolist() == [3, 1, 1]
+
+
+def test_dedup_detections_without_detections(firms):
+    deduped = firms.dedup_detections(make_detections([]))
+    assert deduped.empty
+    assert list(deduped.columns) == DEDUPED_COLUMNS
+
+    # as generate_firms_tiles masks it
+    masked = firms.mask_df(
+        deduped, mask=shapely.box(-180, 0, 0, 90), columns=['frp', 'frp_sum', 'count', 'sensors']
+    )
+    assert masked.empty
+    assert list(masked.columns) == ['frp', 'frp_sum', 'count', 'sensors', 'geometry']
+
+
+def test_normalize_confidence_bins_modis_percentages(firms):
+    confidence = pd.Series([0, 35, 36, 79, 80, 100], name='confidence')
+    normalized = firms.normalize_confidence(confidence)
+    assert normalized.tolist() == ['l', 'l', 'n', 'n', 'h', 'h']
+    assert normalized.name == 'confidence'
+    assert list(normalized.cat.categories) == ['l', 'n', 'h']
+
+
+def test_normalize_confidence_passes_viirs_letters(firms):
+    confidence = pd.Series(['l', 'n', 'h', 'N'], index=[3, 5, 7, 9])
+    normalized = firms.normalize_confidence(confidence)
+    assert normalized.tolist() == ['l', 'n', 'h', 'n']
+    assert normalized.index.tolist() == [3, 5, 7, 9]
+
+
+@pytest.mark.parametrize('infer_string', [True, False])
+def test_normalize_confidence_keeps_missing_values_missing(firms, infer_string):
+    with pd.option_context('future.infer_string', infer_string):
+        letters = firms.normalize_confidence(pd.Series(['h', None, np.nan], dtype=object))
+        percentages = firms.normalize_confidence(pd.Series([90.0, np.nan]))
+    assert letters.isna().tolist() == [False, True, True]
+    assert percentages.isna().tolist() == [False, True]
+
+
+def old_filter_df(df: pd.DataFrame) -> pd.DataFrame:
+    """`filter_df` before confidences were normalized"""
+    if df.dtypes['confidence'] == 'int64':
+        return df[df['confidence'] > 35]
+    return df[df['confidence'] != 'l']
+
+
+@pytest.mark.parametrize(
+    'confidence',
+    [
+        np.arange(0, 101, dtype=np.int64),
+        np.array(['l', 'n', 'h', 'l', 'h'] * 20, dtype=object),
+    ],
+)
+def test_filter_df_keeps_the_old_cutoff(firms, confidence):
+    df = pd.DataFrame({'frp': np.arange(len(confidence)), 'confidence': confidence})
+    pd.testing.assert_frame_equal(firms.filter_df(df), old_filter_df(df))
@@ -0,0 +1,75 @@
+import json
+
+import geopandas
+import pytest
+import shapely
+
+from carbonplan_forest_offsets_fires import geocode
+
+
+@pytest.fixture
+def counties() -> geopandas.GeoDataFrame:
+    """Two counties sharing the lon=-120 border, listed east to west"""
+    return geopandas.GeoDataFrame(
+        {'location': ['Eastern County, CA', 'Western County, CA']},
+        geometry=[shapely.box(-120, 40, -119, 41), shapely.box(-121, 40, -120, 41)],
+        crs='epsg:4326',
+    )
+
+
+@pytest.fixture
+def geocoder(counties, tmp_path) -> geocode.CountyGeocoder:
+    cache_path = str(tmp_path / 'locations.json')
+    return geocode.CountyGeocoder(counties, cache_path=cache_path, census_fallback=False)
+
+
+def test_reverse_inside_a_county(geocoder):
+    assert geocoder.reverse([[-119.5, 40.5], [-120.5, 40.5]]) == [
+        'Eastern County, CA',
+        'Western County, CA',
+    ]
+
+
+def test_reverse_on_a_shared_border(counties, tmp_path):
+    # the first county listed wins, however the tree orders its matches
+    for listed in [counties, counties.iloc[::-1]]:
+        cache_path = str(tmp_path / f'{listed.index[0]}.json')
+        geocoder = geocode.CountyGeocoder(listed, cache_path=cache_path, census_fallback=False)
+        assert geocoder.reverse([[-120, 40.5]]) == [listed['location'].iloc[0]]
+
+
+def test_reverse_outside_every_county(geocoder, monkeypatch):
+    def census(lon, lat):
+        raise AssertionError('census fallback is disabled')
+
+    monkeypatch.setattr(geocode, 'census_location_name', census)
+    assert geocoder.reverse([[-130, 40.5], [-119.5, 40.5]]) == [None, 'Eastern County, CA']
+    # unresolved points aren't cached, so they're retried next time
+    assert geocode._coordinate_key(-130, 40.5) not in geocoder.cache
+
+
+def test_reverse_falls_back_to_census(counties, tmp_path, monkeypatch):
+    monkeypatch.setattr(geocode, 'census_location_name', lambda lon, lat: 'Offshore, CA')
+    geocoder = geocode.CountyGeocoder(counties, cache_path=str(tmp_path / 'locations.json'))
+    geocoder.census_fallback = True
+    assert geocoder.reverse([[-130, 40.5]]) == ['Offshore, CA']
+
+
+def test_reverse_cache_round_trip(geocoder, counties, monkeypatch):
+    assert geocoder.reverse([[-119.50001, 40.50004]]) == ['Eastern County, CA']
+    with open(geocoder.cache_path) as f:
+        assert json.load(f) == {'-119.5000,40.5000': 'Eastern County, CA'}
+
+    reloaded = geocode.CountyGeocoder(
+        counties, cache_path=geocoder.cache_path, census_fallback=False
+    )
+
+    def query(*args, **kwargs):
+        raise AssertionError('cached points are not queried')
+
+    monkeypatch.setattr(reloaded, 'tree', type('Tree', (), {'query': query})())
+    # anything that rounds to the same 1e-4 key is a cache hit
+    assert reloaded.reverse([[-119.49996, 40.5], [-119.5, 40.49999]]) == [
+        'Eastern County, CA',
+        'Eastern County, CA',
+    ]
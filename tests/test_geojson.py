@@ -0,0 +1,136 @@
+import io
+import json
+import subprocess
+import sys
+
+import geopandas
+import numpy as np
+import pytest
+import shapely
+
+from carbonplan_forest_offsets_fires import geojson
+
+CRS = 'epsg:5070'
+
+# stand-ins for tippecanoe: write `-o` from stdin, or fail after reading some of it
+TIPPECANOE = '''
+import shutil, sys
+with open(sys.argv[2], 'w') as f:
+    shutil.copyfileobj(sys.stdin, f)
+'''
+FAILING_TIPPECANOE = '''
+import sys
+with open(sys.argv[2], 'w') as f:
+    f.write(sys.stdin.read({n}))
+sys.exit(3)
+'''
+
+
+@pytest.fixture
+def gdf():
+    return geopandas.GeoDataFrame(
+        {
+            'opr_id': ['A', None, 'C', 'D'],
+            'frp': [1.5, 2.0, np.nan, 4.0],
+            'acres': [10, 20, 30, 40],
+        },
+        geometry=[
+            shapely.box(-2_000_000, 2_000_000, -1_990_000, 2_010_000),
+            shapely.Point(-2_100_000, 1_900_000),
+            None,
+            shapely.MultiPolygon(
+                [shapely.box(0, 0, 1_000, 1_000), shapely.box(5_000, 0, 6_000, 1_000)]
+            ),
+        ],
+        crs=CRS,
+    )
+
+
+def read_features(text: str) -> list:
+    return [json.loads(line) for line in text.splitlines()]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 10_000])
+def test_every_line_is_a_feature(gdf, chunk_size):
+    fp = io.StringIO()
+    assert geojson.write_geojson_seq(gdf, fp, ['opr_id', 'frp'], chunk_size=chunk_size) == 4
+    assert fp.getvalue().endswith('\n')
+    features = read_features(fp.getvalue())
+    assert len(features) == len(gdf)
+    for feature in features:
+        assert feature['type'] == 'Feature'
+        assert set(feature) == {'type', 'properties', 'geometry'}
+        assert set(feature['properties']) == {'opr_id', 'frp'}
+
+
+def test_null_properties_and_geometries(gdf):
+    features = read_features(
+        ''.join(geojson.iter_geojson_features(gdf, ['opr_id', 'frp', 'acres']))
+    )
+    assert [f['properties'] for f in features] == [
+        {'opr_id': 'A', 'frp': 1.5, 'acres': 10},
+        {'opr_id': None, 'frp': 2.0, 'acres': 20},
+        {'opr_id': 'C', 'frp': None, 'acres': 30},
+        {'opr_id': 'D', 'frp': 4.0, 'acres': 40},
+    ]
+    assert features[2]['geometry'] is None
+    assert [f['geometry'] and f['geometry']['type'] for f in features] == [
+        'Polygon',
+        'Point',
+        None,
+        'MultiPolygon',
+    ]
+
+
+def test_reprojects_to_wgs84(gdf):
+    features = read_features(''.join(geojson.iter_geojson_features(gdf, ['opr_id'])))
+    expected = gdf.to_crs('epsg:4326')
+    for feature, geom in zip(features, expected.geometry):
+        if geom is None:
+            continue
+        written = shapely.from_geojson(json.dumps(feature['geometry']))
+        assert written.equals_exact(geom, tolerance=1e-9)
+        # lon/lat order, somewhere over the conterminous US
+        lon, lat = shapely.get_coordinates(written)[0]
+        assert -130 < lon < -60 and 20 < lat < 50
+
+
+def test_write_geojson(gdf, tmp_path):
+    out_fn = geojson.write_geojson(gdf, tmp_path / 'features.json', ['opr_id'], chunk_size=2)
+    assert out_fn == tmp_path / 'features.json'
+    assert [f['properties']['opr_id'] for f in read_features(out_fn.read_text())] == [
+        'A',
+        None,
+        'C',
+        'D',
+    ]
+
+
+def test_pipe_to_tippecanoe(gdf, tmp_path):
+    output = tmp_path / 'tiles.mbtiles'
+    cmd = [sys.executable, '-c', TIPPECANOE, '-o', str(output)]
+    geojson.pipe_to_tippecanoe(gdf, cmd, ['opr_id'])
+    assert output.read_text() == ''.join(geojson.iter_geojson_features(gdf, ['opr_id']))
+
+
+@pytest.mark.parametrize('n', [0, 100, -1], ids=['immediately', 'early', 'at-the-end'])
+def test_pipe_to_tippecanoe_failure_raises(tmp_path, n):
+    # enough features to fill the pipe when tippecanoe stops reading early
+    many = geopandas.GeoDataFrame(
+        {'opr_id': ['A'] * 20_000}, geometry=[shapely.Point(0, 0)] * 20_000, crs=CRS
+    )
+    output = tmp_path / 'tiles.mbtiles'
+    cmd = [sys.executable, '-c', FAILING_TIPPECANOE.format(n=n), '-o', str(output)]
+    with pytest.raises(subprocess.CalledProcessError) as excinfo:
+        geojson.pipe_to_tippecanoe(many, cmd, ['opr_id'])
+    assert excinfo.value.returncode == 3
+    assert not output.exists()
+
+
+def test_pipe_to_tippecanoe_serialization_error(gdf, tmp_path):
+    gdf['opr_id'] = [{'not', 'json'}] * len(gdf)
+    output = tmp_path / 'tiles.mbtiles'
+    cmd = [sys.executable, '-c', TIPPECANOE, '-o', str(output)]
+    with pytest.raises(TypeError):
+        geojson.pipe_to_tippecanoe(gdf, cmd, ['opr_id'])
+    assert not output.exists()
@@ -0,0 +1,143 @@
+import datetime
+import json
+
+import pytest
+from thefuzz import process
+
+from carbonplan_forest_offsets_fires import inciweb
+
+URIS = {
+    name: f'/incident/{i}'
+    for i, name in enumerate(
+        [
+            'Dixie Fire',
+            'Caldor Fire',
+            'Mosquito Fire',
+            'McKinney Fire',
+            'Oak Fire',
+            'Ox Fire',
+            'Bear Complex',
+            'North Complex Fire',
+            'August Complex',
+            'Creek Fire',
+            'Cedar Creek Fire',
+            'Black Butte',
+            'Fire 12',
+            'Windy Fire',
+            'River Complex',
+            'Rum Creek Fire',
+            'Bootleg Fire',
+            'Double Creek Fire',
+            'Sugar Fire',
+            'Monument Fire',
+        ]
+    )
+}
+
+
+@pytest.fixture(scope='module')
+def index() -> inciweb.InciWebIndex:
+    return inciweb.InciWebIndex(URIS)
+
+
+@pytest.mark.parametrize(
+    'name',
+    [
+        # exact, and with or without stopwords
+        'Dixie Fire',
+        'DIXIE',
+        'Caldor Fire Complex',
+        'Bear',
+        # typos
+        'Mosqito Fire',
+        'McKinny',
+        'Bootlag Fire',
+        # numbers
+        'Fire 12',
+        'Creek Fire 2',
+        '12',
+        # very short names
+        'Ox',
+        'Oak',
+        'Fi',
+        # nothing close
+        'Lightning Lake',
+        'Zzyzx',
+    ],
+)
+def test_match_agrees_with_a_full_scan(index, name):
+    full_scan = process.extractOne(name, list(URIS), score_cutoff=inciweb.SCORE_CUTOFF)
+    expected = None if full_scan is None else inciweb.INCIWEB_URL + URIS[full_scan[0]]
+    assert index.match(name) == expected
+
+
+def test_match_without_a_name(index):
+    assert index.match(None) is None
+    assert index.match('') is None
+    assert index.match(float('nan')) is None
+
+
+def test_candidates_are_blocked(index):
+    candidates = index.candidates('Mosquito Fire')
+    assert 'Mosquito Fire' in candidates
+    assert 'Dixie Fire' not in candidates
+    # too short to block on: everything is scored
+    assert index.candidates('Ox') == index.names
+
+
+@pytest.fixture
+def fetch(monkeypatch):
+    calls = []
+
+    def get_inciweb_uris():
+        calls.append(1)
+        return {'Dixie Fire': f'/incident/{len(calls)}'}
+
+    monkeypatch.setattr(inciweb.utils, 'get_inciweb_uris', get_inciweb_uris)
+    monkeypatch.setattr(inciweb, 'OFFLINE', False)
+    return calls
+
+
+def age_cache(cache_dir, hours: float):
+    path = cache_dir / 'inciweb.json'
+    cached = json.loads(path.read_text())
+    fetched_at = datetime.datetime.utcnow() - datetime.timedelta(hours=hours)
+    cached['fetched_at'] = fetched_at.isoformat()
+    path.write_text(json.dumps(cached))
+
+
+def test_load_inciweb_index_caches_within_ttl(fetch, tmp_path):
+    ttl = datetime.timedelta(hours=6)
+    first = inciweb.load_inciweb_index(ttl=ttl, cache_dir=str(tmp_path))
+    assert first.match('Dixie') == f'{inciweb.INCIWEB_URL}/incident/1'
+    age_cache(tmp_path, hours=5)
+    second = inciweb.load_inciweb_index(ttl=ttl, cache_dir=str(tmp_path))
+    assert second.uris == first.uris
+    assert len(fetch) == 1
+
+
+def test_load_inciweb_index_refreshes_after_ttl(fetch, tmp_path):
+    ttl = datetime.timedelta(hours=6)
+    inciweb.load_inciweb_index(ttl=ttl, cache_dir=str(tmp_path))
+    age_cache(tmp_path, hours=7)
+    refreshed = inciweb.load_inciweb_index(ttl=ttl, cache_dir=str(tmp_path))
+    assert len(fetch) == 2
+    assert refreshed.match('Dixie') == f'{inciweb.INCIWEB_URL}/incident/2'
+    # the refreshed list is cached again
+    inciweb.load_inciweb_index(ttl=ttl, cache_dir=str(tmp_path))
+    assert len(fetch) == 2
+
+
+def test_load_inciweb_index_uses_stale_cache_offline(fetch, tmp_path, monkeypatch):
+    inciweb.load_inciweb_index(cache_dir=str(tmp_path))
+    age_cache(tmp_path, hours=24 * 30)
+    monkeypatch.setattr(inciweb, 'OFFLINE', True)
+    inciweb.load_inciweb_index(cache_dir=str(tmp_path))
+    assert len(fetch) == 1
+
+
+def test_load_inciweb_index_refetches_a_corrupt_cache(fetch, tmp_path):
+    (tmp_path / 'inciweb.json').write_text('{"fetched_at": ')
+    inciweb.load_inciweb_index(cache_dir=str(tmp_path))
+    assert len(fetch) == 1
+    assert list(tmp_path.glob('*.tmp')) == []
@@ -0,0 +1,97 @@
+import geopandas
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+from carbonplan_forest_offsets_fires import sindex
+from carbonplan_forest_offsets_fires.prefect.workflows import monitor_project_fires
+
+CRS = 'epsg:5070'
+
+
+def make_projects() -> geopandas.GeoDataFrame:
+    """Concave and multipart projects, whose hulls cover ground the projects don't"""
+    c_shape = shapely.box(0, 0, 30_000, 30_000) - shapely.box(10_000, 10_000, 30_000, 20_000)
+    two_parts = shapely.MultiPolygon(
+        [shapely.box(50_000, 0, 60_000, 10_000), shapely.box(80_000, 20_000, 90_000, 30_000)]
+    )
+    ring = shapely.Point(0, 60_000).buffer(15_000, 8) - shapely.Point(0, 60_000).buffer(10_000, 8)
+    # overlaps the C's mouth, so points there belong to one project only
+    overlapping = shapely.box(20_000, 12_000, 40_000, 18_000)
+    rng = np.random.default_rng(0)
+    blobs = [
+        shapely.Point(x, y).buffer(r, 3)
+        for x, y, r in zip(
+            rng.uniform(0, 100_000, 20), rng.uniform(0, 100_000, 20), rng.uniform(1_000, 8_000, 20)
+        )
+    ]
+    geoms = [c_shape, two_parts, ring, overlapping, *blobs]
+    return geopandas.GeoDataFrame(
+        {'opr_id': [f'P{i}' for i in range(len(geoms))]}, geometry=geoms, crs=CRS
+    )
+
+
+def make_fires(projects: geopandas.GeoDataFrame) -> pd.DataFrame:
+    hulls = projects.convex_hull
+    gaps = hulls.difference(projects.geometry)
+    points = [
+        # hull vertices and edge midpoints
+        *shapely.get_coordinates(hulls.boundary.segmentize(2_500).values),
+        # inside the hull, outside the project
+        *shapely.get_coordinates(gaps.sample_points(10, rng=1).values),
+        *shapely.get_coordinates(gaps.representative_point().values),
+        # on project boundaries, and inside projects
+        *shapely.get_coordinates(projects.boundary.segmentize(5_000).values),
+        *shapely.get_coordinates(projects.representative_point().values),
+        # anywhere, including far from every project
+        *np.random.default_rng(2).uniform(-20_000, 120_000, (500, 2)),
+    ]
+    xy = np.array(points)
+    return pd.DataFrame({'x': xy[:, 0], 'y': xy[:, 1]})
+
+
+@pytest.fixture
+def projects():
+    return make_projects()
+
+
+@pytest.fixture
+def project_index(projects, tmp_path):
+    path = str(tmp_path / 'projects.sindex')
+    sindex.write_project_index(projects, path, node_size=4)
+    return sindex.ProjectIndex(path)
+
+
+def sjoin_counts(projects, fires) -> dict:
+    """What `get_active_fires_by_project` used to compute"""
+    points = geopandas.GeoDataFrame(
+        geometry=geopandas.points_from_xy(fires['x'], fires['y']), crs=CRS
+    )
+    return geopandas.sjoin(points, projects)['opr_id'].value_counts().to_dict()
+
+
+def test_counts_match_sjoin(projects, project_index):
+    fires = make_fires(projects)
+    expected = sjoin_counts(projects, fires)
+    counts = monitor_project_fires.get_active_fires_by_project.run(project_index, fires)
+    assert counts == expected
+    # every project is hit, and some fires sit in a hull but in no project
+    assert set(counts) == set(projects['opr_id'])
+    points = shapely.points(fires['x'].to_numpy(), fires['y'].to_numpy())
+    in_hull = shapely.intersects(shapely.union_all(projects.convex_hull.values), points)
+    in_project = shapely.intersects(shapely.union_all(projects.geometry.values), points)
+    assert (in_hull & ~in_project).sum() > 10
+
+
+def test_points_only_in_hull_gaps(projects, project_index):
+    gaps = projects.convex_hull.difference(projects.geometry).iloc[:3]
+    xy = shapely.get_coordinates(gaps.sample_points(20, rng=3).values)
+    fires = pd.DataFrame({'x': xy[:, 0], 'y': xy[:, 1]})
+    counts = monitor_project_fires.get_active_fires_by_project.run(project_index, fires)
+    assert counts == sjoin_counts(projects, fires)
+
+
+def test_no_fires(project_index):
+    fires = pd.DataFrame({'x': np.array([], dtype='f8'), 'y': np.array([], dtype='f8')})
+    assert monitor_project_fires.get_active_fires_by_project.run(project_index, fires) == {}
@@ -0,0 +1,100 @@
+import geopandas
+import pandas as pd
+import pytest
+import shapely
+
+from carbonplan_forest_offsets_fires.prefect.tasks import nifc
+
+CRS = 'epsg:5070'
+# query box, in epsg:5070 like load_nifc_data's bbox
+BBOX = (0, 0, 10_000, 10_000)
+
+
+def snapshot_frame() -> geopandas.GeoDataFrame:
+    """Perimeters in epsg:5070, stored in epsg:4326 like NIFC snapshots"""
+    l_shape = shapely.Polygon(
+        [
+            (-5_000, 12_000),
+            (20_000, 12_000),
+            (20_000, -5_000),
+            (15_000, -5_000),
+            (15_000, 11_000),
+            (-5_000, 11_000),
+        ]
+    )
+    geoms = {
+        'inside': shapely.box(1_000, 1_000, 2_000, 2_000),
+        'crossing': shapely.box(9_000, 9_000, 12_000, 12_000),
+        'far': shapely.box(50_000, 50_000, 51_000, 51_000),
+        # its bounding box overlaps BBOX, the perimeter itself doesn't
+        'l-shape': l_shape,
+        'east': shapely.box(30_000, 0, 31_000, 1_000),
+        'north': shapely.box(0, 30_000, 1_000, 31_000),
+    }
+    return geopandas.GeoDataFrame(
+        {
+            'OBJECTID': range(1, len(geoms) + 1),
+            'poly_IRWINID': list(geoms),
+            'poly_IncidentName': ['Dixie', 'Dixie', 'Dixie', 'Dixie', 'Caldor', 'Caldor'],
+            'attr_FireDiscoveryDateTime': [1_656_633_600_000 + i for i in range(len(geoms))],
+            'attr_POOState': ['US-CA'] * len(geoms),
+        },
+        geometry=list(geoms.values()),
+        crs=CRS,
+    ).to_crs('epsg:4326')
+
+
+@pytest.fixture(params=[True, False], ids=['covering', 'no-covering'])
+def snapshot(request, tmp_path) -> str:
+    path = str(tmp_path / 'snapshot.parquet')
+    snapshot_frame().to_parquet(path, write_covering_bbox=request.param)
+    return path
+
+
+def test_full_profile_reads_every_column(snapshot):
+    gdf = nifc.load_nifc_data(snapshot)
+    assert gdf.columns.tolist() == [
+        'OBJECTID',
+        'poly_IRWINID',
+        'name',
+        'start_date',
+        'attr_POOState',
+        'geometry',
+    ]
+    assert gdf['name'].dtype == object or pd.api.types.is_string_dtype(gdf['name'])
+    assert gdf.crs == 'epsg:4326'
+
+
+def test_stats_profile(snapshot):
+    gdf = nifc.load_nifc_data(snapshot, profile='stats')
+    assert gdf.columns.tolist() == ['poly_IRWINID', 'name', 'start_date', 'geometry']
+    # two names for six perimeters: worth a categorical
+    assert isinstance(gdf['name'].dtype, pd.CategoricalDtype)
+    assert gdf['name'].tolist() == snapshot_frame()['poly_IncidentName'].tolist()
+    # epoch milliseconds are never recast
+    assert gdf['start_date'].dtype == 'int64'
+
+
+def test_tiles_profile(snapshot):
+    gdf = nifc.load_nifc_data(snapshot, profile='tiles')
+    assert gdf.columns.tolist() == ['poly_IRWINID', 'geometry']
+
+
+def test_compaction_only_when_smaller(snapshot):
+    # every IRWINID is unique, so a categorical wouldn't save anything
+    profile = nifc.LoaderProfile(['poly_IRWINID'], categorical=['poly_IRWINID', 'missing'])
+    gdf = nifc.load_nifc_data(snapshot, profile=profile)
+    assert not isinstance(gdf['poly_IRWINID'].dtype, pd.CategoricalDtype)
+
+
+def test_bbox_reads_perimeters_whose_bounding_box_intersects(snapshot):
+    gdf = nifc.load_nifc_data(snapshot, profile='tiles', bbox=BBOX)
+    assert sorted(gdf['poly_IRWINID']) == ['crossing', 'inside', 'l-shape']
+
+
+def test_load_nifc_data_logs_instead_of_printing(snapshot, monkeypatch, capsys):
+    messages = []
+    monkeypatch.setattr(nifc.logger, 'info', messages.append)
+    nifc.load_nifc_data(snapshot, profile='stats')
+    assert capsys.readouterr().out == ''
+    assert len(messages) == 1 and messages[0].startswith('Read 6 perimeters, skipping ')
@@ -0,0 +1,204 @@
+import datetime
+import os
+import re
+import urllib
+
+import geopandas
+import pytest
+import shapely
+
+from carbonplan_forest_offsets_fires.prefect.workflows import download_nifc_perimeters as nifc
+
+LAYER_INFO = {
+    'fields': [
+        {'name': 'OBJECTID', 'type': 'esriFieldTypeOID'},
+        {'name': 'poly_IRWINID', 'type': 'esriFieldTypeString'},
+        {'name': 'EditDate', 'type': 'esriFieldTypeDate'},
+        {'name': 'geometry', 'type': 'esriFieldTypeGeometry'},
+    ],
+    'editFieldsInfo': {'editDateField': 'EditDate'},
+}
+LAYER_FIELDS = ['poly_IRWINID', 'EditDate']
+NOW = datetime.datetime(2026, 7, 1, tzinfo=datetime.timezone.utc)
+
+
+class FakeLayer:
+    """The perimeter FeatureServer layer, answering the queries the download makes
+
+    `on_page` runs after each page is served, so tests can edit the layer mid-download.
+    """
+
+    def __init__(self, object_ids, on_page=None):
+        self.records = {}
+        self.now = NOW
+        self.edit(object_ids)
+        self.on_page = on_page or (lambda layer, pages: None)
+        self.pages = 0
+        self.missing_fetched = False
+
+    def edit(self, object_ids, irwin_id=None):
+        """Add or edit records, a day after the last edit"""
+        self.now += datetime.timedelta(days=1)
+        for i in object_ids:
+            self.records[i] = {
+                'poly_IRWINID': irwin_id or f'irwin-{i}',
+                'EditDate': int(self.now.timestamp() * 1000),
+            }
+
+    def select(self, where: str) -> list:
+        match = re.fullmatch(r'OBJECTID IN \((.*)\)', where)
+        if match:
+            ids = {int(i) for i in match.group(1).split(',')}
+            self.missing_fetched = True
+            return sorted(i for i in self.records if i in ids)
+        match = re.fullmatch(r"OBJECTID > 0 AND EditDate >= TIMESTAMP '(.*)'", where)
+        if match:
+            since = datetime.datetime.fromisoformat(match.group(1) + '+00:00').timestamp()
+            return sorted(i for i, r in self.records.items() if r['EditDate'] >= since * 1000)
+        assert where == 'OBJECTID > 0'
+        return sorted(self.records)
+
+    def get_fire_url(self, url: str) -> geopandas.GeoDataFrame:
+        params = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(url).query))
+        offset, count = int(params['resultOffset']), int(params['resultRecordCount'])
+        ids = self.select(params['where'])[offset : offset + count]
+        page = geopandas.GeoDataFrame(
+            {'OBJECTID': ids, **{k: [self.records[i][k] for i in ids] for k in LAYER_FIELDS}},
+            geometry=[shapely.box(i, 0, i + 1, 1) for i in ids],
+            crs=nifc.CRS,
+        )
+        self.pages += 1
+        self.on_page(self, self.pages)
+        return page
+
+    def query_nifc(self, where, returnIdsOnly=None, returnCountOnly=None):
+        if returnCountOnly:
+            return {'count': len(self.select(where))}
+        return {'objectIds': self.select(where)}
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    def serve(layer):
+        monkeypatch.setattr(nifc, 'get_fire_url', layer.get_fire_url)
+        monkeypatch.setattr(nifc, 'query_nifc', layer.query_nifc)
+        monkeypatch.setattr(nifc, 'get_layer_info', lambda: LAYER_INFO)
+        return layer
+
+    return serve
+
+
+def read(path: str) -> geopandas.GeoDataFrame:
+    try:
+        return geopandas.read_parquet(path)
+    finally:
+        os.remove(path)
+
+
+def download(record_count) -> list:
+    path = nifc.download_perimeters(record_count, request_size=10, layer_info=LAYER_INFO)
+    return read(path)['OBJECTID'].tolist()
+
+
+def test_download_perimeters(serve):
+    serve(FakeLayer(range(1, 26)))
+    assert download(25) == list(range(1, 26))
+
+
+def test_download_perimeters_tolerates_deletions_while_paging(serve):
+    def delete_early_records(layer, pages):
+        if pages == 1:
+            # shifts every later record back an offset
+            del layer.records[3], layer.records[4]
+
+    # more pages than are requested up front, so later pages are requested after deleting
+    layer = serve(FakeLayer(range(1, 251), on_page=delete_early_records))
+    # 3 and 4 were downloaded before they were deleted
+    assert sorted(download(250)) == list(range(1, 251))
+    assert layer.missing_fetched
+
+
+def test_download_perimeters_tolerates_additions_while_paging(serve):
+    def add_records(layer, pages):
+        if pages == 1:
+            layer.edit(range(21, 31))
+
+    serve(FakeLayer(range(1, 21), on_page=add_records))
+    assert download(20) == list(range(1, 31))
+
+
+def test_download_perimeters_removes_partial_file(serve, monkeypatch):
+    def fail(layer, pages):
+        if pages >= 2:
+            raise RuntimeError('connection reset')
+
+    serve(FakeLayer(range(1, 26), on_page=fail))
+    monkeypatch.setattr(nifc.time, 'sleep', lambda seconds: None)
+    paths = []
+    make_tempfile = nifc.make_perimeters_tempfile
+    monkeypatch.setattr(
+        nifc, 'make_perimeters_tempfile', lambda: paths.append(make_tempfile()) or paths[-1]
+    )
+    with pytest.raises(RuntimeError):
+        download(25)
+    assert len(paths) == 1
+    assert not os.path.exists(paths[0])
+
+
+@pytest.fixture
+def previous(serve, tmp_path):
+    layer = serve(FakeLayer(range(1, 26)))
+    path = nifc.download_perimeters(25, request_size=10, layer_info=LAYER_INFO)
+    os.rename(path, tmp_path / 'previous.parquet')
+    return layer, str(tmp_path / 'previous.parquet')
+
+
+def test_update_perimeters(previous):
+    layer, previous_fn = previous
+    layer.edit([5], irwin_id='renamed')
+    del layer.records[7]
+    layer.edit([26])
+
+    updated = read(nifc.update_perimeters(previous_fn, request_size=10))
+    assert sorted(updated['OBJECTID']) == sorted(layer.records)
+    renamed = updated.set_index('OBJECTID')['poly_IRWINID'][5]
+    assert renamed == 'renamed'
+    assert updated.crs == geopandas.read_parquet(previous_fn).crs
+
+
+def test_update_perimeters_keeps_records_sharing_an_irwin_id(previous):
+    layer, previous_fn = previous
+    # IRWINID isn't unique: e.g. a fire mapped as several perimeters
+    layer.edit([3, 4], irwin_id='complex')
+    os.replace(nifc.update_perimeters(previous_fn, request_size=10), previous_fn)
+
+    # editing one perimeter leaves the other in place
+    layer.edit([3], irwin_id='complex')
+    updated = read(nifc.update_perimeters(previous_fn, request_size=10))
+    assert sorted(updated['OBJECTID']) == list(range(1, 26))
+    assert sorted(updated.loc[updated['poly_IRWINID'] == 'complex', 'OBJECTID']) == [3, 4]
+
+
+def test_update_perimeters_fetches_current_records_it_missed(previous):
+    layer, previous_fn = previous
+    # 1 and 2 are left out of the previous snapshot, and aren't edited after it
+    layer.edit(range(3, 26))
+    snapshot = geopandas.read_parquet(previous_fn)
+    snapshot = snapshot[snapshot['OBJECTID'] > 2]
+    snapshot['EditDate'] = layer.records[3]['EditDate']
+    snapshot.to_parquet(previous_fn)
+
+    updated = read(nifc.update_perimeters(previous_fn, request_size=10))
+    assert sorted(updated['OBJECTID']) == list(range(1, 26))
+    assert layer.missing_fetched
+
+
+def test_latest_perimeters_falls_back_on_any_failure(serve, monkeypatch):
+    serve(FakeLayer(range(1, 26)))
+
+    def unreadable(bucket):
+        raise OSError('snapshot not found')
+
+    monkeypatch.setattr(nifc.nifc, 'get_nifc_filename', unreadable)
+    path = nifc.get_latest_nifc_perimeters.run(25)
+    assert read(path)['OBJECTID'].tolist() == list(range(1, 26))
@@ -0,0 +1,63 @@
+import pandas as pd
+import prefect
+import pytest
+
+from carbonplan_forest_offsets_fires import profiling
+
+
+@prefect.task
+def make_numbers(n: int) -> list:
+    return list(range(n))
+
+
+@prefect.task
+def square(x: int) -> int:
+    return x * x
+
+
+def make_flow() -> prefect.Flow:
+    with prefect.Flow('profiled') as flow:
+        square.map(make_numbers(3))
+    return profiling.instrument_flow(flow)
+
+
+def test_instrumented_flow_writes_profile(monkeypatch, tmp_path):
+    monkeypatch.setenv(profiling.PROFILE_DIR_ENV, str(tmp_path))
+    monkeypatch.delenv(profiling.CPROFILE_ENV, raising=False)
+    monkeypatch.delenv(profiling.UPLOAD_ENV, raising=False)
+    assert make_flow().run().is_successful()
+
+    # one directory per flow run, collected when the run finishes
+    (run_dir,) = tmp_path.iterdir()
+    profile = pd.read_parquet(run_dir / 'profile.parquet')
+    assert sorted(profile['task']) == ['make_numbers', 'square[0]', 'square[1]', 'square[2]']
+    assert profile['wall_seconds'].is_monotonic_decreasing
+    numbers = profile.set_index('task').loc['make_numbers']
+    assert (numbers['input_features'], numbers['output_features']) == (None, 3)
+    assert profile['error'].isna().all()
+
+
+def test_profiled_is_a_no_op_when_disabled(monkeypatch, tmp_path):
+    monkeypatch.delenv(profiling.PROFILE_DIR_ENV, raising=False)
+    monkeypatch.chdir(tmp_path)
+    writes = []
+    monkeypatch.setattr(profiling, '_write_record', lambda *args: writes.append(args))
+    flow = make_flow()
+    assert all(task.run._profiled for task in flow.tasks)
+    assert flow.run().is_successful()
+    assert writes == []
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profiled_records_errors(monkeypatch, tmp_path):
+    monkeypatch.setenv(profiling.PROFILE_DIR_ENV, str(tmp_path))
+
+    @profiling.profiled
+    def fail():
+        raise ValueError('no fires')
+
+    with pytest.raises(ValueError):
+        fail()
+    # outside of a flow run, records go to a `local` run directory
+    profile = profiling.collect_profile(tmp_path / 'local')
+    assert profile[['task', 'error']].values.tolist() == [['fail', 'ValueError']]
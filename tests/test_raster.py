@@ -0,0 +1,108 @@
+import geopandas
+import numpy as np
+import pytest
+import shapely
+
+from carbonplan_forest_offsets_fires import raster, stats
+from carbonplan_forest_offsets_fires.prefect.workflows import calculate_project_stats
+
+CRS = 'epsg:5070'
+
+
+def test_popcount():
+    mask = np.random.default_rng(0).random(1_001) < 0.3
+    assert raster._popcount(np.packbits(mask)) == mask.sum()
+
+
+def test_rasterize_burned_area_is_exact_on_grid_aligned_boxes():
+    parts = np.array([shapely.box(0, 0, 600, 600), shapely.box(1_200, 0, 1_800, 600)])
+    fires = np.array([shapely.box(300, 0, 1_500, 300)])
+    burned, error = raster.rasterize_burned_area(parts, fires, 60)
+    assert burned == 2 * 300 * 300
+    assert error >= 0
+
+
+def test_rasterize_burned_area_grids_each_part():
+    # parts a continent apart would need a ~10^10 cell grid over the project's bounds
+    parts = np.array([shapely.box(0, 0, 600, 600), shapely.box(4e6, 2e6, 4e6 + 600, 2e6 + 600)])
+    fires = np.array([shapely.box(0, 0, 600, 300)])
+    burned, _ = raster.rasterize_burned_area(parts, fires, 60)
+    assert burned == 600 * 300
+
+
+def make_shapes(rng, n: int, radius: float) -> list:
+    """Irregular blobs in a 40km square"""
+    centers = rng.uniform(0, 40_000, (n, 2))
+    return [
+        shapely.Point(x, y).buffer(radius * rng.uniform(0.5, 1.5)).simplify(200) for x, y in centers
+    ]
+
+
+@pytest.mark.parametrize('resolution', [30, 120])
+def test_raster_engine_is_within_error_bound_of_exact(resolution):
+    rng = np.random.default_rng(1)
+    projects = geopandas.GeoDataFrame(
+        {'opr_id': [f'P{i}' for i in range(12)]},
+        geometry=make_shapes(rng, 12, 4_000),
+        crs=CRS,
+    )
+    fires = geopandas.GeoDataFrame(
+        {
+            'poly_IRWINID': [f'f{i}' for i in range(25)],
+            'name': [f'Fire {i}' for i in range(25)],
+            'start_date': 1_656_633_600_000,
+        },
+        geometry=make_shapes(rng, 25, 3_000),
+        crs=CRS,
+    )
+
+    exact = {r['opr_id']: r for r in stats.summarize_projects(projects, fires)}
+    approximate = {
+        r['opr_id']: r
+        for r in raster.summarize_projects_raster(projects, fires, resolution=resolution)
+    }
+    assert not shapely.is_prepared(projects.geometry.values).any()
+    assert not shapely.is_prepared(fires.geometry.values).any()
+    assert exact.keys() == approximate.keys()
+    assert len(exact) > 3
+    for opr_id, result in approximate.items():
+        error = result['burned_area_error']
+        assert abs(result['burned_area'] - exact[opr_id]['burned_area']) <= error + 1e-6
+        assert result['fires'].keys() == exact[opr_id]['fires'].keys()
+
+
+def test_project_stats_flow_threads_resolution(monkeypatch):
+    projects = geopandas.GeoDataFrame(
+        {'opr_id': ['A']}, geometry=[shapely.box(0, 0, 6_000, 6_000)], crs=CRS
+    )
+    fires = geopandas.GeoDataFrame(
+        {'poly_IRWINID': ['f1'], 'name': ['Fire'], 'start_date': [1_656_633_600_000]},
+        geometry=[shapely.box(0, 0, 6_000, 3_000)],
+        crs=CRS,
+    )
+    monkeypatch.setattr(stats.canonical, 'load_project_geometries', lambda opr_ids: projects)
+    artifact = {'path': 'projects.v1.parquet', 'built_at': '2026-10-01T00:00:00'}
+    monkeypatch.setattr(stats.canonical, 'artifact_identity', lambda: artifact)
+    assert calculate_project_stats.flow.get_tasks(name='resolution')
+
+    state = calculate_project_stats.update_project_state.run(
+        stats.empty_project_state(), {'A': ['f1']}, fires, resolution=60
+    )
+    assert state['settings']['resolution'] == 60
+    assert state['settings']['geometries'] == artifact
+    assert 'burned_area_error' in state['projects']['A']['result']
+
+    # a state computed by the other engine is not carried forward
+    exact = calculate_project_stats.update_project_state.run(state, {'A': ['f1']}, fires)
+    assert 'burned_area_error' not in exact['projects']['A']['result']
+
+    # nor is one computed from another build of the project geometries
+    summarized = []
+    monkeypatch.setattr(
+        stats, 'summarize_projects', lambda geoms, fires: summarized.append(1) or []
+    )
+    assert calculate_project_stats.update_project_state.run(exact, {'A': ['f1']}, fires)
+    assert summarized == []
+    artifact = {**artifact, 'built_at': '2026-10-02T00:00:00'}
+    calculate_project_stats.update_project_state.run(exact, {'A': ['f1']}, fires)
+    assert summarized == [1]
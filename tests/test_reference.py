@@ -0,0 +1,183 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from carbonplan_forest_offsets_fires import reference, utils
+
+DAY = datetime.timedelta(days=1)
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch, tmp_path):
+    """Fresh in-memory state and a tmp cache dir for every reference table"""
+    monkeypatch.setattr(reference, '_snapshots', {})
+    monkeypatch.setattr(reference, '_lookups', {})
+    monkeypatch.setattr(reference, 'OFFLINE', False)
+    load_snapshot = reference.load_snapshot
+
+    def load_into_tmp(name, fetch, ttl=reference.REFERENCE_TTL, cache_dir=None):
+        return load_snapshot(name, fetch, ttl=ttl, cache_dir=str(tmp_path))
+
+    monkeypatch.setattr(reference, 'load_snapshot', load_into_tmp)
+
+
+class CountingFetch:
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.calls = 0
+
+    def __call__(self) -> pd.DataFrame:
+        self.calls += 1
+        return self.df.copy()
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    calls = []
+    read = reference._read_snapshot
+    monkeypatch.setattr(reference, '_read_snapshot', lambda path: calls.append(path) or read(path))
+    return calls
+
+
+def age(snapshot: reference.Snapshot, by: datetime.timedelta):
+    snapshot.fetched_at -= by
+
+
+def test_load_snapshot_from_memory_then_parquet_then_fetch(reads):
+    fetch = CountingFetch(pd.DataFrame({'opr_id': ['ACR1', 'CAR2']}))
+    first = reference.load_snapshot('projects', fetch)
+    assert fetch.calls == 1
+    assert first.data['opr_id'].tolist() == ['ACR1', 'CAR2']
+
+    # memory
+    reads.clear()
+    assert reference.load_snapshot('projects', fetch) is first
+    assert (fetch.calls, reads) == (1, [])
+
+    # parquet, e.g. in a new process
+    reference._snapshots.clear()
+    from_disk = reference.load_snapshot('projects', fetch)
+    assert fetch.calls == 1 and len(reads) == 1
+    assert from_disk.content_hash == first.content_hash
+    assert from_disk.fetched_at == first.fetched_at
+    pd.testing.assert_frame_equal(from_disk.data, first.data)
+
+
+def test_load_snapshot_refetches_after_ttl(tmp_path):
+    fetch = CountingFetch(pd.DataFrame({'opr_id': ['ACR1']}))
+    snapshot = reference.load_snapshot('projects', fetch, ttl=DAY)
+    age(snapshot, DAY / 2)
+    assert reference.load_snapshot('projects', fetch, ttl=DAY) is snapshot
+    assert fetch.calls == 1
+
+    # stale in memory and on disk
+    age(snapshot, DAY)
+    reference._write_snapshot(reference._snapshot_path('projects', str(tmp_path)), snapshot)
+    refreshed = reference.load_snapshot('projects', fetch, ttl=DAY)
+    assert fetch.calls == 2
+    assert refreshed.fetched_at > snapshot.fetched_at + DAY
+    # and the refreshed copy is what's on disk now
+    reference._snapshots.clear()
+    assert reference.load_snapshot('projects', fetch, ttl=DAY).fetched_at == refreshed.fetched_at
+
+
+def test_load_snapshot_prefers_fresh_parquet_over_stale_memory(reads):
+    fetch = CountingFetch(pd.DataFrame({'opr_id': ['ACR1']}))
+    snapshot = reference.load_snapshot('projects', fetch, ttl=DAY)
+    # another process refreshed the parquet file, this one still holds an old copy
+    stale = reference.Snapshot(snapshot.data, snapshot.fetched_at - 2 * DAY, 'old')
+    reference._snapshots['projects'] = stale
+    assert reference.load_snapshot('projects', fetch, ttl=DAY).content_hash != 'old'
+    assert fetch.calls == 1
+
+
+def test_load_snapshot_uses_stale_copies_offline(monkeypatch):
+    fetch = CountingFetch(pd.DataFrame({'opr_id': ['ACR1']}))
+    age(reference.load_snapshot('projects', fetch, ttl=DAY), 30 * DAY)
+    monkeypatch.setattr(reference, 'OFFLINE', True)
+    reference.load_snapshot('projects', fetch, ttl=DAY)
+    assert fetch.calls == 1
+
+
+ISSUANCE = pd.DataFrame(
+    {
+        'arb_id': ['CAFR1', 'CAFR1', 'CAFR2', 'CAFR3'],
+        'opr_id': ['ACR1', 'ACR1', 'CAR2', None],
+        'allocation': [10, 5, 7, 1],
+    }
+)
+
+
+@pytest.fixture
+def issuance(monkeypatch):
+    fetch = CountingFetch(ISSUANCE)
+    monkeypatch.setattr(reference, 'fetch_issuance', fetch)
+    return fetch
+
+
+def test_issuance_lookups(issuance):
+    assert reference.arb_id_to_opr_id() == {'CAFR1': 'ACR1', 'CAFR2': 'CAR2', 'CAFR3': None}
+    assert reference.issuance_totals() == {'CAFR1': 15, 'CAFR2': 7, 'CAFR3': 1}
+    assert issuance.calls == 1
+
+
+def test_lookups_are_memoized_per_content_hash(issuance, monkeypatch):
+    built = []
+    build_lookup = reference._lookup
+    monkeypatch.setattr(
+        reference,
+        '_lookup',
+        lambda name, snapshot, build: build_lookup(
+            name, snapshot, lambda df: built.append(name) or build(df)
+        ),
+    )
+    totals = reference.issuance_totals(ttl=DAY)
+    assert reference.issuance_totals(ttl=DAY) is totals
+
+    # refetched (a zero ttl makes every copy stale), but unchanged: not rebuilt
+    assert reference.issuance_totals(ttl=datetime.timedelta(0)) is totals
+    assert issuance.calls == 2
+    assert built == ['issuance_totals']
+
+    # changed contents get a new lookup
+    issuance.df = ISSUANCE.assign(allocation=[1, 1, 1, 1])
+    assert reference.issuance_totals(ttl=datetime.timedelta(0)) == {
+        'CAFR1': 2,
+        'CAFR2': 1,
+        'CAFR3': 1,
+    }
+    assert built == ['issuance_totals', 'issuance_totals']
+    # each lookup is memoized separately
+    assert reference.arb_id_to_opr_id(ttl=DAY) is reference.arb_id_to_opr_id(ttl=DAY)
+    assert built.count('arb_id_to_opr_id') == 1
+
+
+EA_TABLE = pd.DataFrame(
+    {
+        'Project': ['a', 'b', 'c', 'd'],
+        'County': ['w', 'x', 'y', 'z'],
+        'State': ['CA'] * 4,
+        'Registry': ['ACR', 'CAR', 'CAR', 'ACR'],
+        'Project ID': ['CAR993', 'ACR189', 'CAR993', 'ACR200'],
+    }
+)
+
+
+def old_list_all_ea_opr_ids() -> list:
+    """`utils.list_all_ea_opr_ids` before the table was cached"""
+    data = pd.read_html(reference.EA_PROJECTS_URL)[0]
+    return np.unique(data.T.values[4]).tolist()
+
+
+def test_list_all_ea_opr_ids_is_unchanged(monkeypatch):
+    read_html = CountingFetch(EA_TABLE)
+    monkeypatch.setattr(reference.pd, 'read_html', lambda url: [read_html()])
+    expected = old_list_all_ea_opr_ids()
+    assert utils.list_all_ea_opr_ids() == expected == ['ACR189', 'ACR200', 'CAR993']
+    assert utils.list_all_ea_opr_ids() == expected
+    assert all(type(opr_id) is str for opr_id in utils.list_all_ea_opr_ids())
+    assert reference.ea_opr_ids() == frozenset(expected)
+    # once by the old scraper, once by the cached one
+    assert read_html.calls == 2
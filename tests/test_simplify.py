@@ -0,0 +1,62 @@
+import geopandas
+import numpy as np
+import pytest
+import shapely
+
+from carbonplan_forest_offsets_fires import simplify
+
+
+def wiggly_polygon(x: float, y: float, n: int = 400, seed: int = 0) -> shapely.Polygon:
+    """A lon/lat polygon with `n` vertices, most of them removable noise"""
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    radii = 0.1 * (1 + 0.05 * rng.standard_normal(n))
+    return shapely.Polygon(
+        np.column_stack([x + radii * np.cos(angles), y + radii * np.sin(angles)])
+    )
+
+
+@pytest.fixture
+def raw():
+    multi = shapely.MultiPolygon(
+        [wiggly_polygon(-121, 40, seed=1), wiggly_polygon(-120, 40, seed=2)]
+    )
+    return geopandas.GeoDataFrame(
+        {'opr_id': ['A', 'B', 'A', 'C']},
+        geometry=[wiggly_polygon(-122, 41), multi, wiggly_polygon(-123, 41, seed=3), None],
+        crs='epsg:4326',
+    )
+
+
+def test_simplify_geometries_keeps_rows(raw):
+    simplified = simplify.simplify_geometries(raw, overrides={'B': 5})
+    # the feature without geometry is dropped, the others stay one to one
+    assert simplified['opr_id'].tolist() == ['A', 'B', 'A']
+    assert simplified.crs == 'epsg:5070'
+    assert simplified.geometry.geom_type.tolist() == ['Polygon', 'MultiPolygon', 'Polygon']
+    assert simplified.is_valid.all()
+
+    counts = shapely.get_num_coordinates(simplified.geometry.values)
+    original = shapely.get_num_coordinates(raw.geometry.values[:3])
+    assert (counts < original).all()
+    # vertex budgets are per project: 5% for B, the default 80% for A's features together,
+    # met or slightly exceeded as Douglas-Peucker drops vertices a few at a time
+    a = [0, 2]
+    budgets = [4 + 0.05 * (original[1] - 4), 4 + 0.8 * (original[a].sum() - 4)]
+    assert [counts[1], counts[a].sum()] == pytest.approx(budgets, rel=0.1)
+    assert counts[1] >= budgets[0] and counts[a].sum() >= budgets[1]
+
+
+def test_percentage_tolerances_hit_vertex_budgets():
+    geoms = np.array([wiggly_polygon(0, 0, n=n, seed=n) for n in (50, 400, 2_000)])
+    percentages = np.array([50, 10, 100])
+    tolerances = simplify.percentage_tolerances(geoms, percentages)
+    assert tolerances[2] == 0
+
+    simplified = simplify.simplify_percentage(geoms, percentages)
+    assert simplified[2] is geoms[2]
+    # at least the budget, and close to it
+    target = np.ceil(2 + percentages[:2] / 100 * (shapely.get_num_coordinates(geoms[:2]) - 2))
+    kept = shapely.get_num_coordinates(simplified[:2])
+    assert (kept >= target).all()
+    assert (kept - target <= 3).all()
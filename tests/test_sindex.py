@@ -0,0 +1,97 @@
+import geopandas
+import numpy as np
+import pytest
+import shapely
+
+from carbonplan_forest_offsets_fires import sindex
+
+CRS = 'epsg:5070'
+
+
+def make_projects(n: int, seed: int = 0) -> geopandas.GeoDataFrame:
+    """Irregular polygons of very different sizes, some overlapping"""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(0, 500_000, (n, 2))
+    radii = rng.lognormal(8, 1, n)
+    geoms = [shapely.Point(x, y).buffer(r, 5) for (x, y), r in zip(centers, radii)]
+    return geopandas.GeoDataFrame({'opr_id': [f'P{i}' for i in range(n)]}, geometry=geoms, crs=CRS)
+
+
+def pairs(input_idx, opr_ids) -> set:
+    return set(zip(np.asarray(input_idx).tolist(), np.asarray(opr_ids).tolist()))
+
+
+@pytest.fixture
+def projects():
+    return make_projects(300)
+
+
+@pytest.fixture
+def index(projects, tmp_path):
+    path = str(tmp_path / 'projects.sindex')
+    sindex.write_project_index(projects, path, node_size=8)
+    return sindex.ProjectIndex(path)
+
+
+@pytest.fixture
+def queries():
+    rng = np.random.default_rng(1)
+    boxes = [
+        shapely.box(x, y, x + w, y + w)
+        for x, y, w in zip(
+            rng.uniform(-10_000, 500_000, 200),
+            rng.uniform(-10_000, 500_000, 200),
+            rng.uniform(100, 30_000, 200),
+        )
+    ]
+    return np.array(boxes, dtype=object)
+
+
+def test_load_project_index(index, projects):
+    assert len(index) == len(projects)
+    assert index.to_geodataframe().crs == projects.crs
+    assert sorted(index.opr_ids) == sorted(projects['opr_id'])
+    loaded = index.to_geodataframe().set_index('opr_id')
+    expected = projects.set_index('opr_id').loc[loaded.index]
+    assert loaded.geom_equals_exact(expected, tolerance=0).all()
+
+
+@pytest.mark.parametrize('predicate', [None, 'intersects', 'contains', 'within'])
+def test_query_matches_strtree(index, projects, queries, predicate):
+    tree = shapely.STRtree(projects.geometry.values)
+    expected_idx, expected_pos = tree.query(queries, predicate=predicate)
+    input_idx, positions = index.query(queries, predicate=predicate)
+    assert pairs(input_idx, index.opr_ids[positions]) == pairs(
+        expected_idx, projects['opr_id'].to_numpy()[expected_pos]
+    )
+
+
+def test_query_hulls_matches_strtree(index, projects, queries):
+    tree = shapely.STRtree(projects.convex_hull.values)
+    expected_idx, expected_pos = tree.query(queries, predicate='intersects')
+    input_idx, positions = index.query(queries, hulls=True)
+    assert pairs(input_idx, index.opr_ids[positions]) == pairs(
+        expected_idx, projects['opr_id'].to_numpy()[expected_pos]
+    )
+
+
+@pytest.mark.parametrize('n', [0, 1, 7])
+def test_small_project_index(n, queries, tmp_path):
+    projects = make_projects(n)
+    path = str(tmp_path / 'projects.sindex')
+    sindex.write_project_index(projects, path, node_size=8)
+    index = sindex.ProjectIndex(path)
+    assert len(index) == n
+    tree = shapely.STRtree(projects.geometry.values)
+    expected_idx, expected_pos = tree.query(queries, predicate='intersects')
+    input_idx, positions = index.query(queries)
+    assert pairs(input_idx, index.opr_ids[positions]) == pairs(
+        expected_idx, projects['opr_id'].to_numpy()[expected_pos]
+    )
+
+
+def test_project_index_rejects_other_files(tmp_path):
+    path = tmp_path / 'projects.parquet'
+    path.write_bytes(b'PAR1' * 8)
+    with pytest.raises(ValueError, match='not a project index'):
+        sindex.ProjectIndex(str(path))
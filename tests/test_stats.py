@@ -0,0 +1,197 @@
+import geopandas
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+from carbonplan_forest_offsets_fires import stats
+
+CRS = 'epsg:5070'
+
+
+def make_fires(boxes: dict, names: dict = None) -> geopandas.GeoDataFrame:
+    """Fire perimeters from IRWINID -> (xmin, ymin, xmax, ymax)"""
+    names = names or {}
+    return geopandas.GeoDataFrame(
+        {
+            'poly_IRWINID': list(boxes),
+            'name': [names.get(k, f'{k} Fire') for k in boxes],
+            'start_date': [1_656_633_600_000] * len(boxes),
+        },
+        geometry=[shapely.box(*b) for b in boxes.values()],
+        crs=CRS,
+    )
+
+
+def make_projects(boxes: dict) -> geopandas.GeoDataFrame:
+    return geopandas.GeoDataFrame(
+        {'opr_id': list(boxes)}, geometry=[shapely.box(*b) for b in boxes.values()], crs=CRS
+    )
+
+
+@pytest.fixture
+def projects():
+    # 10km squares, far apart
+    return make_projects({'A': (0, 0, 10_000, 10_000), 'B': (100_000, 0, 110_000, 10_000)})
+
+
+class Loader:
+    """Stands in for `canonical.load_project_geometries`"""
+
+    def __init__(self, projects):
+        self.projects = projects
+
+    def __call__(self, opr_ids):
+        return self.projects[self.projects['opr_id'].isin(opr_ids)]
+
+
+@pytest.mark.parametrize('infer_string', [True, False])
+@pytest.mark.parametrize('dtype', [object, 'category'])
+def test_fingerprint_fires_with_missing_attributes(infer_string, dtype):
+    # without string inference (pandas < 3), astype(str) turns missing values into 'nan'
+    with pd.option_context('future.infer_string', infer_string):
+        fires = make_fires({'f1': (0, 0, 1, 1), 'f2': (0, 0, 2, 2)})
+        fires['name'] = pd.Series([None, 'Named'], dtype=dtype)
+        fires['start_date'] = [np.nan, 1.6e12]
+        fingerprints = stats.fingerprint_fires(fires)
+        assert set(fingerprints) == {'f1', 'f2'}
+
+        # missing attributes hash like empty ones
+        fires['name'] = ['', 'Named']
+        assert stats.fingerprint_fires(fires) == fingerprints
+        fires['start_date'] = ['', '1600000000000.0']
+        assert stats.fingerprint_fires(fires) == fingerprints
+
+        fires['name'] = ['nan', 'Named']
+        assert stats.fingerprint_fires(fires)['f1'] != fingerprints['f1']
+
+
+def test_fingerprint_fires_changes_with_geometry_and_name():
+    fires = make_fires({'f1': (0, 0, 1, 1)})
+    fingerprint = stats.fingerprint_fires(fires)['f1']
+    assert stats.fingerprint_fires(make_fires({'f1': (0, 0, 1, 2)}))['f1'] != fingerprint
+    renamed = make_fires({'f1': (0, 0, 1, 1)}, names={'f1': 'Renamed'})
+    assert stats.fingerprint_fires(renamed)['f1'] != fingerprint
+
+
+def test_fingerprint_fires_folds_duplicate_ids():
+    fires = make_fires({'f1': (0, 0, 1, 1), 'f2': (0, 0, 2, 2)})
+    fires['poly_IRWINID'] = ['f1', 'f1']
+    swapped = fires.iloc[::-1]
+    assert stats.fingerprint_fires(fires) == stats.fingerprint_fires(swapped)
+    assert len(stats.fingerprint_fires(fires)) == 1
+
+
+def test_diff_fire_fingerprints():
+    diff = stats.diff_fire_fingerprints(
+        {'a': '1', 'b': '2', 'c': '3'}, {'b': '2', 'c': 'x', 'd': '4'}
+    )
+    assert diff == {'added': ['d'], 'removed': ['a'], 'changed': ['c']}
+
+
+def test_update_project_state_from_empty(projects):
+    fires = make_fires({'f1': (0, 0, 10_000, 5_000)})
+    state = stats.update_project_state(
+        stats.empty_project_state(), {'A': ['f1']}, fires, load_geometries=Loader(projects)
+    )
+    result = state['projects']['A']['result']
+    assert result['opr_id'] == 'A'
+    assert result['burned_fraction'] == 0.5
+    assert list(result['fires']) == ['f1']
+    assert set(state['fires']) == {'f1'}
+
+
+def test_update_project_state_carries_unchanged_projects_forward(projects):
+    loader = Loader(projects)
+    fires = make_fires({'f1': (0, 0, 10_000, 5_000), 'f2': (100_000, 0, 110_000, 2_000)})
+    candidates = {'A': ['f1'], 'B': ['f2']}
+    state = stats.update_project_state(
+        stats.empty_project_state(), candidates, fires, load_geometries=loader
+    )
+    # poison the stored result, so carrying it forward is observable
+    state['projects']['B']['result'] = {'opr_id': 'B', 'carried': True}
+
+    # only f1 grew
+    fires = make_fires({'f1': (0, 0, 10_000, 8_000), 'f2': (100_000, 0, 110_000, 2_000)})
+    updated = stats.update_project_state(state, candidates, fires, load_geometries=loader)
+    assert updated['projects']['A']['result']['burned_fraction'] == 0.8
+    assert updated['projects']['B']['result'] == {'opr_id': 'B', 'carried': True}
+
+
+def test_update_project_state_recomputes_on_changed_geometry(projects):
+    fires = make_fires({'f1': (0, 0, 10_000, 5_000)})
+    state = stats.update_project_state(
+        stats.empty_project_state(), {'A': ['f1']}, fires, load_geometries=Loader(projects)
+    )
+    state['projects']['A']['result'] = None
+
+    # a hole outside the fire leaves the hull, candidates and burned area unchanged
+    reshaped = make_projects({'A': (0, 0, 10_000, 10_000)})
+    reshaped['geometry'] = reshaped.difference(shapely.box(6_000, 6_000, 8_000, 8_000))
+    assert reshaped.convex_hull.iloc[0].equals(projects.convex_hull.iloc[0])
+    updated = stats.update_project_state(
+        state, {'A': ['f1']}, fires, load_geometries=Loader(reshaped)
+    )
+    assert updated['projects']['A']['result']['burned_fraction'] == round(50 / 96, 3)
+
+
+def test_update_project_state_recomputes_on_changed_candidates(projects):
+    fires = make_fires({'f1': (0, 0, 10_000, 5_000), 'f2': (0, 5_000, 10_000, 6_000)})
+    state = stats.update_project_state(
+        stats.empty_project_state(), {'A': ['f1']}, fires, load_geometries=Loader(projects)
+    )
+    updated = stats.update_project_state(
+        state, {'A': ['f1', 'f2']}, fires, load_geometries=Loader(projects)
+    )
+    assert updated['projects']['A']['result']['burned_fraction'] == 0.6
+    assert sorted(updated['projects']['A']['result']['fires']) == ['f1', 'f2']
+
+
+def test_update_project_state_drops_projects_no_longer_near_fires(projects):
+    fires = make_fires({'f1': (0, 0, 10_000, 5_000)})
+    state = stats.update_project_state(
+        stats.empty_project_state(), {'A': ['f1']}, fires, load_geometries=Loader(projects)
+    )
+    updated = stats.update_project_state(
+        state, {}, fires.iloc[:0], load_geometries=Loader(projects)
+    )
+    assert updated['projects'] == {}
+    assert updated['fires'] == {}
+
+
+def test_update_project_state_discards_state_with_other_settings(projects):
+    fires = make_fires({'f1': (0, 0, 10_000, 5_000)})
+    state = stats.update_project_state(
+        stats.empty_project_state(), {'A': ['f1']}, fires, load_geometries=Loader(projects)
+    )
+    state['projects']['A']['result'] = None
+    state['settings'] = {'version': stats.STATE_VERSION - 1}
+    updated = stats.update_project_state(
+        state, {'A': ['f1']}, fires, load_geometries=Loader(projects)
+    )
+    assert updated['projects']['A']['result']['burned_fraction'] == 0.5
+    assert updated['settings'] == stats.state_settings()
+
+
+@pytest.mark.parametrize('stages', [(), ('hull',)])
+def test_cascade_pairs_matches_intersects_query(stages):
+    rng = np.random.default_rng(0)
+    geoms = np.array(
+        [shapely.Point(x, y).buffer(r) for x, y, r in rng.uniform(0, 10_000, (40, 3)) / [1, 1, 5]]
+    )
+    fires = np.array(
+        [shapely.Point(x, y).buffer(r) for x, y, r in rng.uniform(0, 10_000, (60, 3)) / [1, 1, 3]]
+    )
+    geom_idx, fire_idx, contained, report = stats.cascade_pairs(geoms, fires, stages=stages)
+    expected_geom, expected_fire = shapely.STRtree(fires).query(geoms, predicate='intersects')
+    assert list(zip(geom_idx, fire_idx)) == sorted(zip(expected_geom, expected_fire))
+    assert shapely.contains(fires[fire_idx[contained]], geoms[geom_idx[contained]]).all()
+    assert [row['stage'] for row in report] == ['bbox', *stages, 'exact']
+    # the caller's geometries are left unprepared
+    assert not shapely.is_prepared(geoms).any()
+    assert not shapely.is_prepared(fires).any()
+
+
+def test_cascade_pairs_rejects_unknown_stages():
+    with pytest.raises(ValueError, match='simplified'):
+        stats.cascade_pairs(np.array([]), np.array([]), stages=('hull', 'simplified'))
@@ -0,0 +1,142 @@
+import json
+import sqlite3
+from pathlib import Path
+
+import fsspec
+import pytest
+
+from carbonplan_forest_offsets_fires import tiles
+
+
+def write_tiles(root: Path, contents: dict):
+    for rel, data in contents.items():
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+
+def published(rpath: Path) -> dict:
+    """Tiles of the version `latest.json` points to, as the web map resolves them"""
+    pointer = json.loads((rpath / tiles.POINTER).read_text())
+    template = pointer['tiles']
+    assert template == f'{pointer["version"]}/{{z}}/{{x}}/{{y}}.pbf'
+    root = rpath / pointer['version']
+    return {p.relative_to(root).as_posix(): p.read_bytes() for p in root.rglob('*.pbf')}
+
+
+def versions(rpath: Path) -> list:
+    return sorted(p.name for p in rpath.iterdir() if tiles.VERSION_PATTERN.match(p.name))
+
+
+@pytest.fixture
+def fs():
+    return fsspec.filesystem('file', auto_mkdir=True)
+
+
+def test_publish_tiles_versions_and_flips_pointer(fs, tmp_path):
+    rpath = tmp_path / 'remote' / 'fires'
+    first = {'0/0/0.pbf': b'a', '1/0/0.pbf': b'b', '1/1/0.pbf': b'c'}
+    write_tiles(tmp_path / 'v1', first)
+    published_first = tiles.publish_tiles(str(tmp_path / 'v1'), str(rpath), fs=fs)
+    assert published_first['changed'] == 3
+    assert published(rpath) == first
+
+    second = {'0/0/0.pbf': b'a', '1/0/0.pbf': b'B', '1/0/1.pbf': b'd'}
+    write_tiles(tmp_path / 'v2', second)
+    uploaded, copied = [], []
+    put, copy = fs.put, fs.copy
+    fs.put = lambda lpaths, rpaths: uploaded.extend(rpaths) or put(lpaths, rpaths)
+    fs.copy = lambda src, dst: copied.extend(dst) or copy(src, dst)
+    published_second = tiles.publish_tiles(str(tmp_path / 'v2'), str(rpath), fs=fs)
+    version = published_second.pop('version')
+    assert published_second == {'changed': 2, 'unchanged': 1, 'removed': 1}
+    # only changed tiles are uploaded, unchanged ones are copied from the previous version
+    assert sorted(uploaded) == [f'{rpath}/{version}/1/0/0.pbf', f'{rpath}/{version}/1/0/1.pbf']
+    assert copied == [f'{rpath}/{version}/0/0/0.pbf']
+    assert published(rpath) == second
+    assert tiles.read_manifest(str(rpath), version, fs=fs) == tiles.hash_tile_dir(
+        str(tmp_path / 'v2')
+    )
+    # the previous version stays readable, for maps that resolved the pointer before
+    assert versions(rpath) == [published_first['version'], version]
+
+    tiles.publish_tiles(str(tmp_path / 'v2'), str(rpath), fs=fs)
+    assert len(versions(rpath)) == 2 and published_first['version'] not in versions(rpath)
+
+
+def test_failed_publish_leaves_pointer(fs, tmp_path):
+    rpath = tmp_path / 'remote'
+
+    def upload(data):
+        return lambda rels, dst: fs.pipe({f'{dst}/{rel}': data for rel in rels})
+
+    first = tiles.publish({'0/0/0.pbf': 'a'}, str(rpath), upload(b'a'), fs=fs)
+
+    def fail(rels, dst):
+        fs.pipe(f'{dst}/{rels[0]}', b'b')
+        raise OSError('connection reset')
+
+    with pytest.raises(OSError):
+        tiles.publish({'0/0/0.pbf': 'b', '0/0/1.pbf': 'c'}, str(rpath), fail, fs=fs)
+    # readers still get the complete first version
+    assert published(rpath) == {'0/0/0.pbf': b'a'}
+    assert tiles.read_pointer(str(rpath), fs=fs) == first['version']
+
+    # the next publish starts from the first version, and removes the failed one
+    third = tiles.publish({'0/0/0.pbf': 'b'}, str(rpath), upload(b'b'), fs=fs)
+    assert third['changed'] == 1
+    assert versions(rpath) == [first['version'], third['version']]
+    assert published(rpath) == {'0/0/0.pbf': b'b'}
+
+
+@pytest.fixture
+def mbtiles(tmp_path) -> str:
+    """A tiny mbtiles file, with rows in TMS order like tippecanoe writes"""
+    path = str(tmp_path / 'fires.mbtiles')
+    con = sqlite3.connect(path)
+    con.execute('CREATE TABLE metadata (name text, value text)')
+    con.execute(
+        'CREATE TABLE tiles (zoom_level integer, tile_column integer, tile_row integer, '
+        'tile_data blob)'
+    )
+    con.executemany('INSERT INTO metadata VALUES (?, ?)', [('name', 'fires'), ('format', 'pbf')])
+    con.executemany(
+        'INSERT INTO tiles VALUES (?, ?, ?, ?)',
+        [(0, 0, 0, b'world'), (2, 1, 0, b'south'), (2, 1, 3, b'north'), (3, 5, 2, b'z3')],
+    )
+    con.commit()
+    con.close()
+    return path
+
+
+def test_iter_mbtiles_flips_rows_to_xyz(mbtiles):
+    batches = list(tiles.iter_mbtiles(mbtiles, batch_size=3))
+    assert [len(batch) for batch in batches] == [3, 1]
+    assert dict(tile for batch in batches for tile in batch) == {
+        '0/0/0.pbf': b'world',
+        # TMS row 0 is the southernmost, XYZ row 0 the northernmost
+        '2/1/3.pbf': b'south',
+        '2/1/0.pbf': b'north',
+        '3/5/5.pbf': b'z3',
+    }
+
+
+def test_extract_mbtiles_writes_metadata(mbtiles, tmp_path):
+    out_dir = tmp_path / 'processed'
+    assert tiles.extract_mbtiles(mbtiles, str(out_dir)) == 4
+    assert (out_dir / '2' / '1' / '3.pbf').read_bytes() == b'south'
+    metadata = json.loads((out_dir / tiles.METADATA).read_text())
+    assert metadata == {'name': 'fires', 'format': 'pbf'}
+
+
+def test_publish_mbtiles(fs, mbtiles, tmp_path):
+    rpath = tmp_path / 'remote'
+    counts = tiles.publish_mbtiles(mbtiles, str(rpath), fs=fs, batch_size=3)
+    version = counts.pop('version')
+    assert counts == {'changed': 4, 'unchanged': 0, 'removed': 0}
+    assert published(rpath) == dict(tile for batch in tiles.iter_mbtiles(mbtiles) for tile in batch)
+    assert json.loads((rpath / version / tiles.METADATA).read_text())['name'] == 'fires'
+
+    counts = tiles.publish_mbtiles(mbtiles, str(rpath), fs=fs)
+    assert (counts['changed'], counts['unchanged']) == (0, 4)
+    assert (rpath / counts['version'] / tiles.METADATA).exists()
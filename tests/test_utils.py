@@ -0,0 +1,71 @@
+import json
+
+import pytest
+import shapely
+
+from carbonplan_forest_offsets_fires import utils
+from carbonplan_forest_offsets_fires.cache import GeometryCache, LocalGeometryCache
+
+
+class FakeS3:
+    """The few s3fs calls geometry loading makes, against in-memory GeoJSON"""
+
+    def __init__(self, opr_ids: list):
+        self.files = {
+            f'{utils.SIMPLIFIED_GEOM_PATH}/{opr_id}.json': json.dumps(
+                {
+                    'type': 'FeatureCollection',
+                    'features': [
+                        {
+                            'type': 'Feature',
+                            'properties': {'name': opr_id},
+                            'geometry': shapely.geometry.mapping(
+                                shapely.box(-120 + i, 40, -119.9 + i, 40.1)
+                            ),
+                        }
+                    ],
+                }
+            )
+            for i, opr_id in enumerate(opr_ids)
+        }
+        self.calls = []
+
+    def ls(self, path, detail=False):
+        self.calls.append('ls')
+        return [{'name': name, 'ETag': 'etag'} for name in self.files]
+
+    def info(self, path):
+        self.calls.append('info')
+        return {'name': path, 'ETag': 'etag'}
+
+    def cat(self, paths):
+        self.calls.append('cat')
+        return {path: self.files[path] for path in paths}
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    fs = FakeS3(['ACR1', 'ACR2'])
+    monkeypatch.setattr(utils.fsspec, 'filesystem', lambda *args, **kwargs: fs)
+    return fs
+
+
+def test_load_project_geometries_without_cache_skips_etags(s3):
+    gdf = utils.load_project_geometries(['ACR1', 'ACR2'], cache=GeometryCache())
+    assert s3.calls == ['cat']
+    assert gdf.columns[0] == 'opr_id'
+    assert gdf['opr_id'].tolist() == ['ACR1', 'ACR2']
+    assert gdf.crs == 'epsg:5070'
+
+
+def test_load_project_geometries_from_local_cache(s3, tmp_path):
+    cache = LocalGeometryCache(cache_dir=str(tmp_path))
+    first = utils.load_project_geometries(['ACR1', 'ACR2'], cache=cache)
+    assert s3.calls == ['ls', 'cat']
+    assert cache.stats['misses'] == 2
+
+    s3.calls.clear()
+    second = utils.load_project_geometries(['ACR1', 'ACR2'], cache=cache)
+    assert s3.calls == ['ls']
+    assert cache.stats['hits'] == 2
+    assert second.geom_equals(first).all()